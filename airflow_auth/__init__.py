@@ -0,0 +1,5 @@
+"""Azure AD OAuth login for the Airflow FAB auth manager, used by webserver_config.py.
+
+Modules import only what they need: the role mapping, claim replay and settings
+modules work without the Airflow webserver, the security manager needs FAB.
+"""
@@ -0,0 +1,70 @@
+"""FAB auth manager that warms API server workers up at start and reads the permission cache.
+
+Set ``AIRFLOW__CORE__AUTH_MANAGER=airflow_auth.auth_manager.AzureFabAuthManager``.
+"""
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+
+from airflow.providers.fab.auth_manager.fab_auth_manager import FabAuthManager
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.routing import Mount
+
+from .permissions import permission_cache
+from .settings import AUTH_WARM_UP_ON_START
+from .telemetry import logger
+
+
+def _warm_up_on_start(flask_app, lifespan):
+    """Wrap a lifespan so the worker runs the security manager's warm-up before it serves requests."""
+    @asynccontextmanager
+    async def warm_up_lifespan(app):
+        with flask_app.app_context():
+            flask_app.appbuilder.sm._warm_up_once()
+        async with lifespan(app):
+            yield
+    
+    return warm_up_lifespan
+
+
+class AzureFabAuthManager(FabAuthManager):
+    """FabAuthManager that answers ``is_authorized_*`` from :data:`permission_cache`.
+    
+    Every check of the stock manager goes through ``_get_user_permissions``,
+    which reads ``User.perms`` (a four-table join per loaded User, re-run while
+    the result is empty). Here a user's set is the cached union of their roles'
+    permissions; an empty set is a valid answer and is not re-queried. The
+    anonymous user and a disabled cache (``PERMISSION_CACHE_TTL=0``) keep
+    FAB's lookup.
+    
+    The Flask app FAB mounts under ``/auth`` is built in every API server
+    worker; its lifespan (entered by the API server's lifespan as the worker
+    starts) runs ``CustomSecurityManager.warm_up``, so no request waits for it.
+    CLI commands build the security manager without this app and never warm up.
+    """
+    
+    def get_fastapi_app(self):
+        app = super().get_fastapi_app()
+        if app is None or not AUTH_WARM_UP_ON_START:
+            return app
+        for route in app.routes:
+            if isinstance(route, Mount) and isinstance(route.app, WSGIMiddleware):
+                app.router.lifespan_context = _warm_up_on_start(route.app.app, app.router.lifespan_context)
+                break
+        else:
+            logger.warning("⚠️ [WARMUP] No Flask app mounted by FabAuthManager; logins load mappings and roles lazily")
+        return app
+    
+    @staticmethod
+    def _get_user_permissions(user):
+        # If the user gets deleted while being logged in
+        if not user:
+            return []
+        if permission_cache.enabled and not user.is_anonymous:
+            return permission_cache.for_user(user)
+        return FabAuthManager._get_user_permissions(user)
+
+
+if not callable(getattr(FabAuthManager, '_get_user_permissions', None)):
+    logger.warning("⚠️ [PERMISSIONS] This FAB provider has no FabAuthManager._get_user_permissions; "
+                   "authorization checks query User.perms without the permission cache")
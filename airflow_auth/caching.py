@@ -0,0 +1,150 @@
+"""In-process caches shared by the login path: request coalescing and a TTL/LRU cache."""
+from __future__ import annotations
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple, Optional
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key within this worker.
+    
+    The first caller for a key runs the work; concurrent callers for the same
+    key wait for it and share its result (or exception).
+    """
+    
+    class _Call:
+        __slots__ = ('done', 'result', 'error')
+        
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: Optional[BaseException] = None
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, "SingleFlight._Call"] = {}
+    
+    def do(self, key: Any, fn):
+        """Run fn() once for key across concurrent callers and return its (shared) result."""
+        with self._lock:
+            call = self._calls.get(key)
+            owner = call is None
+            if owner:
+                call = self._calls[key] = SingleFlight._Call()
+        
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+    
+    def do_many(self, keys: Iterable[Any], fn):
+        """Run fn(claimed_keys) for the keys no other thread is working on.
+        
+        Keys already in flight elsewhere are waited for instead of being redone.
+        Returns fn's result (None if every key was already in flight).
+        """
+        claimed: List[Any] = []
+        waiting: List["SingleFlight._Call"] = []
+        own_call = SingleFlight._Call()
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    self._calls[key] = own_call
+                    claimed.append(key)
+                else:
+                    waiting.append(call)
+        
+        try:
+            if claimed:
+                own_call.result = fn(claimed)
+        except BaseException as e:
+            own_call.error = e
+            raise
+        finally:
+            with self._lock:
+                for key in claimed:
+                    del self._calls[key]
+            own_call.done.set()
+        
+        for call in dict.fromkeys(waiting):
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+        return own_call.result
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+    
+    def discard_if(self, predicate) -> int:
+        """Drop every entry whose value matches ``predicate`` and return how many were dropped."""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
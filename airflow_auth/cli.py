@@ -0,0 +1,146 @@
+"""Maintenance commands for role mappings and role permissions (run through auth_cli.py)."""
+from __future__ import annotations
+
+import argparse
+import os
+import json
+import time
+from typing import List, Optional
+
+from .mapping import _get_file_path
+from .mapping_loader import load_compiled_role_mappings
+from .mapping_store import convert_role_mapping_json
+from .replay import replay_claims
+from .settings import ROLE_MAPPING_FILE, ROLE_MAPPING_METHOD, ROLE_PERMISSIONS_FILE
+
+
+def _cli_path(path: Optional[str], default: str) -> str:
+    """A path given on the command line is relative to the cwd; the default setting, to the config directory."""
+    if path is None:
+        return str(_get_file_path(default))
+    return os.path.abspath(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Maintenance commands. create-tables, provision-roles and reconcile-roles need
+    Airflow and its metadata DB, so run them where the webserver's environment is
+    available; convert-mapping and replay-claims only read and write files, e.g.
+    
+        docker compose exec airflow-webserver python /opt/airflow/auth_cli.py create-tables
+        docker compose exec airflow-webserver python /opt/airflow/auth_cli.py convert-mapping \
+            /opt/airflow/role_mapping.json /opt/airflow/role_mapping.db
+        docker compose exec airflow-webserver python /opt/airflow/auth_cli.py provision-roles --dry-run
+        docker compose exec airflow-webserver python /opt/airflow/auth_cli.py reconcile-roles --dry-run
+        python auth_cli.py replay-claims claims.jsonl role_mapping.new.json --changes changes.jsonl
+    """
+    parser = argparse.ArgumentParser(description="Role mapping and role permission maintenance for the Azure OAuth login")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create-tables", help="create the tables the login adds to the metadata DB (once, before the API servers start)")
+    convert = commands.add_parser("convert-mapping", help="create or incrementally update a SQLite mapping store from role_mapping.json")
+    convert.add_argument("json_file")
+    convert.add_argument("store_file")
+    convert.add_argument("--keep-changes", type=int, default=100000, help="change-log entries to keep")
+    provision = commands.add_parser("provision-roles", help="create roles and grant the permissions declared in role_permissions.json")
+    provision.add_argument("spec_file", nargs="?", help="role permissions spec (default: ROLE_PERMISSIONS_FILE)")
+    provision.add_argument("--role", action="append", help="only provision this role (repeatable)")
+    provision.add_argument("--dag", action="append", default=[], help="DAG id added to the single --role in the spec file and granted (repeatable)")
+    provision.add_argument("--prune", action="store_true", help="revoke permissions the spec doesn't declare for the provisioned roles")
+    provision.add_argument("--dry-run", action="store_true", help="print the changes without writing them")
+    reconcile = commands.add_parser("reconcile-roles", help="re-apply the role mapping to every user's last-seen claims")
+    reconcile.add_argument("--dry-run", action="store_true", help="count the changes without writing them")
+    replay = commands.add_parser("replay-claims", help="report whose roles a new mapping would change, from captured claims")
+    replay.add_argument("claims_file", help="JSONL of captured OAuth responses or claim objects")
+    replay.add_argument("new_mapping")
+    replay.add_argument("--old-mapping", help="mapping to compare with (default: ROLE_MAPPING_FILE)")
+    replay.add_argument("--method", action="append", choices=["role", "group"], help="mapping mode (repeatable, default: ROLE_MAPPING_METHOD)")
+    replay.add_argument("--workers", type=int, default=None, help="processes (default: one per core)")
+    replay.add_argument("--chunk-size", type=int, default=2000, help="lines per task")
+    replay.add_argument("--changes", help="write one JSON line per user whose roles change")
+    replay.add_argument("--report", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+    
+    if args.command == "create-tables":
+        from airflow.providers.fab.auth_manager.cli_commands.utils import get_application_builder
+        
+        from .db import create_auth_tables
+        
+        with get_application_builder() as appbuilder:
+            created = create_auth_tables(appbuilder.sm.get_session.get_bind())
+        for name, was_created in created.items():
+            print(f"{name}: {'created' if was_created else 'exists'}")
+    
+    elif args.command == "convert-mapping":
+        started = time.perf_counter()
+        counts = convert_role_mapping_json(os.path.abspath(args.json_file), os.path.abspath(args.store_file), args.keep_changes)
+        print(f"{args.json_file} -> {args.store_file}: "
+              + ", ".join(f"{name}={count}" for name, count in counts.items())
+              + f" ({(time.perf_counter() - started) * 1000:.0f}ms)")
+    
+    elif args.command == "provision-roles":
+        from airflow.providers.fab.auth_manager.cli_commands.utils import get_application_builder
+        
+        from .provisioning import expand_role_permissions, provision_role_permissions, write_role_permissions
+        
+        args.spec_file = _cli_path(args.spec_file, ROLE_PERMISSIONS_FILE)
+        started = time.perf_counter()
+        with open(args.spec_file, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        if args.dag:
+            if not args.role or len(args.role) != 1:
+                parser.error("--dag needs exactly one --role")
+            role_spec = spec.setdefault('roles', {}).setdefault(args.role[0], {})
+            dags = list(dict.fromkeys(role_spec.get('dags', []) + args.dag))
+            added_dags = dags[len(role_spec.get('dags', [])):]
+            role_spec['dags'] = dags
+        desired = expand_role_permissions(spec)
+        if args.role:
+            unknown = [name for name in args.role if name not in desired]
+            if unknown:
+                parser.error(f"roles not in {args.spec_file}: {', '.join(unknown)}")
+            desired = {name: desired[name] for name in args.role}
+        load_seconds = time.perf_counter() - started
+        
+        # Declare --dag grants in the spec before applying them, so a later --prune run keeps them
+        if args.dag and added_dags and not args.dry_run:
+            write_role_permissions(spec, args.spec_file)
+            print(f"Added DAGs {', '.join(added_dags)} to {args.role[0]} in {args.spec_file}")
+        with get_application_builder() as appbuilder:
+            plan = provision_role_permissions(appbuilder.sm, desired, args.prune, args.dry_run)
+        plan.timings = {'load': load_seconds, **plan.timings}
+        for line in plan.describe():
+            print(line)
+        print(f"{'Would apply' if args.dry_run else 'Applied'} to {len(desired)} roles: {plan.summary()}")
+    
+    elif args.command == "reconcile-roles":
+        from airflow.providers.fab.auth_manager.cli_commands.utils import get_application_builder
+        
+        from .reconcile import role_reconciler
+        
+        with get_application_builder() as appbuilder:
+            if not role_reconciler.bind(appbuilder.sm).bound:
+                parser.error("ab_user_claims does not exist: run create-tables first")
+            result = role_reconciler.reconcile(load_compiled_role_mappings(), dry_run=args.dry_run)
+        print(f"{'Would update' if args.dry_run else 'Updated'} {result['users_changed']} of {result['scanned']} users: "
+              f"+{result['added']}/-{result['removed']} roles ({result['duration_ms']:.0f}ms)")
+    
+    elif args.command == "replay-claims":
+        args.old_mapping = _cli_path(args.old_mapping, ROLE_MAPPING_FILE)
+        try:
+            report = replay_claims(args.claims_file, args.old_mapping, args.new_mapping, args.method or [ROLE_MAPPING_METHOD],
+                                   args.workers, args.chunk_size, args.changes)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        print(f"{args.old_mapping} -> {args.new_mapping}: {report['invalid_lines']} invalid lines, "
+              f"{report['workers']} workers, {report['duration_s']:.1f}s")
+        for method, counts in report['methods'].items():
+            print(f"[{method}] {counts['changed']} of {counts['records']} users change roles"
+                  f" (default role {counts['default_role']['before']} -> {counts['default_role']['after']},"
+                  f" {counts['overage']} groups overage tokens resolved without Graph)")
+            moved = {role: c for role, c in counts['roles'].items() if c['gained'] or c['lost']}
+            if moved:
+                print(f"  {'role':<32} {'before':>9} {'after':>9} {'gained':>8} {'lost':>8}")
+            for role, c in sorted(moved.items(), key=lambda item: -(item[1]['gained'] + item[1]['lost'])):
+                print(f"  {role:<32} {c['before']:>9} {c['after']:>9} {c['gained']:>8} {c['lost']:>8}")
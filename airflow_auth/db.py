@@ -0,0 +1,68 @@
+"""Small metadata-DB helpers shared by role creation, provisioning and reconciliation."""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List
+
+import sqlalchemy
+
+
+_SQLITE_MAX_VARIABLES = 500
+
+def _insert_ignore_statement(table, dialect_name: str, *conflict_columns: str):
+    """Build a dialect-specific INSERT that skips rows violating a unique constraint.
+    
+    Returns None for dialects without a native form.
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing(index_elements=list(conflict_columns))
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing(index_elements=list(conflict_columns))
+    if dialect_name in ("mysql", "mariadb"):
+        return table.insert().prefix_with("IGNORE")
+    return None
+
+def _ensure_table(engine, table) -> bool:
+    """Create a table of this package if missing; True if this call created it (a lost race is fine)."""
+    if sqlalchemy.inspect(engine).has_table(table.name):
+        return False
+    try:
+        table.create(engine)
+    except sqlalchemy.exc.DatabaseError:
+        if not sqlalchemy.inspect(engine).has_table(table.name):
+            raise
+        return False
+    return True
+
+def create_auth_tables(engine) -> Dict[str, bool]:
+    """Create the tables this package adds to the metadata DB (``auth_cli.py create-tables``).
+    
+    They are not part of Airflow's migrations, so this runs once per metadata DB
+    (airflow-init, or by hand) before the API servers start; workers and logins
+    never create them.
+    
+    Returns:
+        table name -> True if it was created, False if it already existed
+    """
+    from .permissions import _permission_generation_table
+    from .reconcile import _user_claims_table
+    
+    return {table.name: _ensure_table(engine, table) for table in (_user_claims_table, _permission_generation_table)}
+
+def _chunks(items: List[Any], size: int = _SQLITE_MAX_VARIABLES) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _ensure_named_rows(session, table, names: List[str], dialect_name: str) -> Dict[str, int]:
+    """Return name -> id for ``names``, inserting the missing ones (idempotently) first."""
+    ids: Dict[str, int] = {}
+    for chunk in _chunks(names):
+        ids.update(session.execute(sqlalchemy.select(table.c.name, table.c.id).where(table.c.name.in_(chunk))).all())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        statement = _insert_ignore_statement(table, dialect_name, 'name')
+        session.execute(statement if statement is not None else table.insert(), [{'name': name} for name in missing])
+        for chunk in _chunks(missing):
+            ids.update(session.execute(sqlalchemy.select(table.c.name, table.c.id).where(table.c.name.in_(chunk))).all())
+    return ids
@@ -0,0 +1,139 @@
+"""Microsoft Graph group lookups for tokens with a groups overage."""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Mapping, Tuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .caching import SingleFlight, TTLCache
+from .mapping import RoleIndex
+from .settings import (
+    GRAPH_API_URL, GRAPH_CACHE_SIZE, GRAPH_CACHE_TTL, GRAPH_CHECK_MAX_GROUPS, GRAPH_MAX_WORKERS,
+    GRAPH_POOL_SIZE, GRAPH_TIMEOUT,
+)
+from .telemetry import auth_metrics
+
+
+class GraphGroupResolver:
+    """Fetch a user's group memberships from Microsoft Graph on a groups overage.
+    
+    Azure omits ``groups`` from the id_token when a user is in more than ~200
+    groups and adds ``_claim_names``/``_claim_sources`` instead. The user's own
+    access token (scope ``User.read``) is used against ``/me``:
+    
+      - ``mapped``: ``checkMemberGroups`` for the exact group_mapping keys only,
+        in batches of 20 sent concurrently
+      - ``all`` (or mapping has wildcards / too many keys): one ``getMemberGroups``
+        call returning every transitive membership
+    
+    Results are cached per OID (and mapping version in ``mapped`` mode), and
+    concurrent logins of the same user share a single Graph round trip.
+    """
+    
+    CHECK_BATCH_SIZE = 20  # Graph limit for checkMemberGroups
+    
+    def __init__(self, base_url: str = GRAPH_API_URL, timeout: float = GRAPH_TIMEOUT,
+                 max_workers: int = GRAPH_MAX_WORKERS, pool_size: int = GRAPH_POOL_SIZE,
+                 cache: Optional[TTLCache] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.pool_size = pool_size
+        self.cache = cache if cache is not None else TTLCache(GRAPH_CACHE_SIZE, GRAPH_CACHE_TTL)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._session: Optional[requests.Session] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @staticmethod
+    def has_overage(claims: Mapping[str, Any]) -> bool:
+        """True if the token signals that its groups claim was left out."""
+        return 'groups' not in claims and (
+            'groups' in (claims.get('_claim_names') or {}) or bool(claims.get('hasgroups'))
+        )
+    
+    def _pool(self) -> Tuple[requests.Session, ThreadPoolExecutor]:
+        """Pooled HTTP session and request executor, created lazily in each (forked) worker."""
+        with self._lock:
+            if self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="graph-groups")
+                self._pid = os.getpid()
+            return self._session, self._executor
+    
+    def _post(self, access_token: str, path: str, body: Mapping[str, Any]) -> List[str]:
+        session, _ = self._pool()
+        auth_metrics.incr('graph.request')
+        response = session.post(
+            f"{self.base_url}{path}",
+            json=body,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json().get('value', [])
+    
+    def _check_member_groups(self, access_token: str, group_ids: List[str]) -> List[str]:
+        _, executor = self._pool()
+        batches = [group_ids[i:i + self.CHECK_BATCH_SIZE] for i in range(0, len(group_ids), self.CHECK_BATCH_SIZE)]
+        results = executor.map(
+            lambda batch: self._post(access_token, "/me/checkMemberGroups", {"groupIds": batch}), batches
+        )
+        return [group_id for batch in results for group_id in batch]
+    
+    def _get_member_groups(self, access_token: str) -> List[str]:
+        return self._post(access_token, "/me/getMemberGroups", {"securityEnabledOnly": False})
+    
+    @staticmethod
+    def checks_candidates(candidates: Optional[RoleIndex]) -> bool:
+        """True if a lookup with these candidates only asks about them (checkMemberGroups), not every group."""
+        return (
+            candidates is not None
+            and not candidates.prefixes and not candidates.patterns
+            and 0 < len(candidates.keys) <= GRAPH_CHECK_MAX_GROUPS
+        )
+    
+    def submit(self, fn):
+        """Run fn on this worker's Graph pool, off the login path."""
+        _, executor = self._pool()
+        return executor.submit(fn)
+    
+    def member_groups(self, oid: str, access_token: str, candidates: Optional[RoleIndex] = None,
+                      version: Any = None) -> Tuple[str, ...]:
+        """Return the user's group ids, from cache or Graph.
+        
+        Args:
+            oid: Azure object id of the user (cache key)
+            access_token: the user's Graph access token
+            candidates: group_mapping index to restrict the lookup to, or None for all groups
+            version: mapping version, part of the cache key when candidates are given
+        """
+        check = self.checks_candidates(candidates)
+        key = (oid, version) if check else (oid, None)
+        groups = self.cache.get(key)
+        if groups is not None:
+            auth_metrics.incr('graph.cache_hit')
+            return groups
+        auth_metrics.incr('graph.cache_miss')
+        
+        def fetch() -> Tuple[str, ...]:
+            if check:
+                fetched = self._check_member_groups(access_token, sorted(candidates.keys))
+            else:
+                fetched = self._get_member_groups(access_token)
+            result = tuple(dict.fromkeys(fetched))
+            self.cache.set(key, result)
+            return result
+        
+        return self._flight.do(key, fetch)
+
+graph_groups = GraphGroupResolver()
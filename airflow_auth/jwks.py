@@ -0,0 +1,198 @@
+"""Local id_token verification against a cached, shared Azure JWKS."""
+from __future__ import annotations
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple, Optional
+
+import jwt
+import requests
+
+from .caching import SingleFlight
+from .settings import (
+    AZURE_CLIENT_ID, AZURE_ISSUER, AZURE_JWKS_URI, JWKS_CACHE_FILE, JWKS_MIN_REFETCH_INTERVAL,
+    JWKS_REFRESH_INTERVAL, JWKS_TIMEOUT,
+)
+from .telemetry import auth_metrics, logger
+
+
+class JwksCache:
+    """Signing keys of the tenant, kept in memory and in a file shared by all workers.
+    
+    - ``prefetch()`` at warm-up adopts the file cache, fetching only if it is missing or stale
+    - a daemon thread refreshes every ``refresh_interval`` (again preferring a fresh file
+      written by another worker over the network)
+    - an unknown ``kid`` (key rotation) triggers one single-flight refetch, at most every
+      ``min_refetch_interval`` seconds, so forged kids can't hammer the endpoint
+    
+    A failed fetch keeps the last-known-good keys.
+    """
+    
+    def __init__(self, uri: str = AZURE_JWKS_URI, cache_file: str = JWKS_CACHE_FILE,
+                 refresh_interval: float = JWKS_REFRESH_INTERVAL,
+                 min_refetch_interval: float = JWKS_MIN_REFETCH_INTERVAL, timeout: float = JWKS_TIMEOUT):
+        self.uri = uri
+        self.cache_file = Path(cache_file)
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        # (raw JWKS dict, kid -> PyJWK, fetched_at) swapped as one reference
+        self._state: Tuple[Dict[str, Any], Mapping[str, Any], float] = ({'keys': []}, MappingProxyType({}), 0.0)
+        self._last_fetch_attempt = 0.0
+        self._flight = SingleFlight()
+        self._pid: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def jwk_set(self) -> Dict[str, Any]:
+        return self._state[0]
+    
+    @property
+    def fetched_at(self) -> float:
+        return self._state[2]
+    
+    def _adopt(self, jwk_set: Dict[str, Any], fetched_at: float) -> None:
+        keys = {}
+        for key in jwk_set.get('keys', []):
+            try:
+                keys[key['kid']] = jwt.PyJWK(key)
+            except (KeyError, jwt.PyJWTError) as e:
+                logger.debug("🔐 [JWKS] Skipping unusable key %s: %s", key.get('kid'), e)
+        self._state = (jwk_set, MappingProxyType(keys), fetched_at)
+    
+    def _read_file(self) -> bool:
+        """Adopt the shared file cache if it is newer than what this worker holds."""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('uri') != self.uri or cached['fetched_at'] <= self.fetched_at:
+                return False
+            self._adopt(cached['jwks'], cached['fetched_at'])
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning("⚠️ [JWKS] Ignoring unreadable cache file %s: %s", self.cache_file, e)
+            return False
+        auth_metrics.incr('jwks.file_hit')
+        return True
+    
+    def _write_file(self, jwk_set: Dict[str, Any], fetched_at: float) -> None:
+        tmp_path = self.cache_file.with_name(f".{self.cache_file.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'uri': self.uri, 'fetched_at': fetched_at, 'jwks': jwk_set}, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logger.warning("⚠️ [JWKS] Could not write cache file %s: %s", self.cache_file, e)
+    
+    def _fetch(self) -> None:
+        self._last_fetch_attempt = time.time()
+        auth_metrics.incr('jwks.fetch')
+        try:
+            response = requests.get(self.uri, timeout=self.timeout)
+            response.raise_for_status()
+            jwk_set = response.json()
+            fetched_at = time.time()
+            self._adopt(jwk_set, fetched_at)
+        except Exception as e:
+            auth_metrics.incr('jwks.fetch_error')
+            logger.error("❌ [JWKS] Failed to fetch %s, keeping %s cached keys: %s", self.uri, len(self._state[1]), e)
+            return
+        self._write_file(jwk_set, fetched_at)
+        logger.info("🔐 [JWKS] Fetched %s signing keys from %s", len(self._state[1]), self.uri)
+    
+    def refresh(self, force: bool = False) -> None:
+        """Bring the keys up to date: from the shared file if fresh enough, else from the network."""
+        def run():
+            self._read_file()
+            if force or time.time() - self.fetched_at >= self.refresh_interval:
+                self._fetch()
+        self._flight.do('refresh', run)
+    
+    def prefetch(self) -> "JwksCache":
+        self.refresh()
+        return self
+    
+    def _refetch(self, kid: Optional[str] = None) -> None:
+        """Key rotation: take newer keys from the shared file, else refetch (throttled, single-flight)."""
+        auth_metrics.incr('jwks.unknown_kid')
+        def run():
+            if self._read_file() and (kid is None or kid in self._state[1]):
+                return
+            if time.time() - self._last_fetch_attempt >= self.min_refetch_interval:
+                self._fetch()
+        self._flight.do('refresh', run)
+    
+    def get_key(self, kid: Optional[str]):
+        """Return the PyJWK for a token's kid, refetching once on key rotation."""
+        key = self._state[1].get(kid)
+        if key is not None:
+            return key
+        self._refetch(kid)
+        key = self._state[1].get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key id: {kid}")
+        return key
+    
+    def fetch_jwk_set(self, force: bool = False) -> Dict[str, Any]:
+        """Drop-in for authlib's ``fetch_jwk_set`` used while parsing the OAuth callback's id_token."""
+        if force:
+            # authlib only forces a fetch when the token's kid was not in the set
+            self._refetch()
+        elif not self._state[1]:
+            self.refresh()
+        return self.jwk_set
+    
+    def verify(self, id_token: str, audience: Optional[str] = AZURE_CLIENT_ID, issuer: Optional[str] = AZURE_ISSUER) -> Dict[str, Any]:
+        """Verify signature, audience, issuer and expiry locally and return the claims."""
+        header = jwt.get_unverified_header(id_token)
+        key = self.get_key(header.get('kid'))
+        return jwt.decode(
+            id_token,
+            key.key,
+            algorithms=[key.algorithm_name or 'RS256'],
+            audience=audience,
+            issuer=issuer,
+            leeway=120,
+            options={'require': ['exp', 'iat', 'aud', 'iss']},
+        )
+    
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
+    
+    def start(self) -> "JwksCache":
+        """Prefetch, then refresh in a daemon thread (idempotent, fork-aware)."""
+        if self.is_running():
+            return self
+        self.prefetch()
+        if self.refresh_interval > 0:
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+        return self
+    
+    def stop(self) -> None:
+        self._stop_event.set()
+    
+    def is_running(self) -> bool:
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'keys': sorted(self._state[1]),
+            'fetched_at': self.fetched_at,
+            'age': time.time() - self.fetched_at if self.fetched_at else None,
+            'refreshing': self.is_running(),
+        }
+
+jwks_cache = JwksCache()
+
+# Claims of the id_token last verified on this thread, so the parent's decode doesn't verify twice
+_verified_id_token = threading.local()
@@ -0,0 +1,215 @@
+"""Role mapping validation, the compiled in-memory index and claim -> role resolution."""
+from __future__ import annotations
+
+import os
+import re
+import fnmatch
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Tuple, Optional
+
+from .settings import AUTH_USER_REGISTRATION_ROLE
+from .telemetry import logger
+
+
+def _get_file_path(file_path: str) -> Path:
+    """Get absolute path for role mapping file with validation."""
+    path = Path(file_path)
+    if not path.is_absolute():
+        # If relative path, make it relative to the config directory (where webserver_config.py
+        # and this package live)
+        config_dir = Path(__file__).resolve().parent.parent
+        path = config_dir / path
+    return path
+
+def _validate_role_mapping_structure(data: dict) -> bool:
+    """Validate the structure of role mapping JSON."""
+    if not isinstance(data, dict):
+        return False
+    
+    # Check for required keys
+    if 'role_mapping' not in data and 'group_mapping' not in data:
+        logger.warning("🔐 [VALIDATION] Neither 'role_mapping' nor 'group_mapping' found in config")
+        return False
+    
+    # Validate role_mapping structure
+    if 'role_mapping' in data:
+        if not isinstance(data['role_mapping'], dict):
+            logger.error("🔐 [VALIDATION] 'role_mapping' must be a dictionary")
+            return False
+    
+    # Validate group_mapping structure
+    if 'group_mapping' in data:
+        if not isinstance(data['group_mapping'], dict):
+            logger.error("🔐 [VALIDATION] 'group_mapping' must be a dictionary")
+            return False
+    
+    # Validate mapping targets: a role name or a list of role names
+    for section in ('role_mapping', 'group_mapping'):
+        for key, target in data.get(section, {}).items():
+            if isinstance(target, str):
+                continue
+            if isinstance(target, list) and all(isinstance(t, str) for t in target):
+                continue
+            logger.error("🔐 [VALIDATION] '%s' entry '%s' must map to a role name or a list of role names", section, key)
+            return False
+    
+    return True
+
+
+_WILDCARD_CHARS = ('*', '?')
+
+
+class RoleIndex:
+    """Immutable lookup index for one mapping section (claim value -> Airflow roles).
+    
+    Keys are matched in three ways:
+      - exact: ``"Airflow.Admin"`` (resolved with a single set intersection)
+      - prefix: ``"Airflow.Project*"`` (a trailing ``*`` and no other wildcard)
+      - pattern: any other key containing ``*`` or ``?`` (fnmatch syntax)
+    
+    A key may map to a single role name or a list of role names, and any number
+    of keys may map to the same role, so the index is many-to-many.
+    """
+    
+    __slots__ = ('exact', 'keys', 'prefixes', 'prefix_lengths', 'patterns', 'target_roles', 'size')
+    
+    def __init__(self, mapping: Mapping[str, Any]):
+        exact: Dict[str, FrozenSet[str]] = {}
+        prefixes: Dict[str, FrozenSet[str]] = {}
+        patterns: List[Tuple[re.Pattern, FrozenSet[str]]] = []
+        
+        for key, target in mapping.items():
+            roles = frozenset([target] if isinstance(target, str) else target)
+            if not any(c in key for c in _WILDCARD_CHARS):
+                exact[key] = exact.get(key, frozenset()) | roles
+            elif key.endswith('*') and not any(c in key[:-1] for c in _WILDCARD_CHARS):
+                prefix = key[:-1]
+                prefixes[prefix] = prefixes.get(prefix, frozenset()) | roles
+            else:
+                patterns.append((re.compile(fnmatch.translate(key)), roles))
+        
+        self.exact: Mapping[str, FrozenSet[str]] = MappingProxyType(exact)
+        self.keys: FrozenSet[str] = frozenset(exact)
+        self.prefixes: Mapping[str, FrozenSet[str]] = MappingProxyType(prefixes)
+        self.prefix_lengths: Tuple[int, ...] = tuple(sorted({len(p) for p in prefixes}))
+        self.patterns: Tuple[Tuple[re.Pattern, FrozenSet[str]], ...] = tuple(patterns)
+        self.target_roles: FrozenSet[str] = frozenset().union(
+            *exact.values(), *prefixes.values(), *(roles for _, roles in patterns)
+        )
+        self.size = len(mapping)
+    
+    def _match_rules(self, claim: str) -> FrozenSet[str]:
+        """Match a claim that has no exact entry against prefix and pattern rules."""
+        roles: FrozenSet[str] = frozenset()
+        for length in self.prefix_lengths:
+            if length > len(claim):
+                break
+            hit = self.prefixes.get(claim[:length])
+            if hit:
+                roles |= hit
+        for pattern, pattern_roles in self.patterns:
+            if pattern.match(claim):
+                roles |= pattern_roles
+        return roles
+    
+    def resolve(self, claims: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Resolve token claim values to Airflow roles.
+        
+        Cost is proportional to the number of claims, not the size of the mapping.
+        
+        Returns:
+            Tuple of (mapped roles in claim order without duplicates, unknown claims).
+        """
+        claims = list(dict.fromkeys(claims))
+        hits = self.keys.intersection(claims)
+        has_rules = bool(self.prefixes or self.patterns)
+        if not hits and not has_rules:
+            return [], claims
+        
+        mapped: Dict[str, None] = {}
+        unknown: List[str] = []
+        for claim in claims:
+            roles = self.exact[claim] if claim in hits else frozenset()
+            if has_rules:
+                roles = roles | self._match_rules(claim)
+            if roles:
+                mapped.update(dict.fromkeys(sorted(roles)))
+            else:
+                unknown.append(claim)
+        return list(mapped), unknown
+
+
+class CompiledRoleMappings:
+    """Immutable, compiled form of ``role_mapping.json`` built once per reload."""
+    
+    __slots__ = ('role_mapping', 'group_mapping', 'role_index', 'group_index', 'version')
+    
+    def __init__(self, data: Mapping[str, Any], version: float = 0):
+        self.role_mapping: Mapping[str, Any] = MappingProxyType(dict(data.get('role_mapping', {})))
+        self.group_mapping: Mapping[str, Any] = MappingProxyType(dict(data.get('group_mapping', {})))
+        self.role_index = RoleIndex(self.role_mapping)
+        self.group_index = RoleIndex(self.group_mapping)
+        self.version = version
+    
+    def index_for(self, method: str) -> RoleIndex:
+        """Return the index used by the given ROLE_MAPPING_METHOD."""
+        return self.role_index if method == "role" else self.group_index
+    
+    @property
+    def target_roles(self) -> FrozenSet[str]:
+        """All Airflow roles referenced by either mapping section."""
+        return self.role_index.target_roles | self.group_index.target_roles
+
+
+_EMPTY_ROLE_MAPPINGS = CompiledRoleMappings({})
+
+def _file_signature(st: os.stat_result) -> Tuple[int, int, int]:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _target_list(target: Any) -> List[str]:
+    return [target] if isinstance(target, str) else list(target)
+
+def _is_rule_key(key: str) -> bool:
+    return any(c in key for c in _WILDCARD_CHARS)
+
+def _mapping_section(method: str) -> str:
+    return 'role_mapping' if method == "role" else 'group_mapping'
+
+def _changed_mapping_keys(old: Mapping[str, Any], new: Mapping[str, Any]) -> FrozenSet[str]:
+    """Keys whose target roles differ between two versions of a mapping section."""
+    changed = []
+    for key in set(old).union(new):
+        old_target, new_target = old.get(key), new.get(key)
+        if old_target == new_target:
+            continue
+        if old_target is None or new_target is None or set(_target_list(old_target)) != set(_target_list(new_target)):
+            changed.append(key)
+    return frozenset(changed)
+
+# Claim resolution shared by the login path and the offline replay (replay-claims)
+
+def token_claims(method: str, id_token_claims: Mapping[str, Any], userinfo: Mapping[str, Any]) -> Tuple[str, List[str]]:
+    """The claim the mapping reads in this mode ("roles" or "groups") and its values, id_token first."""
+    claim_name = "roles" if method == "role" else "groups"
+    return claim_name, id_token_claims.get(claim_name, []) or userinfo.get(claim_name, [])
+
+def map_claims(compiled: CompiledRoleMappings, method: str, claims: Iterable[str]) -> Tuple[List[str], List[str], bool]:
+    """Resolve claims to Airflow roles.
+    
+    Returns:
+        Tuple of (mapped roles, unknown claims, default role used). With no
+        mapped role the roles are ``[AUTH_USER_REGISTRATION_ROLE]``.
+    """
+    mapped_roles, unknown_claims = compiled.index_for(method).resolve(claims)
+    if not mapped_roles:
+        return [AUTH_USER_REGISTRATION_ROLE], unknown_claims, True
+    return mapped_roles, unknown_claims, False
+
+def readable_username(id_token_claims: Mapping[str, Any], userinfo: Mapping[str, Any]) -> Optional[str]:
+    """preferred_username, upn or display name (the parent class would use the OID)."""
+    for name in ('preferred_username', 'upn', 'name'):
+        value = id_token_claims.get(name) or userinfo.get(name)
+        if value:
+            return value
+    return None
@@ -0,0 +1,337 @@
+"""Loading, caching and hot-reloading of the configured role mapping (ROLE_MAPPING_FILE)."""
+from __future__ import annotations
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Dict, Mapping, Tuple, Optional
+
+from .mapping import (
+    CompiledRoleMappings, _EMPTY_ROLE_MAPPINGS, _changed_mapping_keys, _file_signature, _get_file_path,
+    _mapping_section, _validate_role_mapping_structure,
+)
+from .mapping_snapshot import RoleMappingSnapshots, _role_mapping_snapshots_for
+from .mapping_store import RoleMappingStore, _is_role_mapping_store, _open_role_mapping_store
+from .settings import (
+    ROLE_MAPPING_CACHE_TTL, ROLE_MAPPING_FILE, ROLE_MAPPING_METHOD, ROLE_MAPPING_WATCH_INTERVAL,
+    ROLE_RECONCILE_ENABLED,
+)
+from .telemetry import auth_metrics, logger
+
+
+# Global cache for role mappings
+_role_mapping_cache = {
+    'compiled': None,
+    'timestamp': 0,
+    'file_mtime': 0
+}
+
+def _compile_role_mapping_file(file_path_obj: Path, file_mtime: float) -> CompiledRoleMappings:
+    """Read, validate and compile a role mapping file.
+    
+    Raises:
+        OSError, json.JSONDecodeError: If the file cannot be read or parsed.
+        ValueError: If the file structure is invalid.
+    """
+    with open(file_path_obj, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    # Validate structure
+    if not _validate_role_mapping_structure(data):
+        raise ValueError("Invalid role mapping file structure")
+    
+    # Compile lookup index once per reload
+    compiled = CompiledRoleMappings(data, version=file_mtime)
+    logger.debug("🔐 [CONFIG] Loaded %s role mappings, %s group mappings", len(compiled.role_mapping), len(compiled.group_mapping))
+    return compiled
+
+def _cache_role_mappings(compiled: CompiledRoleMappings, loaded_at: float) -> None:
+    """Swap mappings into this worker's cache. Readers only ever see whole objects."""
+    _role_mapping_cache.update({
+        'timestamp': loaded_at,
+        'file_mtime': compiled.version
+    })
+    _role_mapping_cache['compiled'] = compiled
+
+def _store_role_mappings(compiled: CompiledRoleMappings, loaded_at: float,
+                         signature: Optional[Tuple[int, int, int]] = None,
+                         snapshots: Optional[RoleMappingSnapshots] = None) -> CompiledRoleMappings:
+    """Publish newly compiled mappings to the shared snapshot (if given) and this worker's cache."""
+    if snapshots is not None:
+        try:
+            compiled = snapshots.publish(compiled, signature) or compiled
+        except Exception as e:
+            logger.error("❌ [SNAPSHOT] Failed to publish role mapping snapshot, using this worker's copy: %s", e)
+    _cache_role_mappings(compiled, loaded_at)
+    auth_metrics.incr('role_mapping.reload')
+    logger.debug("🔐 [CACHE] Role mappings compiled and cached successfully")
+    return compiled
+
+def _last_known_good_role_mappings() -> CompiledRoleMappings:
+    """Return the last successfully loaded mappings, or empty mappings."""
+    auth_metrics.incr('role_mapping.reload_error')
+    compiled = _role_mapping_cache['compiled']
+    if compiled is None:
+        return _EMPTY_ROLE_MAPPINGS
+    logger.warning("⚠️ [CACHE] Serving last-known-good role mappings (version %s)", compiled.version)
+    return compiled
+
+def load_compiled_role_mappings(file_path: Optional[str] = None, force_reload: bool = False) -> CompiledRoleMappings:
+    """Load role and group mappings from JSON file with caching and validation.
+    
+    The file is parsed, validated and compiled into a :class:`CompiledRoleMappings`
+    index once per reload; cache hits return the same immutable object.
+    
+    Args:
+        file_path: Path to role mapping JSON file. If None, uses ROLE_MAPPING_FILE env var.
+        force_reload: If True, bypass cache and reload from file.
+    
+    Returns:
+        Compiled role mappings. If the file cannot be loaded, the last-known-good
+        mappings are returned (empty if nothing was ever loaded).
+    """
+    global _role_mapping_cache
+    
+    if file_path is None:
+        file_path = ROLE_MAPPING_FILE
+    
+    try:
+        file_path_obj = _get_file_path(file_path)
+        current_time = time.time()
+        
+        # Check if file exists
+        if not file_path_obj.exists():
+            logger.error("🔐 [ERROR] Role mapping file not found: %s", file_path_obj)
+            return _last_known_good_role_mappings()
+        
+        file_stat = file_path_obj.stat()
+        file_mtime = file_stat.st_mtime
+        
+        if _is_role_mapping_store(file_path_obj):
+            store = _open_role_mapping_store(file_path_obj)
+            _cache_role_mappings(store, current_time)
+            return store
+        
+        # Check cache validity
+        cache_valid = (
+            not force_reload and
+            _role_mapping_cache['compiled'] is not None and
+            (current_time - _role_mapping_cache['timestamp']) < ROLE_MAPPING_CACHE_TTL and
+            _role_mapping_cache['file_mtime'] == file_mtime
+        )
+        
+        if cache_valid:
+            logger.debug("🔐 [CACHE] Using cached role mappings")
+            auth_metrics.incr('role_mapping.cache_hit')
+            compiled = _role_mapping_cache['compiled']
+        else:
+            auth_metrics.incr('role_mapping.cache_miss')
+            logger.debug("🔐 [LOAD] Loading role mappings from: %s", file_path_obj)
+            
+            compiled = _compile_role_mapping_file(file_path_obj, file_mtime)
+            compiled = _store_role_mappings(compiled, current_time, _file_signature(file_stat),
+                                            _role_mapping_snapshots_for(file_path_obj))
+        
+        return compiled
+        
+    except FileNotFoundError:
+        logger.error("🔐 [ERROR] Role mapping file not found: %s", file_path)
+    except json.JSONDecodeError as e:
+        logger.error("🔐 [ERROR] Invalid JSON in role mapping file: %s", e)
+    except PermissionError:
+        logger.error("🔐 [ERROR] Permission denied reading role mapping file: %s", file_path)
+    except ValueError as e:
+        logger.error("🔐 [ERROR] %s", e)
+    except Exception as e:
+        logger.error("🔐 [ERROR] Unexpected error loading role mappings: %s", e)
+    
+    return _last_known_good_role_mappings()
+
+def load_role_mappings(file_path: Optional[str] = None, force_reload: bool = False) -> Tuple[Mapping[str, Any], Mapping[str, Any]]:
+    """Load role and group mappings from JSON file with caching and validation.
+    
+    Args:
+        file_path: Path to role mapping JSON file. If None, uses ROLE_MAPPING_FILE env var.
+        force_reload: If True, bypass cache and reload from file.
+    
+    Returns:
+        Tuple of (role_mapping, group_mapping) read-only mappings.
+    """
+    compiled = load_compiled_role_mappings(file_path, force_reload)
+    return compiled.role_mapping, compiled.group_mapping
+
+
+class RoleMappingWatcher:
+    """Background poller that reloads the role mapping file off the login path.
+    
+    Every ``interval`` seconds the watcher stats the file. When its signature
+    (mtime, size, inode) changes, the file is parsed, validated and compiled on
+    the watcher thread and then swapped into ``_role_mapping_cache`` as a single
+    reference assignment. Any load error keeps the last-known-good mappings.
+    """
+    
+    def __init__(self, file_path: Optional[str] = None, interval: float = ROLE_MAPPING_WATCH_INTERVAL):
+        self.file_path = _get_file_path(file_path or ROLE_MAPPING_FILE)
+        self.snapshots = _role_mapping_snapshots_for(self.file_path)
+        self.interval = interval
+        self.pid = os.getpid()
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checks': 0,
+            'reloads': 0,
+            'reload_errors': 0,
+            'last_reload_at': 0.0,
+            'last_error': None,
+        }
+    
+    def _count(self, **updates) -> None:
+        with self._stats_lock:
+            for key, value in updates.items():
+                if key in ('checks', 'reloads', 'reload_errors'):
+                    self._stats[key] += value
+                else:
+                    self._stats[key] = value
+    
+    def check(self) -> bool:
+        """Reload the file if it changed since the last check.
+        
+        Returns:
+            True if new mappings were swapped in.
+        """
+        self._count(checks=1)
+        try:
+            st = self.file_path.stat()
+            signature = _file_signature(st)
+            if signature == self._signature:
+                return False
+            # Remember the attempt so a bad file is not re-parsed on every poll;
+            # the next write changes the signature and triggers a retry.
+            self._signature = signature
+            previous = _role_mapping_cache['compiled']
+            previous_version = getattr(previous, 'version', None)
+            
+            if _is_role_mapping_store(self.file_path):
+                store = _open_role_mapping_store(self.file_path)
+                _cache_role_mappings(store, time.time())
+                self._count(reloads=1, last_reload_at=time.time(), last_error=None)
+                logger.info("🔐 [WATCHER] Applied changes from %s (seq %s)", self.file_path, store.version)
+                self._schedule_reconcile(previous, store, previous_version)
+                return True
+            
+            # Another worker may already have published this exact file
+            adopted = self.snapshots.adopt(signature) if self.snapshots is not None else None
+            if adopted is not None:
+                _cache_role_mappings(adopted, time.time())
+                self._count(last_reload_at=time.time(), last_error=None)
+                logger.debug("🔐 [WATCHER] Adopted shared snapshot generation %s", adopted.generation)
+                self._schedule_reconcile(previous, adopted)
+                return True
+            
+            compiled = _compile_role_mapping_file(self.file_path, st.st_mtime)
+        except Exception as e:
+            self._count(reload_errors=1, last_error=f"{type(e).__name__}: {e}")
+            auth_metrics.incr('role_mapping.reload_error')
+            logger.error("🔐 [WATCHER] Failed to reload %s, keeping last-known-good mappings: %s", self.file_path, e)
+            return False
+        
+        compiled = _store_role_mappings(compiled, time.time(), signature, self.snapshots)
+        self._count(reloads=1, last_reload_at=time.time(), last_error=None)
+        logger.info("🔐 [WATCHER] Reloaded role mappings from %s (version %s)", self.file_path, compiled.version)
+        self._schedule_reconcile(previous, compiled)
+        return True
+    
+    @staticmethod
+    def _schedule_reconcile(previous: Optional[CompiledRoleMappings], current: CompiledRoleMappings,
+                            previous_version: Any = None) -> None:
+        """Hand the mapping diff to the role reconciler (nothing to do on the first load)."""
+        if previous is None or not ROLE_RECONCILE_ENABLED:
+            return
+        from .reconcile import role_reconciler  # reconcile reads the mappings through get_role_mappings
+        
+        section = _mapping_section(ROLE_MAPPING_METHOD)
+        if previous is not current:
+            role_reconciler.submit(lambda: _changed_mapping_keys(getattr(previous, section), getattr(current, section)))
+        elif isinstance(current, RoleMappingStore) and current.version != previous_version:
+            role_reconciler.submit(lambda: current.changed_keys(section, previous_version))
+    
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.check()
+    
+    def start(self) -> "RoleMappingWatcher":
+        """Load the mappings synchronously once, then keep polling in a daemon thread."""
+        self.check()
+        self._thread = threading.Thread(target=self._run, name="role-mapping-watcher", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+    
+    def is_running(self) -> bool:
+        """True if the polling thread is alive in this process (threads do not survive fork)."""
+        return self.pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return reload counters for monitoring."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        compiled = _role_mapping_cache['compiled']
+        stats['version'] = compiled.version if compiled is not None else None
+        stats['generation'] = getattr(compiled, 'generation', None)
+        return stats
+
+
+_role_mapping_watcher: Optional[RoleMappingWatcher] = None
+_role_mapping_watcher_lock = threading.Lock()
+
+def start_role_mapping_watcher(file_path: Optional[str] = None, interval: Optional[float] = None) -> Optional[RoleMappingWatcher]:
+    """Start the per-process role mapping watcher (idempotent, fork-aware).
+    
+    Returns:
+        The running watcher, or None if ROLE_MAPPING_WATCH_INTERVAL disables it.
+    """
+    global _role_mapping_watcher
+    
+    if interval is None:
+        interval = ROLE_MAPPING_WATCH_INTERVAL
+    if interval <= 0:
+        return None
+    
+    with _role_mapping_watcher_lock:
+        if _role_mapping_watcher is None or not _role_mapping_watcher.is_running():
+            _role_mapping_watcher = RoleMappingWatcher(file_path, interval).start()
+            logger.debug("🔐 [WATCHER] Watching %s every %ss", _role_mapping_watcher.file_path, interval)
+        return _role_mapping_watcher
+
+def get_role_mappings() -> CompiledRoleMappings:
+    """Return the current compiled mappings for the login path.
+    
+    With a running watcher this is a plain memory read (no filesystem I/O) plus,
+    with the shared snapshot, one read of the published generation, so every
+    worker serves a newly published mapping from its next login on.
+    Otherwise it falls back to the TTL/mtime cache in load_compiled_role_mappings.
+    """
+    watcher = _role_mapping_watcher
+    if watcher is not None and watcher.is_running():
+        auth_metrics.incr('role_mapping.cache_hit')
+        compiled = _role_mapping_cache['compiled']
+        snapshots = watcher.snapshots
+        if snapshots is not None and not isinstance(compiled, RoleMappingStore):
+            try:
+                shared = snapshots.current()
+            except Exception as e:
+                logger.error("❌ [SNAPSHOT] Failed to map role mapping snapshot: %s", e)
+                shared = None
+            if shared is not None and shared is not compiled:
+                _cache_role_mappings(shared, time.time())
+                compiled = shared
+        return compiled or _EMPTY_ROLE_MAPPINGS
+    return load_compiled_role_mappings()
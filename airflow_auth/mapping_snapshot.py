@@ -0,0 +1,408 @@
+"""Compiled role mapping snapshot shared by all workers on a host through one memory-mapped file."""
+from __future__ import annotations
+
+import os
+import json
+import re
+import hashlib
+import fcntl
+import mmap
+import struct
+import zlib
+import threading
+from pathlib import Path
+from collections.abc import Mapping as MappingABC
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Tuple, Optional
+
+from .mapping import CompiledRoleMappings, RoleIndex, _WILDCARD_CHARS, _get_file_path
+from .settings import ROLE_MAPPING_FILE, ROLE_MAPPING_SNAPSHOT_FILE
+from .telemetry import auth_metrics, logger
+
+
+# Snapshot file layout (little-endian). Offsets of strings are relative to strings_off,
+# role lists are indexes into the u32 pool of role ids.
+_SNAPSHOT_MAGIC = b'RMSNAP02'
+_SNAPSHOT_HEADER = struct.Struct('<8sQdQQQI16s')  # magic, generation, version, roles_off, pool_off, strings_off, n_roles, source
+_SNAPSHOT_ROLE = struct.Struct('<II')          # name offset, name length
+_SNAPSHOT_SECTION = struct.Struct('<QIIQI')    # slots_off, table_size, n_keys, meta_off, meta_len
+_SNAPSHOT_SLOT = struct.Struct('<IIIII')       # key hash, key offset, key length, pool index, n_roles
+_SNAPSHOT_EMPTY_SLOT = 0xFFFFFFFF
+_SNAPSHOT_CONTROL = struct.Struct('<8sQQQQ16s')  # magic, generation, source mtime_ns, size, inode, source
+_SNAPSHOT_CONTROL_MAGIC = b'RMCTRL02'
+_SNAPSHOT_GENERATION = struct.Struct('<Q')
+_SNAPSHOT_SOURCE = struct.Struct('<16s')
+_SNAPSHOT_SOURCE_OFFSET = 40
+
+def _mapping_source(file_path: str) -> bytes:
+    """Identify a mapping file in the shared snapshot: a hash of its resolved path."""
+    return hashlib.blake2b(os.path.realpath(_get_file_path(file_path)).encode('utf-8'), digest_size=16).digest()
+
+def _encode_role_mapping_snapshot(compiled: CompiledRoleMappings, generation: int, source: bytes = bytes(16)) -> bytes:
+    """Serialize compiled mappings into the memory-mappable snapshot format.
+    
+    Exact keys go into an open-addressing hash table (load factor <= 0.5, crc32,
+    linear probing); wildcard rules and per-section target roles go into a small
+    JSON blob, since there are only a handful of them.
+    """
+    strings = bytearray()
+    role_ids: Dict[str, int] = {}
+    pool: List[int] = []
+    sections = []
+    
+    def role_id(name: str) -> int:
+        if name not in role_ids:
+            role_ids[name] = len(role_ids)
+        return role_ids[name]
+    
+    for mapping in (compiled.role_mapping, compiled.group_mapping):
+        exact: Dict[str, List[str]] = {}
+        rules: Dict[str, List[str]] = {}
+        for key, target in mapping.items():
+            roles = [target] if isinstance(target, str) else list(target)
+            (rules if any(c in key for c in _WILDCARD_CHARS) else exact)[key] = roles
+        
+        table_size = 8
+        while table_size < 2 * len(exact):
+            table_size *= 2
+        mask = table_size - 1
+        slots: List[Optional[Tuple[int, int, int, int, int]]] = [None] * table_size
+        for key, roles in exact.items():
+            key_bytes = key.encode('utf-8')
+            key_hash = zlib.crc32(key_bytes)
+            ids = sorted({role_id(role) for role in roles})
+            entry = (key_hash, len(strings), len(key_bytes), len(pool), len(ids))
+            strings += key_bytes
+            pool.extend(ids)
+            i = key_hash & mask
+            while slots[i] is not None:
+                i = (i + 1) & mask
+            slots[i] = entry
+        
+        targets = sorted({role for roles in mapping.values() for role in ([roles] if isinstance(roles, str) else roles)})
+        meta = json.dumps({'rules': rules, 'targets': targets}).encode('utf-8')
+        sections.append((slots, table_size, len(exact), meta))
+    
+    role_table = bytearray()
+    for name in role_ids:
+        name_bytes = name.encode('utf-8')
+        role_table += _SNAPSHOT_ROLE.pack(len(strings), len(name_bytes))
+        strings += name_bytes
+    
+    empty_slot = _SNAPSHOT_SLOT.pack(0, _SNAPSHOT_EMPTY_SLOT, 0, 0, 0)
+    body = bytearray()
+    offset = _SNAPSHOT_HEADER.size + len(sections) * _SNAPSHOT_SECTION.size
+    descriptors = bytearray()
+    for slots, table_size, n_keys, meta in sections:
+        slots_off = offset + len(body)
+        body += b''.join(empty_slot if slot is None else _SNAPSHOT_SLOT.pack(*slot) for slot in slots)
+        meta_off = offset + len(body)
+        body += meta
+        descriptors += _SNAPSHOT_SECTION.pack(slots_off, table_size, n_keys, meta_off, len(meta))
+    
+    roles_off = offset + len(body)
+    body += role_table
+    pool_off = offset + len(body)
+    body += struct.pack(f'<{len(pool)}I', *pool)
+    strings_off = offset + len(body)
+    body += strings
+    
+    header = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, generation, float(compiled.version),
+                                   roles_off, pool_off, strings_off, len(role_ids), source)
+    return bytes(header + descriptors + body)
+
+
+class MappedRoleIndex:
+    """:class:`RoleIndex` over one section of a memory-mapped snapshot.
+    
+    Exact keys are looked up in the mapped hash table without being loaded into
+    the worker's heap; wildcard rules are compiled into a small in-memory RoleIndex.
+    """
+    
+    __slots__ = ('_buf', '_role_names', '_pool_off', '_strings_off', '_slots_off', '_mask', '_n_keys',
+                 '_rules', '_rule_targets', '_keys', 'target_roles', 'size')
+    
+    def __init__(self, buf, role_names: Tuple[str, ...], pool_off: int, strings_off: int, descriptor: Tuple[int, ...]):
+        slots_off, table_size, n_keys, meta_off, meta_len = descriptor
+        meta = json.loads(bytes(buf[meta_off:meta_off + meta_len]))
+        self._buf = buf
+        self._role_names = role_names
+        self._pool_off = pool_off
+        self._strings_off = strings_off
+        self._slots_off = slots_off
+        self._mask = table_size - 1
+        self._n_keys = n_keys
+        self._rule_targets: Dict[str, List[str]] = meta['rules']
+        self._rules = RoleIndex(self._rule_targets)
+        self._keys: Optional[FrozenSet[str]] = None
+        self.target_roles: FrozenSet[str] = frozenset(meta['targets'])
+        self.size = n_keys + self._rules.size
+    
+    def _slot(self, i: int) -> Tuple[int, int, int, int, int]:
+        return _SNAPSHOT_SLOT.unpack_from(self._buf, self._slots_off + i * _SNAPSHOT_SLOT.size)
+    
+    def _roles_at(self, pool_index: int, n_roles: int) -> Tuple[str, ...]:
+        ids = struct.unpack_from(f'<{n_roles}I', self._buf, self._pool_off + 4 * pool_index)
+        return tuple(self._role_names[role_id] for role_id in ids)
+    
+    def _lookup(self, claim: str) -> Optional[Tuple[str, ...]]:
+        """Roles for an exact key, or None."""
+        if not self._n_keys:
+            return None
+        key_bytes = claim.encode('utf-8')
+        key_hash = zlib.crc32(key_bytes)
+        i = key_hash & self._mask
+        while True:
+            slot_hash, key_off, key_len, pool_index, n_roles = self._slot(i)
+            if key_off == _SNAPSHOT_EMPTY_SLOT:
+                return None
+            if slot_hash == key_hash and key_len == len(key_bytes):
+                start = self._strings_off + key_off
+                if self._buf[start:start + key_len] == key_bytes:
+                    return self._roles_at(pool_index, n_roles)
+            i = (i + 1) & self._mask
+    
+    @property
+    def keys(self) -> FrozenSet[str]:
+        """Exact keys (decoded on first use only)."""
+        if self._keys is None:
+            self._keys = frozenset(self.iter_exact_keys())
+        return self._keys
+    
+    def iter_exact_keys(self) -> Iterator[str]:
+        for i in range(self._mask + 1):
+            _, key_off, key_len, _, _ = self._slot(i)
+            if key_off != _SNAPSHOT_EMPTY_SLOT:
+                start = self._strings_off + key_off
+                yield bytes(self._buf[start:start + key_len]).decode('utf-8')
+    
+    @property
+    def prefixes(self) -> Mapping[str, FrozenSet[str]]:
+        return self._rules.prefixes
+    
+    @property
+    def patterns(self) -> Tuple[Tuple[re.Pattern, FrozenSet[str]], ...]:
+        return self._rules.patterns
+    
+    def resolve(self, claims: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Same contract as :meth:`RoleIndex.resolve`."""
+        claims = list(dict.fromkeys(claims))
+        has_rules = bool(self._rules.prefixes or self._rules.patterns)
+        mapped: Dict[str, None] = {}
+        unknown: List[str] = []
+        for claim in claims:
+            roles = frozenset(self._lookup(claim) or ())
+            if has_rules:
+                roles = roles | self._rules._match_rules(claim)
+            if roles:
+                mapped.update(dict.fromkeys(sorted(roles)))
+            else:
+                unknown.append(claim)
+        return list(mapped), unknown
+    
+
+
+class _MappedSection(MappingABC):
+    """Read-only ``Mapping`` view (key -> role name or list of role names) of a mapped section."""
+    
+    __slots__ = ('_index',)
+    
+    def __init__(self, index: MappedRoleIndex):
+        self._index = index
+    
+    def __getitem__(self, key: str) -> Any:
+        roles = self._index._lookup(key)
+        if roles is None:
+            roles = self._index._rule_targets[key]
+        return roles[0] if len(roles) == 1 else list(roles)
+    
+    def __iter__(self) -> Iterator[str]:
+        yield from self._index.iter_exact_keys()
+        yield from self._index._rule_targets
+    
+    def __len__(self) -> int:
+        return self._index.size
+    
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and (self._index._lookup(key) is not None or key in self._index._rule_targets)
+
+
+class MappedRoleMappings(CompiledRoleMappings):
+    """:class:`CompiledRoleMappings` backed by a read-only memory-mapped snapshot file."""
+    
+    __slots__ = ('generation', 'source', '_mmap')
+    
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = self._mmap
+        magic, generation, version, roles_off, pool_off, strings_off, n_roles, source = _SNAPSHOT_HEADER.unpack_from(buf, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a role mapping snapshot: {path}")
+        role_names = tuple(
+            bytes(buf[strings_off + off:strings_off + off + length]).decode('utf-8')
+            for off, length in _SNAPSHOT_ROLE.iter_unpack(buf[roles_off:roles_off + n_roles * _SNAPSHOT_ROLE.size])
+        )
+        indexes = [
+            MappedRoleIndex(buf, role_names, pool_off, strings_off,
+                            _SNAPSHOT_SECTION.unpack_from(buf, _SNAPSHOT_HEADER.size + i * _SNAPSHOT_SECTION.size))
+            for i in range(2)
+        ]
+        self.role_index, self.group_index = indexes
+        self.role_mapping, self.group_mapping = (_MappedSection(index) for index in indexes)
+        self.generation = generation
+        self.source = source
+        self.version = version
+
+
+class RoleMappingSnapshots:
+    """Compiled role mappings shared by all workers through memory-mapped files.
+    
+    ``<path>`` is a small control file holding the current generation, the
+    signature of the source file it was built from and which file that was (a
+    hash of its resolved path); ``<path>.<generation>`` are the immutable
+    snapshots, which record the source too. Publishing (under an exclusive flock)
+    writes a new snapshot and then bumps the generation; readers compare one
+    mapped integer against the generation they hold and remap only when it
+    changed. Every worker therefore switches to a new mapping on its next login.
+    
+    Only mappings loaded from ``source`` (ROLE_MAPPING_FILE) are published, and
+    generations built from any other file (another process sharing AIRFLOW_HOME
+    with a different ROLE_MAPPING_FILE) are ignored.
+    """
+    
+    def __init__(self, path: str = ROLE_MAPPING_SNAPSHOT_FILE, source: str = ROLE_MAPPING_FILE):
+        self.path = Path(path)
+        self.source_path = os.path.realpath(_get_file_path(source))
+        self.source = _mapping_source(source)
+        self._lock = threading.Lock()
+        self._current: Optional[MappedRoleMappings] = None
+        with open(self.path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            if f.read(len(_SNAPSHOT_CONTROL_MAGIC)) != _SNAPSHOT_CONTROL_MAGIC or os.fstat(f.fileno()).st_size < _SNAPSHOT_CONTROL.size:
+                # Missing or written by an older layout: start over (its generations are ignored)
+                f.truncate(0)
+                f.write(_SNAPSHOT_CONTROL.pack(_SNAPSHOT_CONTROL_MAGIC, 0, 0, 0, 0, bytes(16)))
+                f.flush()
+            self._control = mmap.mmap(f.fileno(), _SNAPSHOT_CONTROL.size, access=mmap.ACCESS_READ)
+            # mmap keeps a dup of the descriptor, which would otherwise keep holding the lock
+            fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _data_path(self, generation: int) -> Path:
+        return self.path.with_name(f"{self.path.name}.{generation}")
+    
+    @property
+    def generation(self) -> int:
+        """Published generation: a single read from the shared mapping."""
+        return _SNAPSHOT_GENERATION.unpack_from(self._control, 8)[0]
+    
+    def _published_signature(self) -> Tuple[int, int, int]:
+        return tuple(_SNAPSHOT_CONTROL.unpack_from(self._control, 0)[2:5])
+    
+    def _published_source(self) -> bytes:
+        return _SNAPSHOT_SOURCE.unpack_from(self._control, _SNAPSHOT_SOURCE_OFFSET)[0]
+    
+    def current(self) -> Optional[MappedRoleMappings]:
+        """Return the published snapshot of our source file (None before its first publish).
+        
+        A generation published from another file is skipped (None), so callers
+        keep the mapping they hold until our source is published again.
+        """
+        current = self._current
+        generation = self.generation
+        if current is not None and current.generation == generation:
+            return current
+        if not generation or self._published_source() != self.source:
+            return None
+        with self._lock:
+            # A worker that fell more than one generation behind may find the file just pruned
+            for _ in range(3):
+                generation = self.generation
+                if self._current is not None and self._current.generation == generation:
+                    break
+                try:
+                    mapped = MappedRoleMappings(self._data_path(generation))
+                except FileNotFoundError:
+                    continue
+                # The control file may have moved on between the two reads: trust the snapshot's own record
+                if mapped.source == self.source:
+                    self._current = mapped
+                    logger.debug("🔐 [SNAPSHOT] Mapped role mapping snapshot generation %s", generation)
+                break
+            return self._current
+    
+    def adopt(self, signature: Optional[Tuple[int, int, int]]) -> Optional[MappedRoleMappings]:
+        """Return the published snapshot if it was built from our source file with this signature."""
+        if (signature is not None and self.generation and self._published_source() == self.source
+                and self._published_signature() == tuple(signature)):
+            current = self.current()
+            if current is not None and current.generation == self.generation:
+                return current
+        return None
+    
+    def publish(self, compiled: CompiledRoleMappings,
+                signature: Optional[Tuple[int, int, int]] = None) -> Optional[MappedRoleMappings]:
+        """Write compiled mappings of our source file as the next generation.
+        
+        Skipped if another worker already published this source with the same signature.
+        
+        Returns:
+            The generation this call wrote (or found published), mapped while still
+            holding the flock so no other publisher can prune or replace it first;
+            None if it could not be mapped, in which case callers keep ``compiled``
+        """
+        with self._lock, open(self.path, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            _, generation, *published, source = _SNAPSHOT_CONTROL.unpack(f.read(_SNAPSHOT_CONTROL.size))
+            if not (signature is not None and generation and source == self.source and tuple(published) == tuple(signature)):
+                generation += 1
+                data_path = self._data_path(generation)
+                tmp_path = data_path.with_name(f".{data_path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, 'wb') as out:
+                    out.write(_encode_role_mapping_snapshot(compiled, generation, self.source))
+                os.replace(tmp_path, data_path)
+                # Signature and source first, generation last: readers only ever look at the generation
+                os.pwrite(f.fileno(), struct.pack('<QQQ', *(signature or (0, 0, 0))) + self.source, 16)
+                os.pwrite(f.fileno(), _SNAPSHOT_GENERATION.pack(generation), 8)
+                auth_metrics.incr('role_mapping.snapshot_publish')
+                logger.info("🔐 [SNAPSHOT] Published role mapping snapshot generation %s (%s bytes)", generation, data_path.stat().st_size)
+                self._prune(generation)
+            try:
+                mapped = MappedRoleMappings(self._data_path(generation))
+            except (OSError, ValueError) as e:
+                logger.warning("⚠️ [SNAPSHOT] Could not map snapshot generation %s, using this worker's copy: %s", generation, e)
+                return None
+            self._current = mapped
+            return mapped
+    
+    def _prune(self, generation: int) -> None:
+        """Remove snapshots older than the previous generation (mapped copies stay valid until unmapped)."""
+        for old in self.path.parent.glob(f"{self.path.name}.*"):
+            suffix = old.name.rsplit('.', 1)[-1]
+            if suffix.isdigit() and int(suffix) < generation - 1:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+
+
+_role_mapping_snapshots: Optional[RoleMappingSnapshots] = None
+_role_mapping_snapshots_state = {'disabled': not ROLE_MAPPING_SNAPSHOT_FILE}
+
+def _get_role_mapping_snapshots() -> Optional[RoleMappingSnapshots]:
+    """Open the shared snapshot store once per process; None if disabled or unusable."""
+    global _role_mapping_snapshots
+    if _role_mapping_snapshots is None and not _role_mapping_snapshots_state['disabled']:
+        try:
+            _role_mapping_snapshots = RoleMappingSnapshots(ROLE_MAPPING_SNAPSHOT_FILE)
+        except OSError as e:
+            _role_mapping_snapshots_state['disabled'] = True
+            logger.warning("⚠️ [SNAPSHOT] Shared role mapping snapshot unavailable, compiling per worker: %s", e)
+    return _role_mapping_snapshots
+
+def _role_mapping_snapshots_for(file_path: Path) -> Optional[RoleMappingSnapshots]:
+    """The shared snapshot store if file_path is ROLE_MAPPING_FILE; ad-hoc mapping files are never shared."""
+    snapshots = _get_role_mapping_snapshots()
+    if snapshots is not None and os.path.realpath(file_path) == snapshots.source_path:
+        return snapshots
+    return None
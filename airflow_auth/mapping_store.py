@@ -0,0 +1,344 @@
+"""SQLite role mapping store for very large mappings, read incrementally through its change log."""
+from __future__ import annotations
+
+import os
+import json
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+from collections.abc import Mapping as MappingABC
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Tuple, Optional
+
+from .db import _SQLITE_MAX_VARIABLES
+from .mapping import RoleIndex, _get_file_path, _is_rule_key, _target_list, _validate_role_mapping_structure
+
+
+_ROLE_MAPPING_STORE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+_ROLE_MAPPING_SECTIONS = ('role_mapping', 'group_mapping')
+
+# Every write to `mapping` (converter, sqlite3 shell, ...) is logged to `changes` by
+# the triggers, so readers apply only what changed since the last seq they saw.
+_ROLE_MAPPING_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mapping (
+    section TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    roles   TEXT NOT NULL,
+    PRIMARY KEY (section, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+    section   TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    old_roles TEXT,
+    new_roles TEXT
+);
+CREATE TRIGGER IF NOT EXISTS mapping_insert AFTER INSERT ON mapping BEGIN
+    INSERT INTO changes (section, key, old_roles, new_roles) VALUES (NEW.section, NEW.key, NULL, NEW.roles);
+END;
+CREATE TRIGGER IF NOT EXISTS mapping_update AFTER UPDATE ON mapping BEGIN
+    INSERT INTO changes (section, key, old_roles, new_roles) VALUES (OLD.section, OLD.key, OLD.roles, NULL);
+    INSERT INTO changes (section, key, old_roles, new_roles) VALUES (NEW.section, NEW.key, NULL, NEW.roles);
+END;
+CREATE TRIGGER IF NOT EXISTS mapping_delete AFTER DELETE ON mapping BEGIN
+    INSERT INTO changes (section, key, old_roles, new_roles) VALUES (OLD.section, OLD.key, OLD.roles, NULL);
+END;
+"""
+
+def _is_role_mapping_store(path: Path) -> bool:
+    return path.suffix.lower() in _ROLE_MAPPING_STORE_SUFFIXES
+
+class _StoreState:
+    """Immutable in-memory part of a store: wildcard rules and target-role reference counts."""
+    
+    __slots__ = ('seq', 'rules', 'rule_indexes', 'role_refs', 'sizes')
+    
+    def __init__(self, seq: int, rules: Dict[str, Dict[str, Any]], role_refs: Dict[str, Dict[str, int]],
+                 sizes: Dict[str, int]):
+        self.seq = seq
+        self.rules = rules
+        self.rule_indexes = {section: RoleIndex(rules[section]) for section in _ROLE_MAPPING_SECTIONS}
+        self.role_refs = role_refs
+        self.sizes = sizes
+
+
+class _StoreExactKeys:
+    """Sized, iterable view of a section's exact keys, read from the store on demand."""
+    
+    __slots__ = ('_store', '_section')
+    
+    def __init__(self, store: "RoleMappingStore", section: str):
+        self._store = store
+        self._section = section
+    
+    def __len__(self) -> int:
+        state = self._store._state
+        return state.sizes[self._section] - len(state.rules[self._section])
+    
+    def __iter__(self) -> Iterator[str]:
+        rules = self._store._state.rules[self._section]
+        for (key,) in self._store._connection().execute(
+                "SELECT key FROM mapping WHERE section = ?", (self._section,)):
+            if key not in rules:
+                yield key
+
+
+class _StoreSection(MappingABC):
+    """Read-only ``Mapping`` view (key -> role name or list of role names) of a store section."""
+    
+    __slots__ = ('_store', '_section')
+    
+    def __init__(self, store: "RoleMappingStore", section: str):
+        self._store = store
+        self._section = section
+    
+    def __getitem__(self, key: str) -> Any:
+        row = self._store._connection().execute(
+            "SELECT roles FROM mapping WHERE section = ? AND key = ?", (self._section, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+    
+    def __iter__(self) -> Iterator[str]:
+        for (key,) in self._store._connection().execute(
+                "SELECT key FROM mapping WHERE section = ?", (self._section,)):
+            yield key
+    
+    def __len__(self) -> int:
+        return self._store._state.sizes[self._section]
+
+
+class StoreRoleIndex:
+    """:class:`RoleIndex` over one section of a :class:`RoleMappingStore`.
+    
+    Exact keys are looked up with one indexed query per login (only the token's
+    claims are read); wildcard rules are kept in memory.
+    """
+    
+    __slots__ = ('_store', '_section', 'keys')
+    
+    def __init__(self, store: "RoleMappingStore", section: str):
+        self._store = store
+        self._section = section
+        self.keys = _StoreExactKeys(store, section)
+    
+    @property
+    def _rules(self) -> RoleIndex:
+        return self._store._state.rule_indexes[self._section]
+    
+    @property
+    def prefixes(self) -> Mapping[str, FrozenSet[str]]:
+        return self._rules.prefixes
+    
+    @property
+    def patterns(self) -> Tuple[Tuple[re.Pattern, FrozenSet[str]], ...]:
+        return self._rules.patterns
+    
+    @property
+    def target_roles(self) -> FrozenSet[str]:
+        return frozenset(self._store._state.role_refs[self._section])
+    
+    @property
+    def size(self) -> int:
+        return self._store._state.sizes[self._section]
+    
+    def resolve(self, claims: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Same contract as :meth:`RoleIndex.resolve`."""
+        claims = list(dict.fromkeys(claims))
+        rules = self._rules
+        has_rules = bool(rules.prefixes or rules.patterns)
+        exact = self._store.lookup(self._section, claims)
+        mapped: Dict[str, None] = {}
+        unknown: List[str] = []
+        for claim in claims:
+            roles = exact.get(claim, frozenset())
+            if has_rules:
+                roles = roles | rules._match_rules(claim)
+            if roles:
+                mapped.update(dict.fromkeys(sorted(roles)))
+            else:
+                unknown.append(claim)
+        return list(mapped), unknown
+
+
+class RoleMappingStore:
+    """Role mappings kept in an indexed SQLite file instead of one big JSON document.
+    
+    Used when ROLE_MAPPING_FILE ends in ``.db``/``.sqlite``/``.sqlite3``. Workers
+    never load the exact keys: logins look up just their claims. Only wildcard rules
+    and per-role reference counts (for ``target_roles``) live in memory, and
+    :meth:`refresh` applies the ``changes`` log since the last seen ``seq``, so
+    reload time and memory follow the size of the change, not of the mapping.
+    Same interface as :class:`CompiledRoleMappings`; ``version`` is the last seq.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._state = self._load_state(self._connection())
+        self.role_index = StoreRoleIndex(self, 'role_mapping')
+        self.group_index = StoreRoleIndex(self, 'group_mapping')
+        self.role_mapping = _StoreSection(self, 'role_mapping')
+        self.group_mapping = _StoreSection(self, 'group_mapping')
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Read-only connection for this thread (and process: connections don't survive fork)."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            local.pid = os.getpid()
+        return local.connection
+    
+    @property
+    def version(self) -> int:
+        return self._state.seq
+    
+    @property
+    def target_roles(self) -> FrozenSet[str]:
+        return self.role_index.target_roles | self.group_index.target_roles
+    
+    def index_for(self, method: str) -> StoreRoleIndex:
+        return self.role_index if method == "role" else self.group_index
+    
+    @staticmethod
+    def _load_state(conn: sqlite3.Connection) -> _StoreState:
+        """Full scan, once per process: keeps rules and role counts, streams everything else."""
+        rules: Dict[str, Dict[str, Any]] = {section: {} for section in _ROLE_MAPPING_SECTIONS}
+        role_refs: Dict[str, Dict[str, int]] = {section: defaultdict(int) for section in _ROLE_MAPPING_SECTIONS}
+        sizes = dict.fromkeys(_ROLE_MAPPING_SECTIONS, 0)
+        with conn:  # one read transaction, so seq matches the rows
+            conn.execute("BEGIN")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            for section, key, roles_json in conn.execute("SELECT section, key, roles FROM mapping"):
+                if section not in sizes:
+                    continue
+                roles = json.loads(roles_json)
+                sizes[section] += 1
+                for role in _target_list(roles):
+                    role_refs[section][role] += 1
+                if _is_rule_key(key):
+                    rules[section][key] = roles
+        return _StoreState(seq, rules, {k: dict(v) for k, v in role_refs.items()}, sizes)
+    
+    def lookup(self, section: str, keys: List[str]) -> Dict[str, FrozenSet[str]]:
+        """Roles for the exact keys present in the store."""
+        found: Dict[str, FrozenSet[str]] = {}
+        conn = self._connection()
+        for i in range(0, len(keys), _SQLITE_MAX_VARIABLES):
+            chunk = keys[i:i + _SQLITE_MAX_VARIABLES]
+            rows = conn.execute(
+                f"SELECT key, roles FROM mapping WHERE section = ? AND key IN ({','.join('?' * len(chunk))})",
+                (section, *chunk),
+            )
+            for key, roles_json in rows:
+                found[key] = frozenset(_target_list(json.loads(roles_json)))
+        return found
+    
+    def refresh(self) -> int:
+        """Apply changes logged since the last refresh. Returns the number of changes applied."""
+        with self._lock:
+            state = self._state
+            conn = self._connection()
+            first = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if first is not None and first > state.seq + 1:
+                # Log was pruned past our position: rebuild from scratch
+                self._state = self._load_state(conn)
+                return self._state.seq - state.seq
+            
+            changes = conn.execute(
+                "SELECT seq, section, key, old_roles, new_roles FROM changes WHERE seq > ? ORDER BY seq",
+                (state.seq,),
+            ).fetchall()
+            if not changes:
+                return 0
+            
+            rules = {section: dict(state.rules[section]) for section in _ROLE_MAPPING_SECTIONS}
+            role_refs = {section: dict(state.role_refs[section]) for section in _ROLE_MAPPING_SECTIONS}
+            sizes = dict(state.sizes)
+            for _, section, key, old_roles, new_roles in changes:
+                if section not in sizes:
+                    continue
+                refs = role_refs[section]
+                if old_roles is not None:
+                    sizes[section] -= 1
+                    for role in _target_list(json.loads(old_roles)):
+                        refs[role] -= 1
+                        if refs[role] <= 0:
+                            del refs[role]
+                    rules[section].pop(key, None)
+                if new_roles is not None:
+                    sizes[section] += 1
+                    roles = json.loads(new_roles)
+                    for role in _target_list(roles):
+                        refs[role] = refs.get(role, 0) + 1
+                    if _is_rule_key(key):
+                        rules[section][key] = roles
+            self._state = _StoreState(changes[-1][0], rules, role_refs, sizes)
+            return len(changes)
+    
+    def changed_keys(self, section: str, since_seq: int) -> Optional[FrozenSet[str]]:
+        """Keys of a section changed after since_seq; None if the log was pruned past it."""
+        conn = self._connection()
+        first = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if first is not None and first > since_seq + 1:
+            return None
+        rows = conn.execute(
+            "SELECT DISTINCT key FROM changes WHERE section = ? AND seq > ? AND seq <= ?",
+            (section, since_seq, self.version),
+        )
+        return frozenset(key for (key,) in rows)
+
+
+_role_mapping_stores: Dict[Path, RoleMappingStore] = {}
+_role_mapping_stores_lock = threading.Lock()
+
+def _open_role_mapping_store(path: Path) -> RoleMappingStore:
+    """Return this process's store for path, refreshed to the latest change."""
+    with _role_mapping_stores_lock:
+        store = _role_mapping_stores.get(path)
+        if store is None:
+            store = _role_mapping_stores[path] = RoleMappingStore(path)
+            return store
+    store.refresh()
+    return store
+
+def convert_role_mapping_json(json_path: str, store_path: str, keep_changes: int = 100000) -> Dict[str, int]:
+    """Create or update a SQLite role mapping store from a role_mapping.json file.
+    
+    Only entries that differ are written (in one transaction), so workers apply
+    just those on their next refresh. The change log is trimmed to ``keep_changes``.
+    
+    Returns:
+        Counts of inserted, updated, deleted and unchanged entries.
+    """
+    with open(_get_file_path(json_path), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not _validate_role_mapping_structure(data):
+        raise ValueError(f"Invalid role mapping file structure: {json_path}")
+    
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    conn = sqlite3.connect(_get_file_path(store_path))
+    try:
+        conn.executescript(_ROLE_MAPPING_STORE_SCHEMA)
+        with conn:
+            for section in _ROLE_MAPPING_SECTIONS:
+                wanted = {key: json.dumps(target) for key, target in data.get(section, {}).items()}
+                for key, roles in conn.execute("SELECT key, roles FROM mapping WHERE section = ?", (section,)).fetchall():
+                    target = wanted.pop(key, None)
+                    if target is None:
+                        conn.execute("DELETE FROM mapping WHERE section = ? AND key = ?", (section, key))
+                        counts['deleted'] += 1
+                    elif json.loads(target) != json.loads(roles):
+                        conn.execute("UPDATE mapping SET roles = ? WHERE section = ? AND key = ?", (target, section, key))
+                        counts['updated'] += 1
+                    else:
+                        counts['unchanged'] += 1
+                conn.executemany("INSERT INTO mapping (section, key, roles) VALUES (?, ?, ?)",
+                                 ((section, key, roles) for key, roles in wanted.items()))
+                counts['inserted'] += len(wanted)
+            conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (keep_changes,))
+    finally:
+        conn.close()
+    return counts
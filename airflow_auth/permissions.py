@@ -0,0 +1,239 @@
+"""Per-role permission sets for authorization checks, shared-invalidated across workers."""
+from __future__ import annotations
+
+import time
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Optional
+
+import sqlalchemy
+from sqlalchemy.orm import object_session
+
+from .caching import TTLCache
+from .db import _chunks, _insert_ignore_statement
+from .settings import PERMISSION_CACHE_CHECK_INTERVAL, PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL
+from .telemetry import auth_metrics, logger
+
+
+# Per-role permission sets for authorization checks (replaces User.perms' query on every request)
+
+# One row (id 1) whose generation every process bumps after committing a role/permission
+# edit, so the permission caches of all workers and hosts on this metadata DB drop their sets
+_permission_generation_table = sqlalchemy.Table(
+    'ab_permission_generation',
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True, autoincrement=False),
+    sqlalchemy.Column('generation', sqlalchemy.BigInteger, nullable=False),
+)
+
+class PermissionCache:
+    """Compact (action, resource) permission sets, built per role and combined per user.
+    
+    FAB's ``User.perms`` runs a four-table join for every User it loads, i.e. on
+    every UI/API request. Here each role's permissions are loaded once (one query
+    for all roles not cached yet) into a frozenset of interned pairs, and a user's
+    set is the union over their role ids, memoized per distinct role combination,
+    so users with the same roles share one object (served to the auth manager's
+    checks by :class:`~airflow_auth.auth_manager.AzureFabAuthManager`). Roles come from the User row
+    loaded with the request, so role assignments are always current. Role and
+    permission edits clear the cache of the process that made them and, once
+    committed, bump the generation in ab_permission_generation; every process
+    compares it with the last one it saw at most every ``check_interval`` seconds
+    and drops its sets when it moved.
+    """
+    
+    def __init__(self, maxsize: int = PERMISSION_CACHE_SIZE, ttl: float = PERMISSION_CACHE_TTL,
+                 check_interval: float = PERMISSION_CACHE_CHECK_INTERVAL):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._roles = TTLCache(maxsize, ttl)   # role id -> frozenset of pairs
+        self._unions = TTLCache(maxsize, ttl)  # frozenset of role ids -> frozenset of pairs
+        self._pairs: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._bound: Optional[Tuple[Any, ...]] = None
+        self._shared_generation: Optional[int] = None
+        self._next_check = 0.0
+        self._check_failing = False
+        self._signal_ready: Optional[bool] = None
+    
+    def bind(self, sm) -> None:
+        """Use this security manager's metadata DB and FAB tables."""
+        self._bound = (
+            sm.get_session.get_bind(),
+            sm.role_model.permissions.property.secondary,
+            sm.permission_model.__table__,
+            sm.action_model.__table__,
+            sm.resource_model.__table__,
+            sm.user_model.roles.property.secondary,
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self._bound is not None
+    
+    def invalidate(self, *_args) -> None:
+        """Drop every cached set. Also used as a SQLAlchemy mapper event listener."""
+        with self._lock:
+            self._generation += 1
+            self._roles.clear()
+            self._unions.clear()
+            self._pairs.clear()
+    
+    def _has_signal(self, engine) -> bool:
+        """Whether ab_permission_generation exists; looked up once per process and never created here.
+        
+        The table comes from ``auth_cli.py create-tables``. Without it edits only
+        clear the cache of the process that made them and other processes wait
+        for ``ttl``, with one warning.
+        """
+        if self._signal_ready is None:
+            self._signal_ready = sqlalchemy.inspect(engine).has_table(_permission_generation_table.name)
+            if not self._signal_ready:
+                logger.warning("⚠️ [PERMISSIONS] Table %s is missing: permission edits reach other processes only "
+                               "after PERMISSION_CACHE_TTL. Run `auth_cli.py create-tables` and restart the API server",
+                               _permission_generation_table.name)
+        return self._signal_ready
+    
+    def publish(self, engine=None) -> None:
+        """Drop every cached set here and, through the shared generation, in every other process.
+        
+        Call it after the edit is committed, so no process reloads the old permissions
+        after seeing the new generation.
+        
+        Args:
+            engine: The metadata DB the edit was made in (default: the bound one). CLI
+                commands pass theirs, as they may run without a bound cache.
+        """
+        self.invalidate()
+        if engine is None:
+            if self._bound is None:
+                return
+            engine = self._bound[0]
+        table = _permission_generation_table
+        try:
+            if not self._has_signal(engine):
+                return
+            with engine.begin() as conn:
+                bumped = conn.execute(table.update().where(table.c.id == 1)
+                                      .values(generation=table.c.generation + 1)).rowcount
+                if not bumped:
+                    statement = _insert_ignore_statement(table, engine.dialect.name, 'id')
+                    conn.execute(statement if statement is not None else table.insert(), {'id': 1, 'generation': 1})
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            auth_metrics.incr('permission_cache.publish_error')
+            logger.warning("⚠️ [PERMISSIONS] Could not signal the permission change to other processes: %s", e)
+    
+    def _check_shared(self) -> None:
+        """Drop every cached set if another process published an edit since the last check."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        engine, table = self._bound[0], _permission_generation_table
+        try:
+            if not self._has_signal(engine):
+                return
+            with engine.connect() as conn:
+                generation = conn.execute(sqlalchemy.select(table.c.generation).where(table.c.id == 1)).scalar() or 0
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            # Can't tell whether anything changed: reload from the database once, and don't
+            # ask again before the next interval (a degraded DB gets no extra query per request)
+            auth_metrics.incr('permission_cache.check_error')
+            if not self._check_failing:
+                logger.warning("⚠️ [PERMISSIONS] Could not read the permission generation: %s", e)
+            self._check_failing = True
+            generation = None
+        else:
+            self._check_failing = False
+        if generation is None or generation != self._shared_generation:
+            if self._shared_generation is not None:
+                auth_metrics.incr('permission_cache.remote_invalidation')
+            self._shared_generation = generation
+            self.invalidate()
+    
+    def _load_roles(self, role_ids: List[int]) -> Dict[int, FrozenSet[Tuple[str, str]]]:
+        engine, role_permission, permission, action, resource, _ = self._bound
+        found: Dict[int, set] = {role_id: set() for role_id in role_ids}
+        query = (sqlalchemy.select(role_permission.c.role_id, action.c.name, resource.c.name)
+                 .select_from(role_permission
+                              .join(permission, permission.c.id == role_permission.c.permission_view_id)
+                              .join(action, action.c.id == permission.c.permission_id)
+                              .join(resource, resource.c.id == permission.c.view_menu_id)))
+        with engine.connect() as conn:
+            for chunk in _chunks(role_ids):
+                for role_id, action_name, resource_name in conn.execute(query.where(role_permission.c.role_id.in_(chunk))):
+                    found[role_id].add((action_name, resource_name))
+        with self._lock:
+            pairs = self._pairs
+            return {role_id: frozenset(pairs.setdefault(pair, pair) for pair in role_pairs)
+                    for role_id, role_pairs in found.items()}
+    
+    def for_roles(self, role_ids: Iterable[int]) -> FrozenSet[Tuple[str, str]]:
+        """The union of these roles' permissions."""
+        self._check_shared()
+        key = frozenset(role_ids)
+        perms = self._unions.get(key)
+        if perms is not None:
+            return perms
+        generation = self._generation
+        sets, missing = [], []
+        for role_id in key:
+            role_perms = self._roles.get(role_id)
+            if role_perms is None:
+                missing.append(role_id)
+            else:
+                sets.append(role_perms)
+        if missing:
+            auth_metrics.incr('permission_cache.role_load', len(missing))
+            loaded = self._load_roles(missing)
+            sets.extend(loaded.values())
+        perms = frozenset().union(*sets)
+        # An edit while loading leaves these possibly stale: use them once, don't keep them
+        with self._lock:
+            if generation == self._generation:
+                for role_id, role_perms in (loaded.items() if missing else ()):
+                    self._roles.set(role_id, role_perms)
+                self._unions.set(key, perms)
+        return perms
+    
+    def for_user(self, user) -> FrozenSet[Tuple[str, str]]:
+        """Permissions of a User via its (eagerly loaded) roles; one small query if they can't be read."""
+        try:
+            role_ids = [role.id for role in user.roles]
+        except sqlalchemy.exc.InvalidRequestError:  # detached before its roles were loaded
+            engine, *_, user_role = self._bound
+            with engine.connect() as conn:
+                role_ids = list(conn.execute(sqlalchemy.select(user_role.c.role_id)
+                                             .where(user_role.c.user_id == user.id)).scalars())
+        return self.for_roles(role_ids)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'roles': self._roles.stats(), 'users': self._unions.stats(), 'pairs': len(self._pairs)}
+
+permission_cache = PermissionCache()
+
+def invalidate_permission_cache(*_args) -> None:
+    """Drop all cached permission sets in this process."""
+    permission_cache.invalidate()
+
+def _permissions_edited(_mapper, _connection, target) -> None:
+    """Mapper listener for role/permission edits: drop the sets now, publish the edit once its session commits."""
+    permission_cache.invalidate()
+    session = object_session(target)
+    if session is not None:
+        session.info['permissions_edited'] = True
+
+def _publish_permission_edits(session) -> None:
+    """Session 'after_commit' listener."""
+    if session.info.pop('permissions_edited', False):
+        permission_cache.publish(session.get_bind())
+
+def _forget_permission_edits(session) -> None:
+    """Session 'after_rollback' listener: a rolled back edit has nothing to publish."""
+    session.info.pop('permissions_edited', None)
+
+
+def _invalidate_permissions_on_role_edit(_mapper, _connection, role) -> None:
+    """Role mapper 'after_update' listener: drop cached sets when a role's permissions were edited."""
+    if sqlalchemy.inspect(role).attrs.permissions.history.has_changes():
+        _permissions_edited(_mapper, _connection, role)
@@ -0,0 +1,237 @@
+"""Declarative role -> permission provisioning from role_permissions.json."""
+from __future__ import annotations
+
+import json
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterator, List, Mapping, Tuple, Optional
+
+import sqlalchemy
+from airflow.providers.fab.www.security.permissions import RESOURCE_DAG_PREFIX
+
+from .db import _chunks, _ensure_named_rows, _insert_ignore_statement
+from .mapping import _get_file_path
+from .permissions import permission_cache
+from .settings import ROLE_PERMISSIONS_FILE
+from .telemetry import logger
+
+
+# Declarative role -> permission provisioning (replaces one `airflow roles add-perms` per permission)
+
+def _permission_pairs(value: Any, where: str) -> List[Tuple[str, str]]:
+    if not isinstance(value, list) or not all(
+            isinstance(pair, list) and len(pair) == 2 and all(isinstance(v, str) and v for v in pair) for pair in value):
+        raise ValueError(f"{where} must be a list of [action, resource] pairs")
+    return [(action, resource) for action, resource in value]
+
+def _string_list(value: Any, where: str) -> List[str]:
+    if not isinstance(value, list) or not all(isinstance(v, str) and v for v in value):
+        raise ValueError(f"{where} must be a list of non-empty strings")
+    return value
+
+def expand_role_permissions(spec: Mapping[str, Any]) -> Dict[str, FrozenSet[Tuple[str, str]]]:
+    """Expand a role permission spec into the (action, resource) pairs of each role.
+    
+    Spec format (see role_permissions.json):
+        defaults.permissions: [[action, resource], ...] for every role, unless the role sets "defaults": false
+        defaults.dag_actions: actions granted on "DAG:<dag_id>" for each DAG a role lists
+        roles.<name>.permissions / .dags / .dag_actions: the role's own pairs, DAG ids and DAG actions
+    
+    Raises:
+        ValueError: if the spec is malformed.
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get('roles'), dict):
+        raise ValueError("role permission spec must be an object with a 'roles' object")
+    defaults = spec.get('defaults', {})
+    if not isinstance(defaults, dict):
+        raise ValueError("'defaults' must be an object")
+    default_pairs = _permission_pairs(defaults.get('permissions', []), "defaults.permissions")
+    default_dag_actions = _string_list(defaults.get('dag_actions', []), "defaults.dag_actions")
+    
+    expanded = {}
+    for role_name, role_spec in spec['roles'].items():
+        if not isinstance(role_spec, dict):
+            raise ValueError(f"roles.{role_name} must be an object")
+        pairs = set(default_pairs) if role_spec.get('defaults', True) else set()
+        pairs.update(_permission_pairs(role_spec.get('permissions', []), f"roles.{role_name}.permissions"))
+        dag_actions = _string_list(role_spec.get('dag_actions', default_dag_actions), f"roles.{role_name}.dag_actions")
+        for dag_id in _string_list(role_spec.get('dags', []), f"roles.{role_name}.dags"):
+            pairs.update((action, f"{RESOURCE_DAG_PREFIX}{dag_id}") for action in dag_actions)
+        expanded[role_name] = frozenset(pairs)
+    return expanded
+
+def load_role_permissions(file_path: Optional[str] = None) -> Dict[str, FrozenSet[Tuple[str, str]]]:
+    """Read and expand the role permission spec (ROLE_PERMISSIONS_FILE by default)."""
+    with open(_get_file_path(file_path or ROLE_PERMISSIONS_FILE), 'r', encoding='utf-8') as f:
+        return expand_role_permissions(json.load(f))
+
+def write_role_permissions(spec: Mapping[str, Any], file_path: Optional[str] = None) -> None:
+    """Write the role permission spec back in the file's layout (one entry per line, flat lists inline).
+    
+    Rewritten in place rather than replaced, since the file is usually a single-file bind mount.
+    """
+    text = json.dumps(spec, indent=4, ensure_ascii=False)
+    text = re.sub(r'\[\s+([^\[\]{}]*?)\s+\]', lambda m: '[' + ', '.join(v.strip() for v in m.group(1).split(',\n')) + ']', text)
+    with open(_get_file_path(file_path or ROLE_PERMISSIONS_FILE), 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+
+class RolePermissionPlan:
+    """The difference between declared and stored role permissions, as names."""
+    
+    __slots__ = ('new_roles', 'new_actions', 'new_resources', 'grants', 'revokes', 'timings')
+    
+    def __init__(self):
+        self.new_roles: List[str] = []
+        self.new_actions: List[str] = []
+        self.new_resources: List[str] = []
+        self.grants: Dict[str, List[Tuple[str, str]]] = {}
+        self.revokes: Dict[str, List[Tuple[str, str]]] = {}
+        self.timings: Dict[str, float] = {}
+    
+    def __bool__(self) -> bool:
+        return bool(self.new_roles or self.grants or self.revokes)
+    
+    def describe(self) -> Iterator[str]:
+        """Yield one line per change, e.g. '+ ProjectA: can_read on DAG:my_dag'."""
+        for name in self.new_roles:
+            yield f"+ role {name}"
+        for name in self.new_actions:
+            yield f"+ action {name}"
+        for name in self.new_resources:
+            yield f"+ resource {name}"
+        for sign, changes in (('+', self.grants), ('-', self.revokes)):
+            for role_name, pairs in changes.items():
+                for action, resource in pairs:
+                    yield f"{sign} {role_name}: {action} on {resource}"
+    
+    def summary(self) -> str:
+        timings = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in self.timings.items())
+        return (f"{len(self.new_roles)} new roles, {len(self.new_actions)} new actions, "
+                f"{len(self.new_resources)} new resources, {sum(map(len, self.grants.values()))} grants, "
+                f"{sum(map(len, self.revokes.values()))} revokes ({timings})")
+
+def diff_role_permissions(sm, desired: Mapping[str, FrozenSet[Tuple[str, str]]], prune: bool = False) -> RolePermissionPlan:
+    """Compare the declared permissions with the database using a few set-based queries.
+    
+    Only the roles in ``desired`` are looked at. Their missing pairs become
+    grants; with ``prune``, pairs they hold beyond the spec become revokes.
+    """
+    started = time.perf_counter()
+    session = sm.get_session
+    role_model, action_model, resource_model, permission_model = (
+        sm.role_model, sm.action_model, sm.resource_model, sm.permission_model)
+    assoc = role_model.permissions.property.secondary
+    role_names = list(desired)
+    
+    current: Dict[str, set] = {}
+    for chunk in _chunks(role_names):
+        current.update((name, set()) for (name,) in session.query(role_model.name).filter(role_model.name.in_(chunk)))
+        rows = (session.query(role_model.name, action_model.name, resource_model.name)
+                .join(assoc, assoc.c.role_id == role_model.id)
+                .join(permission_model, permission_model.id == assoc.c.permission_view_id)
+                .join(action_model, action_model.id == permission_model.action_id)
+                .join(resource_model, resource_model.id == permission_model.resource_id)
+                .filter(role_model.name.in_(chunk)))
+        for role_name, action, resource in rows:
+            current[role_name].add((action, resource))
+    
+    plan = RolePermissionPlan()
+    plan.new_roles = [name for name in role_names if name not in current]
+    for role_name, pairs in desired.items():
+        held = current.get(role_name, set())
+        if pairs - held:
+            plan.grants[role_name] = sorted(pairs - held)
+        if prune and held - pairs:
+            plan.revokes[role_name] = sorted(held - pairs)
+    
+    granted = {pair for pairs in plan.grants.values() for pair in pairs}
+    for names, model, attr in ((sorted({a for a, _ in granted}), action_model, 'new_actions'),
+                               (sorted({r for _, r in granted}), resource_model, 'new_resources')):
+        existing = set()
+        for chunk in _chunks(names):
+            existing.update(name for (name,) in session.query(model.name).filter(model.name.in_(chunk)))
+        setattr(plan, attr, [name for name in names if name not in existing])
+    session.rollback()
+    plan.timings['diff'] = time.perf_counter() - started
+    return plan
+
+def apply_role_permissions(sm, plan: RolePermissionPlan) -> None:
+    """Write a plan in one transaction: missing roles/actions/resources/permissions, then grants and revokes.
+    
+    Any failure rolls the whole plan back.
+    """
+    started = time.perf_counter()
+    session = sm.get_session
+    dialect_name = session.get_bind().dialect.name
+    permission_table = sm.permission_model.__table__
+    assoc = sm.role_model.permissions.property.secondary
+    changes = [(role_name, pair, True) for role_name, pairs in plan.grants.items() for pair in pairs]
+    changes += [(role_name, pair, False) for role_name, pairs in plan.revokes.items() for pair in pairs]
+    try:
+        role_ids = _ensure_named_rows(session, sm.role_model.__table__, sorted(set(plan.new_roles) | {r for r, _, _ in changes}), dialect_name)
+        action_ids = _ensure_named_rows(session, sm.action_model.__table__, sorted({a for _, (a, _), _ in changes}), dialect_name)
+        resource_ids = _ensure_named_rows(session, sm.resource_model.__table__, sorted({r for _, (_, r), _ in changes}), dialect_name)
+        
+        # Permission (action, resource) rows: fetch the existing ones, create the missing grants
+        wanted = {(action_ids[a], resource_ids[r]) for _, (a, r), _ in changes}
+        columns = (permission_table.c.permission_id, permission_table.c.view_menu_id)
+        permission_ids: Dict[Tuple[int, int], int] = {}
+        
+        def fetch_permissions(pairs):
+            action_filter = permission_table.c.permission_id.in_(sorted({a for a, _ in pairs}))
+            for chunk in _chunks(sorted({r for _, r in pairs})):
+                for action_id, resource_id, permission_id in session.execute(
+                        sqlalchemy.select(*columns, permission_table.c.id)
+                        .where(action_filter, permission_table.c.view_menu_id.in_(chunk))):
+                    if (action_id, resource_id) in pairs:
+                        permission_ids[(action_id, resource_id)] = permission_id
+        
+        if wanted:
+            fetch_permissions(wanted)
+        missing = sorted({(action_ids[a], resource_ids[r]) for _, (a, r), grant in changes if grant} - set(permission_ids))
+        if missing:
+            statement = _insert_ignore_statement(permission_table, dialect_name, 'permission_id', 'view_menu_id')
+            session.execute(statement if statement is not None else permission_table.insert(),
+                            [{'permission_id': a, 'view_menu_id': r} for a, r in missing])
+            fetch_permissions(set(missing))
+        
+        # Role <-> permission links
+        links = [{'role_id': role_ids[role_name], 'permission_view_id': permission_ids[(action_ids[a], resource_ids[r])]}
+                 for role_name, (a, r), grant in changes if grant]
+        if links:
+            statement = _insert_ignore_statement(assoc, dialect_name, 'permission_view_id', 'role_id')
+            session.execute(statement if statement is not None else assoc.insert(), links)
+        unlinks = defaultdict(list)
+        for role_name, (a, r), grant in changes:
+            permission_id = permission_ids.get((action_ids[a], resource_ids[r]))
+            if not grant and permission_id is not None:
+                unlinks[role_ids[role_name]].append(permission_id)
+        for role_id, ids in unlinks.items():
+            for chunk in _chunks(ids):
+                session.execute(assoc.delete().where(assoc.c.role_id == role_id, assoc.c.permission_view_id.in_(chunk)))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    permission_cache.publish(session.get_bind())
+    plan.timings['apply'] = time.perf_counter() - started
+
+def provision_role_permissions(sm, desired: Mapping[str, FrozenSet[Tuple[str, str]]], prune: bool = False,
+                               dry_run: bool = False) -> RolePermissionPlan:
+    """Bring the roles in ``desired`` in line with their declared permissions.
+    
+    Args:
+        sm: The security manager (its session and FAB models are used)
+        desired: role name -> (action, resource) pairs, e.g. from load_role_permissions()
+        prune: Also revoke permissions the spec doesn't declare for these roles
+        dry_run: Only compute the plan
+    
+    Returns:
+        The plan, with per-phase timings
+    """
+    plan = diff_role_permissions(sm, desired, prune)
+    if plan and not dry_run:
+        apply_role_permissions(sm, plan)
+        logger.info("🔐 [PROVISION] Applied %s", plan.summary())
+    return plan
@@ -0,0 +1,365 @@
+"""Users' last-seen claims and background role reconciliation after mapping changes."""
+from __future__ import annotations
+
+import os
+import re
+import time
+import hashlib
+import fcntl
+import struct
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Optional
+
+import sqlalchemy
+
+from .caching import TTLCache
+from .db import _chunks, _ensure_named_rows, _insert_ignore_statement
+from .mapping import CompiledRoleMappings, _is_rule_key, map_claims
+from .mapping_loader import get_role_mappings
+from .permissions import permission_cache
+from .settings import (
+    ROLE_CACHE_TTL, ROLE_MAPPING_METHOD, ROLE_RECONCILE_BATCH_SIZE, ROLE_RECONCILE_LOCK_FILE,
+    USER_INFO_CACHE_SIZE,
+)
+from .telemetry import auth_metrics, logger
+from .user_info import user_info_cache
+
+
+# Users' last-seen claims and background role reconciliation after mapping changes
+
+# Claims blob: u32 count, that many 16-byte UUIDs (Entra group/app-role ids), then the
+# remaining claims as NUL-separated UTF-8. ~16 bytes per group instead of ~40 as JSON.
+_CLAIMS_HEADER = struct.Struct('<I')
+_CLAIMS_UUID_SIZE = 16
+_CLAIMS_SCAN_MAX_KEYS = 64  # above this many changed UUIDs, match by slicing instead of find()
+
+_user_claims_table = sqlalchemy.Table(
+    'ab_user_claims',
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column('user_id', sqlalchemy.Integer, primary_key=True, autoincrement=False),
+    sqlalchemy.Column('method', sqlalchemy.String(16), nullable=False),
+    sqlalchemy.Column('claims', sqlalchemy.LargeBinary, nullable=False),
+    sqlalchemy.Column('updated_at', sqlalchemy.Float, nullable=False),
+)
+
+_CANONICAL_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z')
+
+def _packed_uuid(claim: str) -> Optional[bytes]:
+    """16 raw bytes if claim is a canonical (lower-case, hyphenated) UUID string."""
+    if len(claim) != 36 or not _CANONICAL_UUID.match(claim):
+        return None
+    return bytes.fromhex(claim.replace('-', ''))
+
+def _unpacked_uuid(raw: bytes) -> str:
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+def encode_claims(claims: Iterable[str]) -> bytes:
+    """Pack claims for ab_user_claims (order is not preserved, duplicates are dropped)."""
+    packed, others = [], []
+    for claim in dict.fromkeys(claims):
+        raw = _packed_uuid(claim)
+        if raw is not None:
+            packed.append(raw)
+        else:
+            others.append(claim)
+    return _CLAIMS_HEADER.pack(len(packed)) + b''.join(packed) + '\0'.join(others).encode('utf-8')
+
+def decode_claims(blob: bytes) -> List[str]:
+    (count,) = _CLAIMS_HEADER.unpack_from(blob)
+    end = _CLAIMS_HEADER.size + count * _CLAIMS_UUID_SIZE
+    claims = [_unpacked_uuid(blob[i:i + _CLAIMS_UUID_SIZE]) for i in range(_CLAIMS_HEADER.size, end, _CLAIMS_UUID_SIZE)]
+    if len(blob) > end:
+        claims.extend(blob[end:].decode('utf-8').split('\0'))
+    return claims
+
+class ClaimsMatcher:
+    """Tests packed claim blobs for any of a set of claims without decoding them.
+    
+    UUID claims are found with ``bytes.find`` on the packed section (a hit only
+    counts at a 16-byte boundary); with many changed keys the packed UUIDs are
+    sliced and looked up in a set instead.
+    """
+    
+    __slots__ = ('packed', 'others')
+    
+    def __init__(self, claims: Iterable[str]):
+        packed, others = set(), set()
+        for claim in claims:
+            raw = _packed_uuid(claim)
+            if raw is not None:
+                packed.add(raw)
+            else:
+                others.add(claim)
+        self.packed = frozenset(packed)
+        self.others = frozenset(others)
+    
+    def __bool__(self) -> bool:
+        return bool(self.packed or self.others)
+    
+    def matches(self, blob: bytes) -> bool:
+        (count,) = _CLAIMS_HEADER.unpack_from(blob)
+        start = _CLAIMS_HEADER.size
+        end = start + count * _CLAIMS_UUID_SIZE
+        if count and self.packed:
+            if len(self.packed) > _CLAIMS_SCAN_MAX_KEYS:
+                if not self.packed.isdisjoint(blob[i:i + _CLAIMS_UUID_SIZE] for i in range(start, end, _CLAIMS_UUID_SIZE)):
+                    return True
+            else:
+                for needle in self.packed:
+                    pos = blob.find(needle, start, end)
+                    while pos != -1:
+                        if (pos - start) % _CLAIMS_UUID_SIZE == 0:
+                            return True
+                        pos = blob.find(needle, pos + 1, end)
+        return bool(self.others) and len(blob) > end and not self.others.isdisjoint(blob[end:].decode('utf-8').split('\0'))
+
+def _user_claims_upsert_statement(dialect_name: str):
+    """INSERT that overwrites the row only when the claims changed; None if the dialect has no upsert."""
+    table = _user_claims_table
+    if dialect_name in ("postgresql", "sqlite"):
+        if dialect_name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        excluded = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={'method': excluded.method, 'claims': excluded.claims, 'updated_at': excluded.updated_at},
+            where=(table.c.method != excluded.method) | (table.c.claims != excluded.claims),
+        )
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        return statement.on_duplicate_key_update(
+            method=statement.inserted.method, claims=statement.inserted.claims, updated_at=statement.inserted.updated_at,
+        )
+    return None
+
+def _write_user_claims(conn, dialect_name: str, user_id: int, blob: bytes) -> None:
+    """Upsert a user's claims row through a Session or Connection."""
+    row = {'user_id': user_id, 'method': ROLE_MAPPING_METHOD, 'claims': blob, 'updated_at': time.time()}
+    statement = _user_claims_upsert_statement(dialect_name)
+    if statement is None:
+        conn.execute(_user_claims_table.delete().where(_user_claims_table.c.user_id == user_id))
+        statement = _user_claims_table.insert()
+    conn.execute(statement, row)
+
+
+class RoleReconciler:
+    """Re-applies a changed role mapping to existing users without waiting for their next login.
+    
+    The watcher hands over the keys that changed between two mapping versions.
+    A background thread scans ab_user_claims (the claims each user last logged in
+    with) for those keys, recomputes the roles of just the affected users and
+    writes the difference with set-based INSERT/DELETE on ab_user_role,
+    ROLE_RECONCILE_BATCH_SIZE users per transaction. A wildcard/prefix rule change
+    (or a pruned store change log) re-checks every user.
+    
+    Workers on a host serialize on ROLE_RECONCILE_LOCK_FILE, which also records
+    the last reconciled (mapping version, changed keys), so the same change seen
+    by every worker's watcher is written once.
+    """
+    
+    def __init__(self, batch_size: int = ROLE_RECONCILE_BATCH_SIZE, lock_file: str = ROLE_RECONCILE_LOCK_FILE):
+        self.batch_size = batch_size
+        self.lock_file = lock_file
+        self.pid: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._bound: Optional[Tuple[Any, ...]] = None
+        self._claims_table: Optional[bool] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+    
+    def claims_table_ready(self, engine) -> bool:
+        """Whether ab_user_claims exists; looked up once per process and never created here.
+        
+        The table comes from ``auth_cli.py create-tables``. Without it logins skip
+        recording claims and the reconciler stays unbound, with one warning.
+        """
+        if self._claims_table is None:
+            try:
+                self._claims_table = sqlalchemy.inspect(engine).has_table(_user_claims_table.name)
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                logger.warning("⚠️ [RECONCILE] Could not look up table %s: %s", _user_claims_table.name, e)
+                return False
+            if not self._claims_table:
+                logger.warning("⚠️ [RECONCILE] Table %s is missing: logins don't record claims and roles are not "
+                               "reconciled. Run `auth_cli.py create-tables` and restart the API server",
+                               _user_claims_table.name)
+        return self._claims_table
+    
+    @property
+    def bound(self) -> bool:
+        return self._bound is not None
+    
+    def bind(self, sm) -> "RoleReconciler":
+        """Use this security manager's metadata DB; stays unbound if ab_user_claims is missing."""
+        engine = sm.get_session.get_bind()
+        if self.claims_table_ready(engine):
+            self._bound = (engine, sm.user_model.__table__, sm.role_model.__table__, sm.user_model.roles.property.secondary)
+        return self
+    
+    def submit(self, changed_keys) -> Optional[Any]:
+        """Queue a reconciliation; ``changed_keys()`` is evaluated on the background thread.
+        
+        Returns:
+            The Future, or None if the reconciler is not bound to a database
+        """
+        if self._bound is None:
+            return None
+        with self._lock:
+            if self._executor is None or self.pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="role-reconcile")
+                self.pid = os.getpid()
+            executor = self._executor
+        return executor.submit(self._run, changed_keys)
+    
+    def _run(self, changed_keys) -> Optional[Dict[str, Any]]:
+        try:
+            keys = changed_keys()
+            if keys is not None and any(_is_rule_key(key) for key in keys):
+                keys = None
+            if keys is not None and not keys:
+                return None
+            # Always the latest mapping: a queued older diff still needs the newest roles
+            compiled = get_role_mappings()
+            marker = f"{compiled.version!r} " + (
+                hashlib.blake2b('\0'.join(sorted(keys)).encode(), digest_size=16).hexdigest() if keys is not None else "all")
+            lock = open(self.lock_file, 'a+', encoding='utf-8') if self.lock_file else None
+            try:
+                if lock is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    lock.seek(0)
+                    if lock.read() == marker:
+                        auth_metrics.incr('reconcile.skipped')
+                        return None
+                result = self.reconcile(compiled, keys)
+                if lock is not None:
+                    lock.seek(0)
+                    lock.truncate()
+                    lock.write(marker)
+                    lock.flush()
+            finally:
+                if lock is not None:
+                    lock.close()
+        except Exception as e:
+            auth_metrics.incr('reconcile.error')
+            logger.error("❌ [RECONCILE] Role reconciliation failed: %s", e)
+            return None
+        logger.info("🔐 [RECONCILE] %s of %s affected users updated (+%s/-%s roles, %s scanned) in %.0fms",
+                    result['users_changed'], result['affected'], result['added'], result['removed'],
+                    result['scanned'], result['duration_ms'])
+        return result
+    
+    def affected_users(self, compiled: CompiledRoleMappings, changed_keys: Optional[Iterable[str]] = None,
+                       stats: Optional[Dict[str, Any]] = None) -> Dict[int, FrozenSet[str]]:
+        """user id -> target role names, for users whose last-seen claims hit changed_keys (None: all)."""
+        engine, user_table, _, _ = self._bound
+        claims = _user_claims_table
+        matcher = ClaimsMatcher(changed_keys) if changed_keys is not None else None
+        interned: Dict[FrozenSet[str], FrozenSet[str]] = {}
+        targets: Dict[int, FrozenSet[str]] = {}
+        scanned = 0
+        query = (sqlalchemy.select(claims.c.user_id, claims.c.claims)
+                 .select_from(claims.join(user_table, user_table.c.id == claims.c.user_id))
+                 .where(claims.c.method == ROLE_MAPPING_METHOD))
+        with engine.connect() as conn:
+            for user_id, blob in conn.execution_options(yield_per=self.batch_size).execute(query):
+                scanned += 1
+                blob = bytes(blob)
+                if matcher is not None and not matcher.matches(blob):
+                    continue
+                roles = frozenset(map_claims(compiled, ROLE_MAPPING_METHOD, decode_claims(blob))[0])
+                targets[user_id] = interned.setdefault(roles, roles)
+        if stats is not None:
+            stats['scanned'] = scanned
+        return targets
+    
+    def reconcile(self, compiled: CompiledRoleMappings, changed_keys: Optional[Iterable[str]] = None,
+                  dry_run: bool = False) -> Dict[str, Any]:
+        """Bring the stored roles of affected users in line with compiled.
+        
+        Args:
+            compiled: The mappings to apply
+            changed_keys: Mapping keys that changed; None re-checks every user with stored claims
+            dry_run: Count the changes without writing them
+        
+        Returns:
+            Counters: scanned, affected, users_changed, added, removed, duration_ms
+        """
+        started = time.perf_counter()
+        stats: Dict[str, Any] = {'scanned': 0, 'affected': 0, 'users_changed': 0, 'added': 0, 'removed': 0}
+        targets = self.affected_users(compiled, changed_keys, stats)
+        stats['affected'] = len(targets)
+        user_ids = list(targets)
+        for batch in _chunks(user_ids, self.batch_size):
+            changed_users, added, removed = self._apply_batch({user_id: targets[user_id] for user_id in batch}, dry_run)
+            stats['users_changed'] += len(changed_users)
+            stats['added'] += added
+            stats['removed'] += removed
+            if changed_users and not dry_run:
+                user_info_cache.discard_if(lambda entry: entry.user_id in changed_users)
+        if stats['users_changed'] and not dry_run:
+            permission_cache.publish(self._bound[0])
+        stats['duration_ms'] = (time.perf_counter() - started) * 1000
+        if not dry_run:
+            auth_metrics.incr('reconcile.run')
+            auth_metrics.incr('reconcile.users_changed', stats['users_changed'])
+            auth_metrics.observe('reconcile', stats['duration_ms'])
+        self.last_result = stats
+        return stats
+    
+    def _apply_batch(self, targets: Dict[int, FrozenSet[str]], dry_run: bool) -> Tuple[set, int, int]:
+        """One transaction: add missing and delete extra ab_user_role rows for these users."""
+        engine, _, role_table, user_role = self._bound
+        dialect_name = engine.dialect.name
+        role_names = sorted(set().union(*targets.values()))
+        with engine.begin() as conn:
+            if dry_run:
+                role_ids = {}
+                for chunk in _chunks(role_names):
+                    role_ids.update(conn.execute(
+                        sqlalchemy.select(role_table.c.name, role_table.c.id).where(role_table.c.name.in_(chunk))).all())
+            else:
+                role_ids = _ensure_named_rows(conn, role_table, role_names, dialect_name)
+            
+            held: Dict[int, set] = defaultdict(set)
+            for chunk in _chunks(list(targets)):
+                for user_id, role_id in conn.execute(
+                        sqlalchemy.select(user_role.c.user_id, user_role.c.role_id).where(user_role.c.user_id.in_(chunk))):
+                    held[user_id].add(role_id)
+            
+            adds: List[Dict[str, int]] = []
+            removes: Dict[int, List[int]] = defaultdict(list)
+            changed_users = set()
+            wanted_by_roles: Dict[FrozenSet[str], set] = {}
+            for user_id, roles in targets.items():
+                wanted = wanted_by_roles.get(roles)
+                if wanted is None:
+                    # Roles a dry run would create have no id yet: keep their name as a placeholder
+                    wanted = wanted_by_roles[roles] = {role_ids.get(name, name) for name in roles}
+                current = held[user_id]
+                if current == wanted:
+                    continue
+                changed_users.add(user_id)
+                adds.extend({'user_id': user_id, 'role_id': role_id} for role_id in wanted - current)
+                for role_id in current - wanted:
+                    removes[role_id].append(user_id)
+            
+            if not dry_run:
+                if adds:
+                    statement = _insert_ignore_statement(user_role, dialect_name, 'user_id', 'role_id')
+                    conn.execute(statement if statement is not None else user_role.insert(), adds)
+                for role_id, user_ids in removes.items():
+                    for chunk in _chunks(user_ids):
+                        conn.execute(user_role.delete().where(user_role.c.role_id == role_id, user_role.c.user_id.in_(chunk)))
+        return changed_users, len(adds), sum(map(len, removes.values()))
+
+role_reconciler = RoleReconciler()
+
+# user id -> claims blob this worker last stored, so unchanged claims are not rewritten on every login
+_recorded_claims = TTLCache(USER_INFO_CACHE_SIZE, ROLE_CACHE_TTL)
@@ -0,0 +1,216 @@
+"""Offline replay of captured claims through an old and a new role mapping."""
+from __future__ import annotations
+
+import os
+import json
+import time
+import itertools
+import sqlite3
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Mapping, Tuple, Optional
+
+from .graph import GraphGroupResolver
+from .mapping import CompiledRoleMappings, _get_file_path, map_claims, readable_username, token_claims
+from .mapping_loader import _compile_role_mapping_file
+from .mapping_store import RoleMappingStore, _is_role_mapping_store
+from .settings import ROLE_MAPPING_METHOD
+
+
+# Offline replay of captured claims through an old and a new mapping (replay-claims)
+
+def load_role_mapping_file(file_path: str) -> CompiledRoleMappings:
+    """Load a mapping outside the worker cache: a JSON file is compiled, a SQLite store opened read-only."""
+    path = _get_file_path(file_path)
+    if _is_role_mapping_store(path):
+        return RoleMappingStore(path)
+    return _compile_role_mapping_file(path, path.stat().st_mtime)
+
+
+class ClaimReplayReport:
+    """Per-mode counts from resolving the same claim sets with an old and a new mapping."""
+    
+    __slots__ = ('records', 'changed', 'overage', 'default_before', 'default_after', 'before', 'after', 'gained', 'lost')
+    
+    def __init__(self):
+        self.records = 0
+        self.changed = 0
+        self.overage = 0          # groups overage tokens: resolved offline without the Graph lookup
+        self.default_before = 0
+        self.default_after = 0
+        self.before: Counter = Counter()  # role -> records holding it with the old mapping
+        self.after: Counter = Counter()
+        self.gained: Counter = Counter()
+        self.lost: Counter = Counter()
+    
+    def merge(self, other: "ClaimReplayReport") -> None:
+        for name in ('records', 'changed', 'overage', 'default_before', 'default_after'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in ('before', 'after', 'gained', 'lost'):
+            getattr(self, name).update(getattr(other, name))
+    
+    def as_dict(self) -> Dict[str, Any]:
+        roles = sorted(set(self.before) | set(self.after))
+        return {
+            'records': self.records,
+            'changed': self.changed,
+            'overage': self.overage,
+            'default_role': {'before': self.default_before, 'after': self.default_after},
+            'roles': {
+                role: {'before': self.before[role], 'after': self.after[role],
+                       'gained': self.gained[role], 'lost': self.lost[role]}
+                for role in roles
+            },
+        }
+
+
+# Mappings loaded once per pool process by _replay_init
+_replay_mappings: Dict[str, CompiledRoleMappings] = {}
+
+def _replay_init(old_file: str, new_file: str) -> None:
+    _replay_mappings['old'] = load_role_mapping_file(old_file)
+    _replay_mappings['new'] = load_role_mapping_file(new_file)
+
+def _replay_claims_of(record: Any) -> Tuple[Mapping[str, Any], Mapping[str, Any]]:
+    """(id_token_claims, userinfo) of a captured OAuth response, or of a bare claims object.
+    
+    Raises:
+        ValueError: If the record, its claims or their roles/groups don't have the token's shape
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    if 'id_token_claims' in record or 'userinfo' in record:
+        id_token_claims, userinfo = record.get('id_token_claims') or {}, record.get('userinfo') or {}
+    else:
+        id_token_claims, userinfo = record, {}
+    for claims in (id_token_claims, userinfo):
+        if not isinstance(claims, dict):
+            raise ValueError("claims are not objects")
+        for claim_name in ('roles', 'groups'):
+            values = claims.get(claim_name)
+            if values is not None and not (isinstance(values, list) and all(isinstance(value, str) for value in values)):
+                raise ValueError(f"'{claim_name}' is not a list of strings")
+    return id_token_claims, userinfo
+
+def replay_claim_lines(lines: List[str], methods: Tuple[str, ...]) -> Tuple[int, Dict[str, ClaimReplayReport], List[Dict[str, Any]]]:
+    """Resolve a chunk of JSONL claim records with both mappings (runs in a pool process).
+    
+    Returns:
+        Tuple of (invalid lines, method -> report, one change record per user whose roles differ)
+    """
+    old, new = _replay_mappings['old'], _replay_mappings['new']
+    reports = {method: ClaimReplayReport() for method in methods}
+    changes: List[Dict[str, Any]] = []
+    invalid = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            id_token_claims, userinfo = _replay_claims_of(json.loads(line))
+        except ValueError:
+            invalid += 1
+            continue
+        for method in methods:
+            report = reports[method]
+            report.records += 1
+            claim_name, claims = token_claims(method, id_token_claims, userinfo)
+            if claim_name == "groups" and not claims and GraphGroupResolver.has_overage(id_token_claims):
+                report.overage += 1
+            before, _, default_before = map_claims(old, method, claims)
+            after, _, default_after = map_claims(new, method, claims)
+            report.default_before += default_before
+            report.default_after += default_after
+            report.before.update(before)
+            report.after.update(after)
+            before_set, after_set = set(before), set(after)
+            if before_set == after_set:
+                continue
+            report.changed += 1
+            added, removed = sorted(after_set - before_set), sorted(before_set - after_set)
+            report.gained.update(added)
+            report.lost.update(removed)
+            changes.append({
+                'method': method,
+                'user': readable_username(id_token_claims, userinfo),
+                'oid': id_token_claims.get('oid') or userinfo.get('oid'),
+                'before': sorted(before_set),
+                'after': sorted(after_set),
+                'added': added,
+                'removed': removed,
+            })
+    return invalid, reports, changes
+
+def replay_claims(claims_file: str, old_file: str, new_file: str, methods: Iterable[str] = (ROLE_MAPPING_METHOD,),
+                  workers: Optional[int] = None, chunk_size: int = 2000, changes_file: Optional[str] = None) -> Dict[str, Any]:
+    """Replay a JSONL file of captured claims through an old and a new mapping.
+    
+    Lines are read in chunks of ``chunk_size`` and resolved by a pool of
+    ``workers`` processes (default: one per core), each with its own copy of both
+    mappings. At most two chunks per process are in flight and results are
+    folded into counters as they arrive, so memory stays flat however long the
+    file is. Each line is a captured OAuth response (``id_token_claims`` /
+    ``userinfo``) or a bare claims object.
+    
+    Args:
+        claims_file: JSONL of claim sets (redacted: only roles/groups and name claims are read)
+        old_file, new_file: Mapping files (JSON or SQLite store); relative paths are relative to the cwd
+        methods: "role" and/or "group"
+        workers: Pool size
+        chunk_size: Lines per task
+        changes_file: If given, one JSON line per user whose roles differ
+    
+    Returns:
+        Report: records, invalid lines, per-method counts and per-role before/after/gained/lost
+    
+    Raises:
+        ValueError: If either mapping cannot be loaded.
+    """
+    # Relative paths are relative to the caller's cwd (like claims_file), and workers
+    # get absolute ones. Both mappings are loaded here first, so a bad file is one
+    # clear error instead of a failing initializer in every pool process.
+    claims_file, old_file, new_file = (os.path.abspath(path) for path in (claims_file, old_file, new_file))
+    for path in (old_file, new_file):
+        try:
+            load_role_mapping_file(path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            raise ValueError(f"Cannot load role mapping {path}: {e}") from e
+    
+    methods = tuple(dict.fromkeys(methods))
+    workers = workers or os.cpu_count() or 1
+    reports = {method: ClaimReplayReport() for method in methods}
+    invalid = 0
+    started = time.perf_counter()
+    
+    def collect(future, out) -> None:
+        nonlocal invalid
+        chunk_invalid, chunk_reports, changes = future.result()
+        invalid += chunk_invalid
+        for method, report in chunk_reports.items():
+            reports[method].merge(report)
+        if out is not None:
+            for change in changes:
+                out.write(json.dumps(change, ensure_ascii=False) + "\n")
+    
+    with open(claims_file, 'r', encoding='utf-8') as f, \
+            open(changes_file, 'w', encoding='utf-8') if changes_file else nullcontext() as out, \
+            ProcessPoolExecutor(workers, initializer=_replay_init, initargs=(old_file, new_file)) as pool:
+        pending: deque = deque()
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            pending.append(pool.submit(replay_claim_lines, lines, methods))
+            if len(pending) >= workers * 2:
+                collect(pending.popleft(), out)
+        while pending:
+            collect(pending.popleft(), out)
+    
+    return {
+        'old_mapping': str(old_file),
+        'new_mapping': str(new_file),
+        'invalid_lines': invalid,
+        'workers': workers,
+        'duration_s': round(time.perf_counter() - started, 3),
+        'methods': {method: report.as_dict() for method, report in reports.items()},
+    }
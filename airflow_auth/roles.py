@@ -0,0 +1,57 @@
+"""Per-worker cache of Airflow role name -> role id and coalesced role creation."""
+from __future__ import annotations
+
+import time
+import threading
+from typing import Any, Dict, FrozenSet, Iterable
+
+import sqlalchemy
+
+from .caching import SingleFlight
+from .settings import ROLE_CACHE_TTL
+from .user_info import invalidate_user_info_cache
+
+
+# Coalesces concurrent creation of the same role name within a worker
+_role_creation_flight = SingleFlight()
+
+# Per-worker cache of Airflow role name -> role id
+_role_cache = {
+    'ids': {},
+    'timestamp': 0
+}
+_role_cache_lock = threading.Lock()
+
+def invalidate_role_cache(*_args) -> None:
+    """Drop all cached role ids. Also used as a SQLAlchemy mapper event listener."""
+    with _role_cache_lock:
+        _role_cache.update({'ids': {}, 'timestamp': 0})
+
+def _invalidate_role_cache_on_rename(_mapper, _connection, role) -> None:
+    """Mapper 'after_update' listener: invalidate only when the role name changed."""
+    if sqlalchemy.inspect(role).attrs.name.history.has_changes():
+        invalidate_role_cache()
+        invalidate_user_info_cache()
+
+def _cached_role_ids() -> Dict[str, int]:
+    """Return the cached name -> id map, or an empty map once ROLE_CACHE_TTL has expired.
+    
+    The TTL bounds staleness for roles created or deleted by other workers; changes
+    made in this worker invalidate the cache immediately.
+    """
+    if time.time() - _role_cache['timestamp'] >= ROLE_CACHE_TTL:
+        return {}
+    return _role_cache['ids']
+
+def _cache_role_ids(roles: Iterable[Any]) -> None:
+    """Add (persistent) Role objects to the name -> id cache."""
+    with _role_cache_lock:
+        ids = dict(_cached_role_ids())
+        if not ids:
+            _role_cache['timestamp'] = time.time()
+        ids.update((role.name, role.id) for role in roles)
+        _role_cache['ids'] = ids
+
+def _role_fingerprint(role_names: Iterable[str]) -> FrozenSet[str]:
+    """Order-insensitive fingerprint of a role set, used to detect unchanged role assignments."""
+    return frozenset(role_names)
@@ -0,0 +1,710 @@
+"""FAB security manager mapping Azure AD app roles / groups to Airflow roles."""
+from __future__ import annotations
+
+import os
+import logging
+import time
+import datetime
+import random
+import threading
+
+import jwt
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from airflow.providers.fab.auth_manager.security_manager.override import FabAirflowSecurityManagerOverride
+
+from .db import _insert_ignore_statement
+from .graph import GraphGroupResolver, graph_groups
+from .jwks import _verified_id_token, jwks_cache
+from .mapping import map_claims, readable_username, token_claims
+from .mapping_loader import get_role_mappings, load_compiled_role_mappings, start_role_mapping_watcher
+from .permissions import (
+    _forget_permission_edits, _invalidate_permissions_on_role_edit,
+    _permissions_edited, _publish_permission_edits, permission_cache,
+)
+from .reconcile import (
+    _recorded_claims, _user_claims_table, _write_user_claims, encode_claims, role_reconciler,
+)
+from .roles import (
+    _cache_role_ids, _cached_role_ids, _invalidate_role_cache_on_rename, _role_creation_flight,
+    _role_fingerprint, invalidate_role_cache,
+)
+from .settings import (
+    AUTH_LOG_SAMPLE_RATE, AUTH_USER_REGISTRATION_ROLE, AZURE_ISSUER, AZURE_VERIFY_ID_TOKEN,
+    GRAPH_GROUPS_OVERAGE, LOGIN_STATS_INTERVAL, ROLE_MAPPING_METHOD, ROLE_RECONCILE_ENABLED, USER_INFO_CACHE_TTL,
+)
+from .telemetry import LoginAudit, _LazyJson, auth_metrics, logger
+from .user_info import (
+    CachedUserInfo, _invalidate_user_info_for_user, _invalidate_user_info_on_role_edit,
+    invalidate_user_info_cache, user_info_cache, user_info_cache_key,
+)
+
+
+# The cache entry of the login in progress on this thread (get_oauth_user_info -> auth_user_oauth)
+_cached_login = threading.local()
+
+# Process that ran CustomSecurityManager.warm_up (re-run in a child forked after it)
+_warm_up_state = {'pid': None}
+_warm_up_lock = threading.Lock()
+
+
+# Custom SecurityManager for mapping Azure AD AppRole to Airflow Role
+class CustomSecurityManager(FabAirflowSecurityManagerOverride):
+    def __init__(self, appbuilder):
+        super().__init__(appbuilder)
+        # A role rename/delete in this worker (UI, API, CLI) invalidates the role cache.
+        # Inserts can't make a cached name -> id stale, and permission syncs only touch
+        # the role's permissions, so neither drops the warmed cache. Role renames/deletes
+        # also drop the memoized user_info, user role edits/deletes that user's entries.
+        # AzureFabAuthManager's checks read the permission cache, which role
+        # permission edits and permission/action/resource changes clear here and, once
+        # committed, in every other process through the shared permission generation.
+        for model, event_name, listener in ((self.role_model, 'after_update', _invalidate_role_cache_on_rename),
+                                            (self.role_model, 'after_delete', invalidate_role_cache),
+                                            (self.role_model, 'after_delete', invalidate_user_info_cache),
+                                            (self.user_model, 'after_update', _invalidate_user_info_on_role_edit),
+                                            (self.user_model, 'after_delete', _invalidate_user_info_for_user),
+                                            (self.role_model, 'after_update', _invalidate_permissions_on_role_edit),
+                                            (self.role_model, 'after_delete', _permissions_edited),
+                                            (self.permission_model, 'after_update', _permissions_edited),
+                                            (self.permission_model, 'after_delete', _permissions_edited),
+                                            (self.action_model, 'after_update', _permissions_edited),
+                                            (self.resource_model, 'after_update', _permissions_edited),
+                                            (self.resource_model, 'after_delete', _permissions_edited),
+                                            (Session, 'after_commit', _publish_permission_edits),
+                                            (Session, 'after_rollback', _forget_permission_edits)):
+            if not event.contains(model, event_name, listener):
+                event.listen(model, event_name, listener)
+        permission_cache.bind(self)
+        # No warm-up here: CLI commands build the security manager too. API server workers
+        # run warm_up as they start (AzureFabAuthManager.get_fastapi_app).
+    
+    def _warm_up_once(self):
+        """Run warm_up once per process (a worker forked after it runs its own)."""
+        if _warm_up_state['pid'] == os.getpid():
+            return
+        with _warm_up_lock:
+            if _warm_up_state['pid'] != os.getpid():
+                self.warm_up()
+                _warm_up_state['pid'] = os.getpid()
+    
+    def warm_up(self):
+        """
+        Prepare this worker for logins: each API server worker runs it at startup, before
+        serving requests (AzureFabAuthManager, AUTH_WARM_UP_ON_START).
+        
+        Phases (each timed and logged):
+            mapping: load and compile role_mapping.json (and start the watcher)
+            roles:   create every role targeted by role_mapping/group_mapping in one transaction
+            cache:   fetch the target roles with one query and fill the role cache
+            jwks:    load signing keys (shared file or network) and start the refresh thread
+            reconcile: bind the role reconciler (if ab_user_claims exists)
+        
+        Failures are logged with their traceback, counted as ``warmup.error`` and not
+        raised; logins fall back to lazy loading and creation.
+        """
+        timings = {}
+        try:
+            started = time.perf_counter()
+            watcher = start_role_mapping_watcher()
+            compiled = get_role_mappings() if watcher else load_compiled_role_mappings()
+            timings['mapping'] = time.perf_counter() - started
+            
+            target_roles = sorted(compiled.target_roles | {AUTH_USER_REGISTRATION_ROLE})
+            
+            started = time.perf_counter()
+            _role_creation_flight.do_many(target_roles, self._upsert_roles)
+            timings['roles'] = time.perf_counter() - started
+            
+            started = time.perf_counter()
+            roles = self.get_session.query(self.role_model).filter(self.role_model.name.in_(target_roles)).all()
+            _cache_role_ids(roles)
+            self.get_session.commit()
+            timings['cache'] = time.perf_counter() - started
+            
+            if AZURE_VERIFY_ID_TOKEN:
+                started = time.perf_counter()
+                self._install_jwks_cache()
+                timings['jwks'] = time.perf_counter() - started
+            
+            if ROLE_RECONCILE_ENABLED:
+                started = time.perf_counter()
+                role_reconciler.bind(self)
+                timings['reconcile'] = time.perf_counter() - started
+        except Exception:
+            auth_metrics.incr('warmup.error')
+            logger.exception("❌ [WARMUP] Worker warm-up failed after phases %s", list(timings))
+            self.get_session.rollback()
+            return
+        
+        phases = ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in timings.items())
+        logger.info("🔐 [WARMUP] Worker %s ready with %s mapped roles (%s)", os.getpid(), len(roles), phases)
+    
+    def _install_jwks_cache(self):
+        """Start the JWKS cache and make authlib's id_token check in the OAuth callback use it too."""
+        jwks_cache.start()
+        remote = self.oauth_remotes.get('azure') if self.oauth_remotes else None
+        if remote is not None:
+            remote.server_metadata.setdefault('issuer', AZURE_ISSUER)
+            remote.fetch_jwk_set = jwks_cache.fetch_jwk_set
+    
+    def _decode_and_validate_azure_jwt(self, id_token):
+        """Verify the id_token locally against the cached JWKS (instead of unverified decoding)."""
+        if not AZURE_VERIFY_ID_TOKEN:
+            return super()._decode_and_validate_azure_jwt(id_token)
+        cached = getattr(_verified_id_token, 'value', None)
+        if cached is not None and cached[0] == id_token:
+            return cached[1]
+        with auth_metrics.timer('verify_id_token'):
+            claims = jwks_cache.verify(id_token)
+        _verified_id_token.value = (id_token, claims)
+        return claims
+    
+    def get_oauth_user_info(self, provider, resp):
+        audit = LoginAudit.begin(provider)
+        _cached_login.graph_token = None
+        
+        if AZURE_VERIFY_ID_TOKEN and provider == "azure" and resp.get("id_token"):
+            try:
+                resp = dict(resp, id_token_claims=self._decode_and_validate_azure_jwt(resp["id_token"]))
+            except jwt.PyJWTError as e:
+                auth_metrics.incr('invalid_id_token')
+                logger.warning("⚠️ [ID_TOKEN] Rejecting login, id_token failed verification: %s", e)
+                audit.update(reason=f"invalid id_token: {e}")
+                audit.emit('rejected')
+                raise
+        
+        # แสดงข้อมูลทั้งหมดที่ Azure ส่งกลับมา (เฉพาะ DEBUG, สุ่มตัวอย่าง, ปิดบัง token)
+        if AUTH_LOG_SAMPLE_RATE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < AUTH_LOG_SAMPLE_RATE:
+            logger.debug("🔐 [RESPONSE] Sampled Azure OAuth response: %s", _LazyJson(resp))
+        
+        # Check for roles and groups in both id_token_claims and userinfo
+        id_token_claims = resp.get("id_token_claims", {})
+        userinfo = resp.get("userinfo", {})
+        
+        # Current compiled role and group mappings (kept fresh by the watcher)
+        with auth_metrics.timer('load_mappings'):
+            compiled_mappings = get_role_mappings()
+        
+        # Repeat login with the same claims and mapping version: reuse the resolved user_info
+        cache_key = None
+        if USER_INFO_CACHE_TTL > 0:
+            cache_key = user_info_cache_key(provider, id_token_claims, userinfo, compiled_mappings.version)
+        cached = user_info_cache.get(cache_key) if cache_key is not None else None
+        _cached_login.entry = cached
+        if cached is not None:
+            auth_metrics.incr('user_info_cache.hit')
+            audit.update(user_info_cache='hit', **cached.audit_fields)
+            return cached.copy_user_info()
+        if cache_key is not None:
+            auth_metrics.incr('user_info_cache.miss')
+        
+        # Map Azure AD roles ("role" mode) or groups ("group" mode) to Airflow roles
+        claim_name, claims_from_token = token_claims(ROLE_MAPPING_METHOD, id_token_claims, userinfo)
+        overage = (claim_name == "groups" and not claims_from_token
+                   and GRAPH_GROUPS_OVERAGE != "off" and GraphGroupResolver.has_overage(id_token_claims))
+        if overage:
+            claims_from_token = self._fetch_overage_groups(id_token_claims, resp, compiled_mappings)
+        if not claims_from_token:
+            logger.warning("⚠️ [%s_MODE] No %s found in token claims!", ROLE_MAPPING_METHOD.upper(), claim_name)
+        
+        with auth_metrics.timer('claim_mapping'):
+            mapped_roles, unknown_claims, default_role = map_claims(compiled_mappings, ROLE_MAPPING_METHOD, claims_from_token)
+        auth_metrics.incr(f"unknown_{claim_name}", len(unknown_claims))
+        logger.debug("🔐 [MAPPING] Mapped %d %s -> %s", len(claims_from_token), claim_name, mapped_roles)
+        if unknown_claims:
+            logger.debug("🔐 [MAPPING] %d %s not in mapping: %s", len(unknown_claims), claim_name, _LazyJson(unknown_claims))
+        
+        # If no roles mapped, the default registration role was used
+        if default_role:
+            auth_metrics.incr('default_role_fallback')
+        
+        # Get user info from parent class
+        with auth_metrics.timer('parent_user_info'):
+            user_info = super().get_oauth_user_info(provider, resp)
+        
+        # Fix username mapping - use preferred_username, upn or name instead of OID
+        original_username = user_info.get('username')
+        username = readable_username(id_token_claims, userinfo)
+        if username:
+            user_info['username'] = username
+        else:
+            logger.warning("⚠️ [USERNAME] No readable username found, keeping original: %s", original_username)
+        
+        # Add our mapped roles
+        user_info["role_keys"] = mapped_roles
+        
+        audit_fields = {
+            'username': user_info.get('username'),
+            'claims': len(claims_from_token),
+            'groups_overage': overage,
+            'unknown_claims': len(unknown_claims),
+            'mapped_roles': mapped_roles,
+            'default_role': default_role,
+            'mapping_version': compiled_mappings.version,
+        }
+        audit.update(**audit_fields)
+        
+        # The entry also carries the claims to auth_user_oauth, which stores them for reconciliation
+        entry = CachedUserInfo(user_info, audit_fields, list(claims_from_token),
+                               partial=getattr(_cached_login, 'graph_token', None) is not None)
+        _cached_login.entry = entry
+        if cache_key is not None:
+            user_info_cache.set(cache_key, entry)
+        return entry.copy_user_info()
+
+    def _fetch_overage_groups(self, id_token_claims, resp, compiled_mappings):
+        """Look up group memberships from Graph when the token has a groups overage.
+        
+        Failures are logged and yield no groups, so the login falls back to the default role.
+        """
+        oid = id_token_claims.get('oid')
+        access_token = resp.get('access_token')
+        if not oid or not access_token:
+            logger.warning("⚠️ [GROUPS_OVERAGE] Token has a groups overage but no oid/access_token to query Graph")
+            return []
+        
+        candidates = compiled_mappings.group_index if GRAPH_GROUPS_OVERAGE == "mapped" else None
+        try:
+            with auth_metrics.timer('graph_groups'):
+                groups = graph_groups.member_groups(oid, access_token, candidates, compiled_mappings.version)
+        except Exception as e:
+            auth_metrics.incr('graph.error')
+            logger.warning("⚠️ [GROUPS_OVERAGE] Graph group lookup failed for %s: %s", oid, e)
+            return []
+        logger.debug("🔐 [GROUPS_OVERAGE] Fetched %d groups from Graph for %s", len(groups), oid)
+        if graph_groups.checks_candidates(candidates):
+            # Only the mapped groups: auth_user_oauth fetches the rest for reconciliation
+            _cached_login.graph_token = (oid, access_token)
+        return list(groups)
+    
+    def _log_user_info(self, userinfo):
+        """
+        Log user information for debugging (formatted only when DEBUG is enabled).
+        
+        Args:
+            userinfo (dict): User information dictionary
+        """
+        logger.debug("🔐 [auth_user_oauth] Starting OAuth user authentication: %s", _LazyJson(dict(userinfo)))
+    
+    def _attach_cached_role(self, role_id, role_name):
+        """Return a session-bound Role for a cached id without issuing a SELECT.
+        
+        If another worker or an admin deleted the role since, the commit that links
+        it fails with an IntegrityError; auth_user_oauth then calls
+        _discard_cached_roles and resolves the roles again.
+        """
+        role = self.role_model()
+        role.id = role_id
+        role.name = role_name
+        make_transient_to_detached(role)
+        return self.get_session.merge(role, load=False)
+    
+    def _discard_cached_roles(self):
+        """Roll back the session and forget every role id and Role it holds, so roles are re-queried (or recreated)."""
+        session = self.get_session
+        session.rollback()
+        invalidate_role_cache()
+        for instance in list(session.identity_map.values()):
+            if isinstance(instance, self.role_model):
+                session.expunge(instance)
+    
+    def _upsert_roles(self, role_names):
+        """
+        Idempotently insert roles in their own transaction.
+        
+        Uses INSERT ... ON CONFLICT DO NOTHING (or the dialect equivalent), so a
+        concurrent insert by another worker is not an error and never rolls back
+        the caller's session.
+        """
+        engine = self.get_session.get_bind()
+        table = self.role_model.__table__
+        rows = [{'name': role_name} for role_name in role_names]
+        statement = _insert_ignore_statement(table, engine.dialect.name, 'name')
+        
+        with engine.begin() as conn:
+            if statement is not None:
+                conn.execute(statement, rows)
+                return
+            existing = {
+                row[0] for row in conn.execute(
+                    sqlalchemy.select(table.c.name).where(table.c.name.in_(role_names))
+                )
+            }
+            for row in rows:
+                if row['name'] in existing:
+                    continue
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert(), row)
+                except sqlalchemy.exc.IntegrityError:
+                    logger.debug("🔐 [auth_user_oauth] Role '%s' created concurrently", row['name'])
+    
+    def _create_roles(self, role_names):
+        """
+        Create missing roles, coalescing concurrent first logins.
+        
+        Within a worker only one thread creates a given role name while the others
+        wait for it; across workers the upsert makes creation idempotent.
+        
+        Returns:
+            list: Role objects for the requested names that now exist
+        """
+        try:
+            _role_creation_flight.do_many(role_names, self._upsert_roles)
+        except Exception as e:
+            logger.error("❌ [auth_user_oauth] Exception creating roles %s: %s", role_names, e)
+            invalidate_role_cache()
+        
+        roles = self.get_session.query(self.role_model).filter(self.role_model.name.in_(role_names)).all()
+        if roles:
+            logger.debug("🔐 [auth_user_oauth] ✅ Ensured roles %s", roles)
+        return roles
+    
+    def _resolve_roles(self, role_keys):
+        """
+        Look up Role objects for the given names, creating roles that don't exist.
+        
+        Cached names are attached to the session without a query; the rest are
+        fetched with a single IN query, and any still missing are created in one
+        transaction.
+        
+        Args:
+            role_keys (list): List of role names
+            
+        Returns:
+            tuple: (roles, failed_assignments) - Role objects and names that could not be resolved
+        """
+        role_names = list(dict.fromkeys(role_keys))
+        cached_ids = _cached_role_ids()
+        found = {}
+        
+        for role_name in role_names:
+            role_id = cached_ids.get(role_name)
+            if role_id is not None:
+                found[role_name] = self._attach_cached_role(role_id, role_name)
+        
+        # Bulk fetch everything the cache didn't know about
+        uncached = [name for name in role_names if name not in found]
+        if uncached:
+            fetched = self.get_session.query(self.role_model).filter(self.role_model.name.in_(uncached)).all()
+            _cache_role_ids(fetched)
+            found.update((role.name, role) for role in fetched)
+        
+        # Create missing roles in one batch
+        missing = [name for name in role_names if name not in found]
+        if missing:
+            logger.warning("⚠️ [auth_user_oauth] Roles %s not found, creating...", missing)
+            created = self._create_roles(missing)
+            _cache_role_ids(created)
+            found.update((role.name, role) for role in created)
+        
+        roles = [found[name] for name in role_names if name in found]
+        failed_assignments = [name for name in role_names if name not in found]
+        return roles, failed_assignments
+    
+    def _assign_roles_to_user(self, user, role_keys):
+        """
+        Bring the user's roles in line with role_keys, touching only the difference.
+        
+        Roles the user already has are left alone, so SQLAlchemy only emits
+        INSERT/DELETE rows for ab_user_role entries that actually changed.
+        
+        Args:
+            user: User object from database
+            role_keys (list): List of role names to assign
+            
+        Returns:
+            tuple: (successfully_assigned, failed_assignments) lists
+        """
+        roles, failed_assignments = self._resolve_roles(role_keys)
+        target = {role.name: role for role in roles}
+        current = {role.name: role for role in user.roles}
+        
+        for name, role in current.items():
+            if name not in target:
+                user.roles.remove(role)
+                logger.debug("🔐 [auth_user_oauth] Removed role '%s' from user", name)
+        for name, role in target.items():
+            if name not in current:
+                user.roles.append(role)
+                logger.debug("🔐 [auth_user_oauth] ✅ Added role '%s' to user", name)
+        
+        return list(target), failed_assignments
+    
+    @staticmethod
+    def _target_role_keys(userinfo):
+        """Return the mapped role names from userinfo, or the default registration role."""
+        return userinfo.get('role_keys') or [AUTH_USER_REGISTRATION_ROLE]
+    
+    def _oauth_calculate_user_roles(self, userinfo):
+        """
+        Return the mapped Airflow roles for a user the parent registers.
+        
+        The parent only calls this for new users (its login-time sync is turned off,
+        see auth_roles_sync_at_login), so add_user commits the mapped roles together
+        with the user. The names are kept for auth_user_oauth's audit record.
+        """
+        roles, failed_assignments = self._resolve_roles(self._target_role_keys(userinfo))
+        if failed_assignments:
+            logger.error("❌ [auth_user_oauth] Failed to resolve roles: %s", failed_assignments)
+        _cached_login.registered_roles = [role.name for role in roles]
+        return roles
+    
+    def _record_claims(self, user_id, claims):
+        """
+        Stage an upsert of the claims this user logged in with (ab_user_claims).
+        
+        Runs before any role change is staged in the session, so if it fails
+        (e.g. the database is unavailable) rolling back loses nothing and
+        the login goes on without it.
+        
+        Returns:
+            bytes: The packed claims if an upsert is pending in the session, None if
+            this worker stored the same claims recently or the upsert failed
+        """
+        blob = encode_claims(claims)
+        if _recorded_claims.get(user_id) == blob:
+            return None
+        session = self.get_session
+        try:
+            _write_user_claims(session, session.get_bind().dialect.name, user_id, blob)
+            return blob
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.warning("⚠️ [RECONCILE] Could not record claims of user %s: %s", user_id, e)
+            session.rollback()
+            return None
+    
+    def _commit_claims(self, user_id, blob):
+        """Commit a pending claims upsert on its own; a failure doesn't fail the login."""
+        try:
+            self.get_session.commit()
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.warning("⚠️ [RECONCILE] Could not record claims of user %s: %s", user_id, e)
+            self.get_session.rollback()
+            return
+        _recorded_claims.set(user_id, blob)
+    
+    def _record_member_groups(self, user_id, graph_token, mapped_groups):
+        """
+        Store every group of an overage user whose login only checked the mapped groups.
+        
+        checkMemberGroups only answers for group_mapping keys, so storing that subset
+        would hide the user from the reconciler for groups mapped later. One
+        getMemberGroups call on the Graph pool, after the login, fetches the full
+        membership instead. If it fails, the mapped groups are stored only when the
+        user has no row yet.
+        
+        Args:
+            graph_token: (oid, access_token) of this login, None if Graph was not asked
+            mapped_groups: the groups checkMemberGroups returned
+        """
+        if graph_token is None:
+            return None
+        engine = self.get_session.get_bind()
+        
+        def record():
+            statement = None
+            try:
+                groups = graph_groups.member_groups(*graph_token)
+            except Exception as e:
+                auth_metrics.incr('graph.error')
+                logger.warning("⚠️ [RECONCILE] Could not fetch all groups of user %s, keeping the mapped ones: %s", user_id, e)
+                groups = mapped_groups
+                statement = _insert_ignore_statement(_user_claims_table, engine.dialect.name, 'user_id')
+                if statement is None:
+                    return
+            blob = encode_claims(groups)
+            if _recorded_claims.get(user_id) == blob:
+                return
+            try:
+                with engine.begin() as conn:
+                    if statement is not None:
+                        conn.execute(statement, {'user_id': user_id, 'method': ROLE_MAPPING_METHOD, 'claims': blob,
+                                                 'updated_at': time.time()})
+                        return
+                    _write_user_claims(conn, engine.dialect.name, user_id, blob)
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                logger.warning("⚠️ [RECONCILE] Could not record claims of user %s: %s", user_id, e)
+                return
+            _recorded_claims.set(user_id, blob)
+        
+        return graph_groups.submit(record)
+    
+    def _cache_permissions(self, user):
+        """Build the user's permission set as part of the login, so their first requests find it cached."""
+        if permission_cache.enabled:
+            with auth_metrics.timer('permissions'):
+                permission_cache.for_user(user)
+    
+    def _parent_auth_user_oauth(self, userinfo):
+        """Run the parent's auth_user_oauth with its role sync off; returns (user, roles add_user registered or None)."""
+        _cached_login.in_parent_auth = True
+        _cached_login.registered_roles = None
+        try:
+            with auth_metrics.timer('parent_auth'):
+                user = super().auth_user_oauth(userinfo)
+        finally:
+            _cached_login.in_parent_auth = False
+        registered_roles = _cached_login.registered_roles
+        _cached_login.registered_roles = None
+        return user, registered_roles
+    
+    @property
+    def auth_roles_sync_at_login(self):
+        """
+        False while the parent authenticates an OAuth login.
+        
+        The parent would replace user.roles wholesale and commit it before
+        auth_user_oauth sees the user, so auth_user_oauth syncs the roles itself
+        and only writes (and reports) the difference.
+        """
+        if getattr(_cached_login, 'in_parent_auth', False):
+            return False
+        return super().auth_roles_sync_at_login
+    
+    def update_user_auth_stat(self, user, success=True):
+        """
+        Skip the login-stats write of a successful login shortly after the previous one.
+        
+        FAB rewrites last_login and login_count on every login, so even a login
+        whose roles are unchanged would UPDATE the user row. Within
+        LOGIN_STATS_INTERVAL of last_login nothing is written; login_count then
+        counts logins at least that far apart. Failed logins, and a success that
+        has to reset fail_login_count, always write.
+        """
+        if (success and LOGIN_STATS_INTERVAL > 0 and not user.fail_login_count and user.last_login is not None
+                and datetime.datetime.now() - user.last_login < datetime.timedelta(seconds=LOGIN_STATS_INTERVAL)):
+            auth_metrics.incr('db.stats_skip')
+            return
+        super().update_user_auth_stat(user, success)
+    
+    def auth_user_oauth(self, userinfo):
+        """
+        Override to ensure proper role assignment for OAuth users.
+        
+        The parent only creates/looks up the user (its role sync is turned off);
+        the user's role set is then compared with the mapped role set, and when
+        they match (the common case) no further database writes are made. For a
+        repeat login served from the user_info cache whose roles were already
+        synced, the comparison is skipped too. The user's permission set is built
+        for the permission cache. One audit summary record is written per login.
+        
+        Args:
+            userinfo (dict): User information from OAuth provider
+            
+        Returns:
+            User: User object with assigned roles, or None if failed
+        """
+        audit = LoginAudit.current()
+        entry = getattr(_cached_login, 'entry', None)
+        _cached_login.entry = None
+        graph_token = getattr(_cached_login, 'graph_token', None)
+        _cached_login.graph_token = None
+        if entry is not None and entry.user_info.get('username') != userinfo.get('username'):
+            entry = None
+        synced = entry is not None and entry.user_id is not None
+        
+        # Log user information
+        self._log_user_info(userinfo)
+        
+        # Call parent method to handle user creation/update (new users get their mapped roles from add_user)
+        user, registered_roles = self._parent_auth_user_oauth(userinfo)
+        if not user and registered_roles is not None:
+            # add_user failed (and rolled back): a cached role may have been deleted, retry once with fresh ids
+            logger.warning("⚠️ [auth_user_oauth] Registering the user failed, retrying with fresh role ids")
+            self._discard_cached_roles()
+            user, registered_roles = self._parent_auth_user_oauth(userinfo)
+        
+        if not user:
+            logger.error("❌ [auth_user_oauth] Parent method returned None - user creation/authentication failed!")
+            audit.update(username=userinfo.get('username'))
+            audit.emit('rejected')
+            return None
+        
+        audit.update(user_id=user.id)
+        
+        # Cached login and this user already holds its roles: nothing to compare or write
+        if synced and user.id == entry.user_id:
+            auth_metrics.incr('db.skip')
+            audit.update(roles_changed=False)
+            self._cache_permissions(user)
+            audit.emit('success')
+            return user
+        
+        # Remember the claims for background role reconciliation, before any role change is staged
+        claims_blob = None
+        if ROLE_RECONCILE_ENABLED and entry is not None and role_reconciler.claims_table_ready(self.get_session.get_bind()):
+            if entry.partial:
+                self._record_member_groups(user.id, graph_token, entry.claims)
+            else:
+                claims_blob = self._record_claims(user.id, entry.claims)
+        
+        # Get target roles from userinfo (default registration role if nothing was mapped)
+        role_keys = self._target_role_keys(userinfo)
+        target_fingerprint = _role_fingerprint(role_keys)
+        current_fingerprint = _role_fingerprint(r.name for r in user.roles)
+        
+        # Fast path: role set unchanged, nothing to write
+        if current_fingerprint == target_fingerprint:
+            if claims_blob is not None:
+                self._commit_claims(user.id, claims_blob)
+            if registered_roles is not None:
+                # New user: add_user already committed the mapped roles
+                auth_metrics.incr('db.write')
+                audit.update(roles_changed=True, roles_added=sorted(registered_roles), roles_removed=[])
+            else:
+                auth_metrics.incr('db.skip')
+                audit.update(roles_changed=False)
+            self._cache_permissions(user)
+            audit.emit('success')
+            if entry is not None:
+                entry.user_id = user.id
+            return user
+        
+        # Apply only the add/remove difference
+        with auth_metrics.timer('role_assignment'):
+            successfully_assigned, failed_assignments = self._assign_roles_to_user(user, role_keys)
+        audit.update(
+            roles_changed=True,
+            roles_added=sorted(target_fingerprint - current_fingerprint),
+            roles_removed=sorted(current_fingerprint - target_fingerprint),
+        )
+        if failed_assignments:
+            logger.error("❌ [auth_user_oauth] Failed to assign roles: %s", failed_assignments)
+            audit.update(failed_roles=failed_assignments)
+        
+        # Save user to database (user is already attached to the session)
+        try:
+            try:
+                with auth_metrics.timer('commit'):
+                    self.get_session.commit()
+            except sqlalchemy.exc.IntegrityError as e:
+                # A cached role id whose role was deleted or recreated elsewhere: retry once with fresh ids
+                logger.warning("⚠️ [auth_user_oauth] Saving the roles failed (%s), retrying with fresh role ids", e.orig)
+                self._discard_cached_roles()
+                if claims_blob is not None:
+                    claims_blob = self._record_claims(user.id, entry.claims)
+                successfully_assigned, failed_assignments = self._assign_roles_to_user(user, role_keys)
+                if failed_assignments:
+                    audit.update(failed_roles=failed_assignments)
+                with auth_metrics.timer('commit'):
+                    self.get_session.commit()
+            auth_metrics.incr('db.write')
+        except Exception as e:
+            logger.error("❌ [auth_user_oauth] Failed to save user to database: %s", e)
+            self.get_session.rollback()
+            invalidate_role_cache()
+            audit.emit('error')
+            raise
+        if claims_blob is not None:
+            _recorded_claims.set(user.id, claims_blob)
+        
+        self._cache_permissions(user)
+        audit.emit('success')
+        if entry is not None and not failed_assignments:
+            entry.user_id = user.id
+        return user
+
+SECURITY_MANAGER_CLASS = CustomSecurityManager
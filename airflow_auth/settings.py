@@ -0,0 +1,79 @@
+"""Environment settings of the Azure OAuth login (read once at import, validated by webserver_config.py)."""
+from __future__ import annotations
+
+import os
+
+
+# Auth logging configuration
+AUTH_LOG_LEVEL = os.environ.get("AUTH_LOG_LEVEL", "INFO").upper()
+AUTH_LOG_SAMPLE_RATE = float(os.environ.get("AUTH_LOG_SAMPLE_RATE", "0"))  # fraction of logins whose full response is logged at DEBUG
+AUTH_LOG_MAX_VALUE_LENGTH = int(os.environ.get("AUTH_LOG_MAX_VALUE_LENGTH", "200"))
+AUTH_LOG_MAX_ITEMS = int(os.environ.get("AUTH_LOG_MAX_ITEMS", "20"))
+
+# ตรวจสอบ environment variable
+AZURE_TENANT_ID = os.environ.get("AZURE_TENANT_ID")
+AZURE_CLIENT_ID = os.environ.get("AZURE_CLIENT_ID")
+AZURE_CLIENT_SECRET = os.environ.get("AZURE_CLIENT_SECRET")
+
+# Configuration for role mapping method
+# Options: "role" (use roles claim) or "group" (use groups claim)
+ROLE_MAPPING_METHOD = os.environ.get("ROLE_MAPPING_METHOD", "group").lower()
+
+# Configuration for role mapping file
+ROLE_MAPPING_FILE = os.environ.get("ROLE_MAPPING_FILE", "role_mapping.json")
+ROLE_MAPPING_CACHE_TTL = int(os.environ.get("ROLE_MAPPING_CACHE_TTL", "300"))  # 5 minutes default
+ROLE_MAPPING_WATCH_INTERVAL = float(os.environ.get("ROLE_MAPPING_WATCH_INTERVAL", "5"))  # 0 disables the watcher
+ROLE_CACHE_TTL = int(os.environ.get("ROLE_CACHE_TTL", "300"))  # name -> role id cache, per worker
+ROLE_PERMISSIONS_FILE = os.environ.get("ROLE_PERMISSIONS_FILE", "role_permissions.json")  # spec for provision-roles
+# Compiled mapping snapshot memory-mapped by all workers; empty disables (each worker compiles its own)
+ROLE_MAPPING_SNAPSHOT_FILE = os.environ.get(
+    "ROLE_MAPPING_SNAPSHOT_FILE", os.path.join(os.environ.get("AIRFLOW_HOME", "/opt/airflow"), "role_mapping.snapshot")
+)
+
+# Microsoft Graph lookups for users whose token has a groups overage (> ~200 groups)
+# Options: "mapped" (only check groups in group_mapping), "all" (fetch every membership) or "off"
+GRAPH_GROUPS_OVERAGE = os.environ.get("GRAPH_GROUPS_OVERAGE", "mapped").lower()
+GRAPH_API_URL = os.environ.get("GRAPH_API_URL", "https://graph.microsoft.com/v1.0").rstrip("/")
+GRAPH_TIMEOUT = float(os.environ.get("GRAPH_TIMEOUT", "5"))
+GRAPH_MAX_WORKERS = int(os.environ.get("GRAPH_MAX_WORKERS", "4"))  # concurrent Graph requests per login
+GRAPH_POOL_SIZE = int(os.environ.get("GRAPH_POOL_SIZE", "10"))  # pooled HTTP connections per worker
+GRAPH_CHECK_MAX_GROUPS = int(os.environ.get("GRAPH_CHECK_MAX_GROUPS", "200"))  # above this, "mapped" fetches all memberships
+GRAPH_CACHE_TTL = int(os.environ.get("GRAPH_CACHE_TTL", "300"))
+GRAPH_CACHE_SIZE = int(os.environ.get("GRAPH_CACHE_SIZE", "10000"))  # users (OIDs) kept per worker
+
+# Local id_token verification against a cached JWKS (shared by workers through JWKS_CACHE_FILE)
+AZURE_VERIFY_ID_TOKEN = os.environ.get("AZURE_VERIFY_ID_TOKEN", "true").lower() in ("1", "true", "yes")
+AZURE_JWKS_URI = os.environ.get("AZURE_JWKS_URI", f"https://login.microsoftonline.com/{AZURE_TENANT_ID}/discovery/v2.0/keys")
+AZURE_ISSUER = os.environ.get("AZURE_ISSUER", f"https://login.microsoftonline.com/{AZURE_TENANT_ID}/v2.0")
+JWKS_CACHE_FILE = os.environ.get("JWKS_CACHE_FILE", os.path.join(os.environ.get("AIRFLOW_HOME", "/opt/airflow"), "jwks_cache.json"))
+JWKS_REFRESH_INTERVAL = float(os.environ.get("JWKS_REFRESH_INTERVAL", "3600"))  # background refresh, 0 disables
+JWKS_MIN_REFETCH_INTERVAL = float(os.environ.get("JWKS_MIN_REFETCH_INTERVAL", "60"))  # throttle for unknown kids
+JWKS_TIMEOUT = float(os.environ.get("JWKS_TIMEOUT", "5"))
+
+# Resolved user_info memoized for repeat logins (session expiry, several tabs); 0 disables
+USER_INFO_CACHE_TTL = int(os.environ.get("USER_INFO_CACHE_TTL", "120"))
+USER_INFO_CACHE_SIZE = int(os.environ.get("USER_INFO_CACHE_SIZE", "10000"))  # logins kept per worker
+# A login within this many seconds of the user's last_login doesn't rewrite last_login / login_count
+# (FAB updates them on every login); 0 writes them on every login
+LOGIN_STATS_INTERVAL = int(os.environ.get("LOGIN_STATS_INTERVAL", "300"))
+
+# Per-role permission sets for authorization checks; 0 disables
+PERMISSION_CACHE_TTL = int(os.environ.get("PERMISSION_CACHE_TTL", "60"))
+PERMISSION_CACHE_SIZE = int(os.environ.get("PERMISSION_CACHE_SIZE", "10000"))  # roles / role combinations kept per worker
+# Seconds between checks for role/permission edits made by other processes (one small query); 0 checks every request
+PERMISSION_CACHE_CHECK_INTERVAL = float(os.environ.get("PERMISSION_CACHE_CHECK_INTERVAL", "1"))
+
+# Background re-sync of existing users' roles (from their last-seen claims) after a mapping change
+ROLE_RECONCILE_ENABLED = os.environ.get("ROLE_RECONCILE_ENABLED", "true").lower() in ("1", "true", "yes")
+ROLE_RECONCILE_BATCH_SIZE = int(os.environ.get("ROLE_RECONCILE_BATCH_SIZE", "5000"))  # users per transaction
+# One worker per host reconciles at a time; empty disables the lock (every worker reconciles)
+ROLE_RECONCILE_LOCK_FILE = os.environ.get(
+    "ROLE_RECONCILE_LOCK_FILE", os.path.join(os.environ.get("AIRFLOW_HOME", "/opt/airflow"), "role_reconcile.lock")
+)
+
+# Warm each API server worker up (mappings, roles, JWKS, reconciler) as it starts, before it
+# serves requests; needs AzureFabAuthManager. CLI commands never run it.
+AUTH_WARM_UP_ON_START = os.environ.get("AUTH_WARM_UP_ON_START", "true").lower() in ("1", "true", "yes")
+
+# Role of users none of whose claims is mapped (also FAB's registration role, see webserver_config.py)
+AUTH_USER_REGISTRATION_ROLE = "Unassigned"
@@ -0,0 +1,256 @@
+"""Auth logging (queued stdout writer, redaction), login metrics and the per-login audit record."""
+from __future__ import annotations
+
+import os
+import logging
+import json
+import time
+import queue
+import sys
+import atexit
+import threading
+from collections import defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Mapping, Optional
+
+try:
+    from airflow.stats import Stats
+    from airflow.utils.log.logging_mixin import RedirectStdHandler
+except ImportError:  # offline tools (replay-claims, convert-mapping) run without Airflow
+    Stats = None
+    RedirectStdHandler = None
+
+from .settings import AUTH_LOG_LEVEL, AUTH_LOG_MAX_ITEMS, AUTH_LOG_MAX_VALUE_LENGTH, ROLE_MAPPING_METHOD
+
+
+class _DeferredFormatQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+    
+    The stock handler formats every record on the calling (request) thread
+    before enqueueing it; records here stay in-process, so formatting can wait.
+    """
+    
+    def prepare(self, record):
+        return record
+
+
+# ตั้งค่า logger (one logger for every module of the package)
+logger = logging.getLogger("airflow_auth")
+# One structured summary record per login
+audit_logger = logging.getLogger("airflow_auth.audit")
+# ส่ง log ไป stdout เพื่อให้ docker-compose log เก็บได้ (เขียนจาก background thread ผ่าน queue)
+handler = RedirectStdHandler(stream='stdout') if RedirectStdHandler is not None else logging.StreamHandler(sys.stdout)
+handler.setFormatter(logging.Formatter("[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s"))
+_queue_handler = _DeferredFormatQueueHandler(queue.SimpleQueue())
+logger.addHandler(_queue_handler)
+logger.setLevel(AUTH_LOG_LEVEL)
+logger.propagate = False
+
+_log_listener = {
+    'listener': None,
+    'pid': None
+}
+
+def _ensure_log_listener() -> None:
+    """Start the background log writer for this process (threads do not survive fork)."""
+    if _log_listener['pid'] == os.getpid():
+        return
+    if _log_listener['pid'] is not None:
+        # Forked child: don't replay records the parent had not written yet
+        _queue_handler.queue = queue.SimpleQueue()
+    listener = QueueListener(_queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    _log_listener.update({'listener': listener, 'pid': os.getpid()})
+
+def _stop_log_listener() -> None:
+    """Flush queued records on interpreter exit."""
+    if _log_listener['pid'] == os.getpid():
+        _log_listener['listener'].stop()
+
+_ensure_log_listener()
+# gunicorn/multiprocessing workers fork after this file is imported: give each child its own writer
+os.register_at_fork(after_in_child=_ensure_log_listener)
+atexit.register(_stop_log_listener)
+
+_REDACTED_KEYS = frozenset({
+    "access_token", "id_token", "refresh_token", "client_secret", "code", "token", "password",
+})
+
+def _redact(value: Any) -> Any:
+    """Return a log-safe copy of value: token fields redacted, long strings and lists truncated."""
+    if isinstance(value, Mapping):
+        return {
+            key: f"<redacted {len(str(item))} chars>" if key in _REDACTED_KEYS else _redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+        redacted = [_redact(item) for item in items[:AUTH_LOG_MAX_ITEMS]]
+        if len(items) > AUTH_LOG_MAX_ITEMS:
+            redacted.append(f"... +{len(items) - AUTH_LOG_MAX_ITEMS} more")
+        return redacted
+    if isinstance(value, str) and len(value) > AUTH_LOG_MAX_VALUE_LENGTH:
+        return f"{value[:AUTH_LOG_MAX_VALUE_LENGTH]}... +{len(value) - AUTH_LOG_MAX_VALUE_LENGTH} chars"
+    return value
+
+
+class _LazyJson:
+    """Log argument that redacts and serialises its payload only when the record is formatted."""
+    
+    __slots__ = ('payload',)
+    
+    def __init__(self, payload: Any):
+        self.payload = payload
+    
+    def __str__(self) -> str:
+        return json.dumps(_redact(self.payload), default=str, ensure_ascii=False)
+
+
+class AuthMetrics:
+    """Low-overhead counters and latency histograms for the OAuth login path.
+    
+    Everything is aggregated in-process (see :meth:`snapshot` and
+    :meth:`render_prometheus`) and also forwarded to Airflow's ``Stats``, so it
+    reaches StatsD / OpenTelemetry (and Prometheus via statsd_exporter) whenever
+    ``[metrics] statsd_on`` or ``otel_on`` is set. With metrics disabled,
+    ``Stats`` is a no-op and the cost is a perf_counter pair and a lock per sample.
+    """
+    
+    PREFIX = "auth_login"
+    BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    
+    class _Timer:
+        __slots__ = ('metrics', 'phase', 'started')
+        
+        def __init__(self, metrics: "AuthMetrics", phase: str):
+            self.metrics = metrics
+            self.phase = phase
+        
+        def __enter__(self):
+            self.started = time.perf_counter()
+            return self
+        
+        def __exit__(self, *exc):
+            self.metrics.observe(self.phase, (time.perf_counter() - self.started) * 1000)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        # phase -> [bucket counts..., +Inf count, sum_ms]
+        self._histograms: Dict[str, List[float]] = {}
+    
+    def incr(self, name: str, count: int = 1) -> None:
+        """Increment a counter, e.g. ``role_mapping.cache_hit``."""
+        if not count:
+            return
+        with self._lock:
+            self._counters[name] += count
+        if Stats is not None:
+            Stats.incr(f"{self.PREFIX}.{name}", count)
+    
+    def observe(self, phase: str, duration_ms: float) -> None:
+        """Record one latency sample for a login phase."""
+        with self._lock:
+            histogram = self._histograms.get(phase)
+            if histogram is None:
+                histogram = self._histograms[phase] = [0] * (len(self.BUCKETS_MS) + 1) + [0.0]
+            for i, bound in enumerate(self.BUCKETS_MS):
+                if duration_ms <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[len(self.BUCKETS_MS)] += 1
+            histogram[-1] += duration_ms
+        if Stats is not None:
+            Stats.timing(f"{self.PREFIX}.phase.{phase}", duration_ms)
+    
+    def timer(self, phase: str) -> "AuthMetrics._Timer":
+        """Context manager timing one login phase."""
+        return AuthMetrics._Timer(self, phase)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counters and per-phase histogram data (bucket counts are non-cumulative)."""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {
+                    phase: {
+                        'buckets': dict(zip([*self.BUCKETS_MS, float('inf')], histogram[:-1])),
+                        'count': sum(histogram[:-1]),
+                        'sum_ms': histogram[-1],
+                    }
+                    for phase, histogram in self._histograms.items()
+                },
+            }
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+    
+    def render_prometheus(self) -> str:
+        """Render the in-process aggregates in Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{self.PREFIX}_{name.replace('.', '_')}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        metric = f"{self.PREFIX}_phase_duration_ms"
+        if snapshot['histograms']:
+            lines.append(f"# TYPE {metric} histogram")
+        for phase, data in sorted(snapshot['histograms'].items()):
+            cumulative = 0
+            for bound, count in data['buckets'].items():
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{phase="{phase}"}} {data["sum_ms"]:.3f}')
+            lines.append(f'{metric}_count{{phase="{phase}"}} {data["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+auth_metrics = AuthMetrics()
+
+
+class LoginAudit:
+    """Collects one summary record per login across get_oauth_user_info and auth_user_oauth.
+    
+    The two calls run on the same request thread, so the in-progress audit is
+    kept in a thread-local and emitted once auth_user_oauth finishes.
+    """
+    
+    _local = threading.local()
+    
+    def __init__(self, provider: Optional[str] = None):
+        self.started = time.perf_counter()
+        self.fields: Dict[str, Any] = {
+            'event': 'oauth_login',
+            'provider': provider,
+            'method': ROLE_MAPPING_METHOD,
+        }
+    
+    @classmethod
+    def begin(cls, provider: str) -> "LoginAudit":
+        audit = cls(provider)
+        cls._local.audit = audit
+        return audit
+    
+    @classmethod
+    def current(cls) -> "LoginAudit":
+        """Return the audit started by get_oauth_user_info, or a fresh one."""
+        audit = getattr(cls._local, 'audit', None)
+        return audit if audit is not None else cls.begin(None)
+    
+    def update(self, **fields: Any) -> None:
+        self.fields.update(fields)
+    
+    def emit(self, outcome: str) -> None:
+        """Write the summary record (INFO on success, WARNING otherwise)."""
+        LoginAudit._local.audit = None
+        self.fields['outcome'] = outcome
+        self.fields['duration_ms'] = round((time.perf_counter() - self.started) * 1000, 1)
+        auth_metrics.observe('login', self.fields['duration_ms'])
+        auth_metrics.incr(f"outcome.{outcome}")
+        level = logging.INFO if outcome == 'success' else logging.WARNING
+        if audit_logger.isEnabledFor(level):
+            audit_logger.log(level, "🔐 [AUDIT] %s", _LazyJson(self.fields))
@@ -0,0 +1,69 @@
+"""Memoized user_info for repeat logins with the same claims."""
+from __future__ import annotations
+
+import json
+import hashlib
+from typing import Any, Dict, List, Mapping, Tuple, Optional
+
+import sqlalchemy
+
+from .caching import TTLCache
+from .settings import USER_INFO_CACHE_SIZE, USER_INFO_CACHE_TTL
+
+
+# Claims that determine the resolved user_info (roles/groups, username and profile fields)
+_USER_INFO_CLAIMS = ('oid', 'roles', 'groups', '_claim_names', 'preferred_username', 'upn', 'email',
+                     'name', 'given_name', 'family_name')
+
+class CachedUserInfo:
+    """A resolved user_info, the audit fields of the login that resolved it, and its role-sync state.
+    
+    ``user_id`` is set once a login with this entry has left the user's stored
+    roles equal to ``user_info['role_keys']``; until then logins still sync roles.
+    ``claims`` are the role/group claims the roles were mapped from; ``partial``
+    if they are only the mapped groups of a groups overage (checkMemberGroups).
+    """
+    
+    __slots__ = ('user_info', 'audit_fields', 'claims', 'partial', 'user_id')
+    
+    def __init__(self, user_info: Dict[str, Any], audit_fields: Dict[str, Any], claims: List[str], partial: bool = False):
+        self.user_info = user_info
+        self.audit_fields = audit_fields
+        self.claims = claims
+        self.partial = partial
+        self.user_id: Optional[int] = None
+    
+    def copy_user_info(self) -> Dict[str, Any]:
+        user_info = dict(self.user_info)
+        user_info['role_keys'] = list(user_info['role_keys'])
+        return user_info
+
+def user_info_cache_key(provider: str, id_token_claims: Mapping[str, Any], userinfo: Mapping[str, Any],
+                        mapping_version: Any) -> Optional[Tuple[Any, ...]]:
+    """Return (provider, oid, claims digest, mapping version), or None if the token has no oid.
+    
+    The digest covers every claim the mapping and username logic read, so a
+    changed group/role membership or name never reuses an entry, and a new
+    mapping version makes all older entries unreachable.
+    """
+    oid = id_token_claims.get('oid') or userinfo.get('oid')
+    if not oid:
+        return None
+    relevant = [[source.get(name) for name in _USER_INFO_CLAIMS] for source in (id_token_claims, userinfo)]
+    digest = hashlib.blake2b(json.dumps(relevant, separators=(',', ':'), default=str).encode(), digest_size=16).digest()
+    return (provider, oid, digest, mapping_version)
+
+user_info_cache = TTLCache(USER_INFO_CACHE_SIZE, USER_INFO_CACHE_TTL)
+
+def invalidate_user_info_cache(*_args) -> None:
+    """Drop all memoized user_info. Also used as a SQLAlchemy mapper event listener."""
+    user_info_cache.clear()
+
+def _invalidate_user_info_for_user(_mapper, _connection, user) -> None:
+    """User mapper 'after_delete' listener: drop the entries whose roles were synced for this user."""
+    user_info_cache.discard_if(lambda entry: entry.user_id == user.id)
+
+def _invalidate_user_info_on_role_edit(_mapper, _connection, user) -> None:
+    """User mapper 'after_update' listener: invalidate only when the user's roles were edited."""
+    if sqlalchemy.inspect(user).attrs.roles.history.has_changes():
+        _invalidate_user_info_for_user(_mapper, _connection, user)
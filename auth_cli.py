@@ -0,0 +1,9 @@
+"""Role mapping and role permission maintenance commands (see ``python auth_cli.py --help``).
+
+Thin entry point for :mod:`airflow_auth.cli`, next to webserver_config.py so it
+runs the same way in the containers (``python /opt/airflow/auth_cli.py ...``).
+"""
+from airflow_auth.cli import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Groups-overage logins against a local mock Microsoft Graph.
+
+Every synthetic user is in more groups than fit in an id_token, so the token
+carries ``_claim_names``/``_claim_sources`` instead of ``groups`` and the
+security manager has to ask Graph. Reports latency and Graph requests per
+login for cold (cache miss), warm (cached per OID) and concurrent
+re-logins after a cache flush, and checks every user ends up with exactly
+the roles their mapped groups grant and that their stored claims (for role
+reconciliation) hold every group, not just the mapped ones. In ``mapped``
+mode that takes one getMemberGroups call per user after the login, which
+the graph req/login column includes.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_group_overage.py --mode mapped --groups-per-user 1000 --latency 0.02
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import Runner, percentile  # noqa: E402
+from mock_graph import MockGraphServer  # noqa: E402
+
+
+def build_population(args, rng: random.Random):
+    group_mapping = {str(uuid.uuid4()): f"OverageProject{i % 20}" for i in range(args.mapping_size)}
+    mapped = list(group_mapping)
+    users = []
+    for i in range(args.users):
+        member_of = rng.sample(mapped, args.mapped_per_user)
+        groups = member_of + [str(uuid.uuid4()) for _ in range(args.groups_per_user - args.mapped_per_user)]
+        users.append({
+            "username": f"overage{i}@example.com",
+            "token": f"graph-token-{i}",
+            "groups": groups,
+            "expected_roles": {group_mapping[g] for g in member_of},
+        })
+    return group_mapping, users
+
+
+def build_response(user: dict) -> dict:
+    claims = {
+        "oid": str(uuid.uuid5(uuid.NAMESPACE_DNS, user["username"])),
+        "name": user["username"],
+        "preferred_username": user["username"],
+        "email": user["username"],
+        "given_name": "Overage",
+        "family_name": user["username"].split("@")[0],
+        "_claim_names": {"groups": "src1"},
+        "_claim_sources": {"src1": {"endpoint": "https://graph.windows.net/benchmark/users/x/getMemberObjects"}},
+    }
+    return harness.token_response(claims, access_token=user["token"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("mapped", "all"), default="mapped", help="GRAPH_GROUPS_OVERAGE")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--groups-per-user", type=int, default=500)
+    parser.add_argument("--mapped-per-user", type=int, default=3, help="memberships that appear in group_mapping")
+    parser.add_argument("--mapping-size", type=int, default=100, help="group_mapping entries")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock Graph response time in seconds")
+    parser.add_argument("--logins", type=int, default=500, help="repeat logins in the warm phase")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    group_mapping, users = build_population(args, rng)
+
+    mock = MockGraphServer(latency=args.latency).start()
+    for user in users:
+        mock.add_user(user["token"], user["groups"])
+
+    harness.bootstrap(role_mapping={"role_mapping": {}, "group_mapping": group_mapping})
+    # Re-logins must reach the Graph lookup rather than the memoized user_info
+    os.environ.update({"GRAPH_API_URL": mock.url, "GRAPH_GROUPS_OVERAGE": args.mode, "USER_INFO_CACHE_TTL": "0"})
+    app = harness.create_app()
+    runner = Runner(app)
+    from airflow_auth import graph, reconcile  # noqa: E402 (reads the environment bootstrap() set)
+    responses = [build_response(user) for user in users]
+
+    phases = [
+        ("cold (first login)", lambda: runner.run(responses, args.threads)),
+        ("warm (cached per OID)", lambda: runner.run([rng.choice(responses) for _ in range(args.logins)], args.threads)),
+        ("flushed, 4x concurrent", lambda: (graph.graph_groups.cache.clear(),
+                                            runner.run([r for r in responses for _ in range(4)], args.threads))[1]),
+    ]
+    print(f"mode={args.mode} users={args.users} groups/user={args.groups_per_user} "
+          f"mapping={args.mapping_size} graph latency={args.latency * 1000:.0f}ms threads={args.threads}")
+    print(f"{'phase':<24} {'logins':>7} {'p50 ms':>8} {'p99 ms':>8} {'graph req/login':>16} {'logins/s':>9}")
+    for name, run in phases:
+        before = sum(mock.requests.values())
+        started = time.perf_counter()
+        latencies = run()
+        elapsed = time.perf_counter() - started
+        graph_requests = sum(mock.requests.values()) - before
+        print(f"{name:<24} {len(latencies):>7} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} "
+              f"{graph_requests / len(latencies):>16.2f} {len(latencies) / elapsed:>9.1f}")
+
+    graph.graph_groups._pool()[1].shutdown(wait=True)  # background claim recording
+    wrong = partial_claims = 0
+    with app.app_context():
+        sm = app.appbuilder.sm
+        claims_table = reconcile._user_claims_table
+        for user in users:
+            db_user = sm.find_user(username=user["username"])
+            if db_user is None or {role.name for role in db_user.roles} != user["expected_roles"]:
+                wrong += 1
+                continue
+            row = sm.get_session.execute(claims_table.select().where(claims_table.c.user_id == db_user.id)).first()
+            if row is None or set(reconcile.decode_claims(bytes(row.claims))) != set(user["groups"]):
+                partial_claims += 1
+        sm.get_session.remove()
+    mock.stop()
+
+    print()
+    print(f"Graph endpoints: {dict(mock.requests)}")
+    print(f"Graph cache:     {graph.graph_groups.cache.stats()}")
+    print(f"Users with wrong roles: {wrong}")
+    print(f"Users without their full membership stored: {partial_claims}")
+    sys.exit(1 if wrong or partial_claims else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Local id_token verification against the cached JWKS, including key rotation.
+
+Runs logins with RS256 id_tokens signed by the stand-in JWKS server in
+``mock_jwks.py`` and reports, per phase, how many logins succeeded or were
+rejected and how many times the JWKS endpoint was hit:
+
+- steady:          keys already cached at warm-up, so no fetches on the login path
+- rotation:        new kid, concurrent logins share one refetch
+- forged kid:      random kids are rejected, refetches are throttled
+- wrong key:       valid kid but foreign signature is rejected
+- second worker:   a fresh cache adopts the shared file without a fetch
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_jwks.py --logins 500 --threads 8
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import Runner, percentile  # noqa: E402
+from mock_jwks import MockJwksServer  # noqa: E402
+
+ISSUER = "https://login.microsoftonline.com/benchmark/v2.0"
+
+
+def claims_for(i: int) -> dict:
+    now = int(time.time())
+    return {
+        "aud": os.environ["AZURE_CLIENT_ID"],
+        "iss": ISSUER,
+        "iat": now,
+        "nbf": now,
+        "exp": now + 3600,
+        "oid": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"jwks{i}")),
+        "name": f"JWKS User {i}",
+        "preferred_username": f"jwks{i}@example.com",
+        "email": f"jwks{i}@example.com",
+        "given_name": "JWKS",
+        "family_name": f"User{i}",
+        "groups": [],
+    }
+
+
+def response(id_token: str) -> dict:
+    # No id_token_claims: the security manager must take them from the verified token
+    return {"access_token": "benchmark-access-token", "id_token": id_token, "userinfo": {}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--min-refetch-interval", type=float, default=2.0, help="JWKS_MIN_REFETCH_INTERVAL")
+    args = parser.parse_args()
+
+    mock = MockJwksServer().start()
+    os.environ.update({
+        "AZURE_VERIFY_ID_TOKEN": "true",
+        "AZURE_JWKS_URI": mock.url,
+        "AZURE_ISSUER": ISSUER,
+        "JWKS_MIN_REFETCH_INTERVAL": str(args.min_refetch_interval),
+    })
+    harness.bootstrap()
+    app = harness.create_app()
+    runner = Runner(app)
+    from airflow_auth import jwks, telemetry  # noqa: E402 (reads the environment bootstrap() set)
+    logging.getLogger("airflow_auth").setLevel(logging.ERROR)  # rejected logins warn once each
+
+    def attempt(resp: dict):
+        try:
+            return runner.login(resp)
+        except Exception:
+            return None
+
+    def run(tokens):
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            return list(pool.map(attempt, [response(t) for t in tokens]))
+
+    foreign_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    phases = [
+        ("steady", lambda: run([mock.sign(claims_for(i % args.users)) for i in range(args.logins)])),
+        ("rotation", lambda: (time.sleep(args.min_refetch_interval), mock.rotate(),
+                              run([mock.sign(claims_for(i)) for i in range(args.users)]))[-1]),
+        ("forged kid", lambda: run([mock.sign(claims_for(i), kid=uuid.uuid4().hex) for i in range(args.users)])),
+        ("wrong key", lambda: run([mock.sign(claims_for(i), private_key=foreign_key) for i in range(args.users)])),
+    ]
+    print(f"{'phase':<14} {'logins':>7} {'ok':>5} {'rejected':>9} {'jwks fetches':>13} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'warm-up':<14} {'':>7} {'':>5} {'':>9} {mock.requests:>13}")
+    for name, phase in phases:
+        before = mock.requests
+        results = phase()
+        ok = [r for r in results if r is not None]
+        print(f"{name:<14} {len(results):>7} {len(ok):>5} {len(results) - len(ok):>9} {mock.requests - before:>13} "
+              f"{percentile(ok, 50):>8.2f} {percentile(ok, 99):>8.2f}")
+
+    before = mock.requests
+    second_worker = jwks.JwksCache().prefetch()
+    print(f"{'second worker':<14} {'':>7} {'':>5} {'':>9} {mock.requests - before:>13}   keys={len(second_worker.stats()['keys'])}")
+
+    verify = telemetry.auth_metrics.snapshot()["histograms"].get("verify_id_token")
+    if verify:
+        print(f"\nverify_id_token: {verify['count']} tokens, mean {verify['sum_ms'] / verify['count']:.3f}ms")
+    mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""End-to-end login-path benchmark with synthetic Azure OAuth responses.
+
+Drives ``CustomSecurityManager.get_oauth_user_info`` and ``auth_user_oauth``
+(including the parent FAB implementations) against a local SQLite metadata DB.
+Every combination of group count, mapping size and thread count is measured:
+
+- p50 / p99 latency of first logins (user creation) and repeat logins
+- SQL statements and writes per repeat login
+- peak Python allocations per login (tracemalloc, single thread)
+- repeat-login throughput under a thread pool
+
+Results can be saved with ``--json`` and compared against a previous run with
+``--compare``, which exits non-zero when p99 latency or queries per login
+regress beyond ``--tolerance``.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_login.py --groups 1,100,1000 --mapping-sizes 100,10000 --users 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+
+N_AIRFLOW_ROLES = 50
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def build_mapping(size: int) -> Dict[str, Dict[str, str]]:
+    group_mapping = {str(uuid.uuid4()): f"BenchProject{i % N_AIRFLOW_ROLES}" for i in range(size)}
+    role_mapping = {f"Airflow.Bench{i}": f"BenchProject{i % N_AIRFLOW_ROLES}" for i in range(size)}
+    return {"role_mapping": role_mapping, "group_mapping": group_mapping}
+
+
+def build_responses(mapping: dict, users: int, groups: int, hit_ratio: float, rng: random.Random) -> List[dict]:
+    """Synthetic Azure token responses for ``users`` users with ``groups`` groups each."""
+    group_keys = list(mapping["group_mapping"])
+    role_keys = list(mapping["role_mapping"])
+    n_hits = max(1, int(groups * hit_ratio))
+    responses = []
+    for i in range(users):
+        claims = {
+            "aud": "benchmark",
+            "iss": "https://login.microsoftonline.com/benchmark/v2.0",
+            "oid": str(uuid.uuid4()),
+            "name": f"Bench User {i}",
+            "preferred_username": f"bench{i}@example.com",
+            "email": f"bench{i}@example.com",
+            "given_name": "Bench",
+            "family_name": f"User{i}",
+            "groups": rng.sample(group_keys, min(n_hits, len(group_keys)))
+            + [str(uuid.uuid4()) for _ in range(max(0, groups - n_hits))],
+            "roles": rng.sample(role_keys, min(3, len(role_keys))),
+        }
+        responses.append(harness.token_response(claims))
+    return responses
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Runner(harness.Runner):
+    def peak_alloc_kb(self, responses: List[dict]) -> float:
+        peaks = []
+        tracemalloc.start()
+        try:
+            for resp in responses:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                self.login(resp)
+                peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+        finally:
+            tracemalloc.stop()
+        return statistics.mean(peaks)
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {_key(r): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(_key(result))
+        if previous is None:
+            continue
+        for metric in ("repeat_p99_ms", "queries_per_login"):
+            if previous[metric] and result[metric] > previous[metric] * tolerance:
+                regressions.append(f"{_key(result)} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f}")
+    return regressions
+
+
+def _key(result: dict) -> str:
+    return f"groups={result['groups']} mapping={result['mapping_size']} threads={result['threads']}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", default="1,100,1000", help="comma separated groups per token")
+    parser.add_argument("--mapping-sizes", default="100,10000", help="comma separated role_mapping.json sizes")
+    parser.add_argument("--users", type=int, default=200, help="distinct users in the population")
+    parser.add_argument("--logins", type=int, default=1000, help="repeat logins per configuration")
+    parser.add_argument("--threads", default="1,8", help="comma separated thread pool sizes")
+    parser.add_argument("--hit-ratio", type=float, default=0.05, help="fraction of token groups present in the mapping")
+    parser.add_argument("--method", choices=("group", "role"), default="group")
+    parser.add_argument("--alloc-samples", type=int, default=50, help="logins traced with tracemalloc")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON from a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed ratio vs. baseline before failing")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    harness.bootstrap(method=args.method)
+    app = harness.create_app()
+    runner = Runner(app)
+    from airflow_auth import mapping_loader, telemetry  # noqa: E402 (reads the environment bootstrap() set)
+    engine = runner.sm.get_session.get_bind()
+
+    results = []
+    header = (f"{'groups':>6} {'mapping':>8} {'threads':>7} {'first p50':>10} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'queries':>8} {'writes':>7} {'alloc KB':>9} {'logins/s':>9}")
+    print(header)
+    print("-" * len(header))
+    for mapping_size in _ints(args.mapping_sizes):
+        mapping = build_mapping(mapping_size)
+        harness.write_role_mapping(mapping)
+        mapping_loader.load_compiled_role_mappings(force_reload=True)
+
+        for groups in _ints(args.groups):
+            responses = build_responses(mapping, args.users, groups, args.hit_ratio, rng)
+            first = runner.run(responses, threads=1)
+            alloc_kb = runner.peak_alloc_kb(responses[: args.alloc_samples])
+
+            for threads in _ints(args.threads):
+                workload = [rng.choice(responses) for _ in range(args.logins)]
+                with harness.QueryCounter(engine) as counter:
+                    started = time.perf_counter()
+                    latencies = runner.run(workload, threads)
+                    elapsed = time.perf_counter() - started
+                result = {
+                    "groups": groups,
+                    "mapping_size": mapping_size,
+                    "threads": threads,
+                    "first_p50_ms": percentile(first, 50),
+                    "repeat_p50_ms": percentile(latencies, 50),
+                    "repeat_p99_ms": percentile(latencies, 99),
+                    "queries_per_login": counter.total / len(workload),
+                    "writes_per_login": counter.writes / len(workload),
+                    "alloc_kb_per_login": alloc_kb,
+                    "logins_per_sec": len(workload) / elapsed,
+                }
+                results.append(result)
+                print(f"{groups:>6} {mapping_size:>8} {threads:>7} {result['first_p50_ms']:>10.2f} "
+                      f"{result['repeat_p50_ms']:>8.2f} {result['repeat_p99_ms']:>8.2f} "
+                      f"{result['queries_per_login']:>8.2f} {result['writes_per_login']:>7.2f} "
+                      f"{alloc_kb:>9.1f} {result['logins_per_sec']:>9.1f}")
+
+            # Fresh users for the next configuration
+            with app.app_context():
+                session = runner.sm.get_session
+                session.query(runner.sm.user_model).filter(runner.sm.user_model.username.like("bench%")).delete(
+                    synchronize_session=False
+                )
+                session.commit()
+                session.remove()
+
+    print()
+    print(telemetry.auth_metrics.render_prometheus().split("# TYPE auth_login_phase_duration_ms")[0].strip())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""Shared memory-mapped role mapping snapshot vs. per-worker JSON compile.
+
+For each mapping size, reports:
+- per-worker cost today: ``json.load`` + compile time and the heap it keeps
+- snapshot cost: one publish (encode + write), then per-worker map time and heap
+- version check: reading the published generation vs. ``os.stat`` of the JSON file
+- resolution: ``RoleIndex.resolve`` vs. ``MappedRoleIndex.resolve`` for one login
+
+It also checks that both indexes resolve random claims identically and that
+forked "workers" all switch to a newly published generation.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_mapping_snapshot.py [--sizes 1000,10000,50000] [--workers 4]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="mapping-snapshot-")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["ROLE_MAPPING_SNAPSHOT_FILE"] = os.path.join(_TMP, "role_mapping.snapshot")
+
+from airflow_auth.mapping import CompiledRoleMappings  # noqa: E402
+from airflow_auth.mapping_snapshot import MappedRoleMappings, RoleMappingSnapshots  # noqa: E402
+from airflow_auth.telemetry import logger  # noqa: E402
+
+logger.setLevel(logging.WARNING)
+
+
+def build_mapping(size: int, n_roles: int = 200) -> dict:
+    group_mapping = {str(uuid.uuid4()): f"Project{i % n_roles}" for i in range(size)}
+    group_mapping.update({"87759d0d-*": "Admin", "team-??-ops": ["Ops", "Viewer"]})
+    role_mapping = {f"Airflow.Project{i}": [f"Project{i % n_roles}", "Viewer"] for i in range(size // 10)}
+    role_mapping["Airflow.Team*"] = "Team"
+    return {"role_mapping": role_mapping, "group_mapping": group_mapping}
+
+
+def random_claims(data: dict, rng: random.Random, n: int = 300) -> list:
+    keys = list(data["group_mapping"]) + list(data["role_mapping"])
+    claims = rng.sample(keys, min(n // 3, len(keys)))
+    claims += [f"87759d0d-{uuid.uuid4()}", "team-42-ops", "Airflow.TeamX"]
+    claims += [str(uuid.uuid4()) for _ in range(n - len(claims))]
+    rng.shuffle(claims)
+    return claims
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def heap_kb(fn):
+    tracemalloc.start()
+    try:
+        obj = fn()
+        current = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return obj, current / 1024
+
+
+def worker(path: str, ready, published, results) -> None:
+    snapshots = RoleMappingSnapshots(path)
+    results.put(("before", os.getpid(), snapshots.current().generation))
+    ready.wait()
+    published.wait()
+    results.put(("after", os.getpid(), snapshots.current().generation))
+
+
+def check_workers(snapshots, data: dict, n_workers: int) -> str:
+    ctx = multiprocessing.get_context("fork")
+    ready, published, results = ctx.Barrier(n_workers + 1), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(str(snapshots.path), ready, published, results)) for _ in range(n_workers)]
+    for proc in procs:
+        proc.start()
+    ready.wait()
+    new = snapshots.publish(CompiledRoleMappings(data, version=time.time()))
+    published.set()
+    for proc in procs:
+        proc.join()
+    seen = [results.get() for _ in range(2 * n_workers)]
+    after = {generation for phase, _, generation in seen if phase == "after"}
+    return f"{n_workers} workers moved to generation {sorted(after)} (published {new.generation})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    snapshots = RoleMappingSnapshots(os.environ["ROLE_MAPPING_SNAPSHOT_FILE"])
+    json_path = Path(_TMP) / "role_mapping.json"
+
+    print(f"{'entries':>8} {'json+compile':>13} {'heap KB':>9} {'publish':>9} {'map':>9} {'heap KB':>9} "
+          f"{'file KB':>8} {'stat':>8} {'gen read':>9} {'resolve':>9} {'mmap res':>9}")
+    for size in (int(v) for v in args.sizes.split(",")):
+        data = build_mapping(size)
+        json_path.write_text(json.dumps(data))
+
+        def compile_json():
+            with open(json_path, encoding="utf-8") as f:
+                return CompiledRoleMappings(json.load(f), version=json_path.stat().st_mtime)
+
+        compiled, compiled_kb = heap_kb(compile_json)
+        compile_s = timeit(compile_json, 3)
+        publish_s = timeit(lambda: snapshots.publish(compiled), 1)
+        data_path = snapshots._data_path(snapshots.generation)
+        mapped, mapped_kb = heap_kb(lambda: MappedRoleMappings(data_path))
+        map_s = timeit(lambda: MappedRoleMappings(data_path), 20)
+
+        for _ in range(20):
+            claims = random_claims(data, rng)
+            for method in ("group", "role"):
+                expected = compiled.index_for(method).resolve(claims)
+                actual = mapped.index_for(method).resolve(claims)
+                assert expected == actual, (method, expected, actual)
+        assert mapped.target_roles == compiled.target_roles
+        assert dict(mapped.group_mapping) == dict(compiled.group_mapping)
+        assert mapped.group_index.keys == compiled.group_index.keys
+
+        claims = random_claims(data, rng)
+        stat_s = timeit(lambda: json_path.stat(), 10000)
+        gen_s = timeit(lambda: snapshots.current(), 10000)
+        resolve_s = timeit(lambda: compiled.group_index.resolve(claims), 200)
+        mapped_resolve_s = timeit(lambda: mapped.group_index.resolve(claims), 200)
+        print(f"{size:>8} {compile_s * 1e3:>11.1f}ms {compiled_kb:>9.0f} {publish_s * 1e3:>7.1f}ms {map_s * 1e3:>7.2f}ms "
+              f"{mapped_kb:>9.1f} {data_path.stat().st_size / 1024:>8.0f} {stat_s * 1e9:>6.0f}ns {gen_s * 1e9:>7.0f}ns "
+              f"{resolve_s * 1e6:>7.0f}us {mapped_resolve_s * 1e6:>7.0f}us")
+
+    print()
+    print("Resolution matched the in-memory RoleIndex for every sampled login")
+    print(check_workers(snapshots, build_mapping(1000), args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""JSON role mapping reloads vs. the SQLite mapping store with incremental refresh.
+
+For each mapping size, reports the cost of picking up an edit that touches
+``--changes`` entries:
+
+- JSON: every edit means ``json.load`` + compile of the whole file (and its heap)
+- store: ``convert-mapping`` writes only the changed rows; each worker's
+  ``refresh()`` applies only those rows; the worker keeps only rules and role
+  counts in memory and looks up a login's claims with one indexed query
+
+Resolution is checked against the in-memory RoleIndex after every edit.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_mapping_store.py [--sizes 10000,100000] [--changes 1,10,100,1000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from airflow_auth.mapping import _is_rule_key  # noqa: E402
+from airflow_auth.mapping_loader import _compile_role_mapping_file  # noqa: E402
+from airflow_auth.mapping_store import RoleMappingStore, convert_role_mapping_json  # noqa: E402
+from airflow_auth.telemetry import logger  # noqa: E402
+
+logger.setLevel(logging.WARNING)
+
+
+def build_mapping(size: int, n_roles: int = 200) -> dict:
+    group_mapping = {str(uuid.uuid4()): f"Project{i % n_roles}" for i in range(size)}
+    group_mapping.update({"87759d0d-*": "Admin", "team-??-ops": ["Ops", "Viewer"]})
+    return {"role_mapping": {"Airflow.Admin": "Admin", "Airflow.Team*": "Team"}, "group_mapping": group_mapping}
+
+
+def edit(data: dict, n: int, rng: random.Random) -> None:
+    """Update, add and delete roughly n/3 group entries each."""
+    groups = data["group_mapping"]
+    keys = [k for k in groups if not _is_rule_key(k)]
+    for key in rng.sample(keys, n // 3 or 1):
+        groups[key] = [groups[key], "Viewer"] if isinstance(groups[key], str) else "Viewer"
+    for key in rng.sample(keys, n // 3):
+        del groups[key]
+    for _ in range(n - 2 * (n // 3) - 1 if n > 1 else 0):
+        groups[str(uuid.uuid4())] = f"NewProject{rng.randrange(10)}"
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+        elapsed = time.perf_counter() - started
+        heap = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed * 1000, heap / 1024
+
+
+def claims_for(data: dict, rng: random.Random, n: int = 300) -> list:
+    claims = rng.sample(list(data["group_mapping"]), 100) + ["87759d0d-x", "team-01-ops"]
+    return claims + [str(uuid.uuid4()) for _ in range(n - len(claims))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--changes", default="1,10,100,1000")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tmp = Path(tempfile.mkdtemp(prefix="mapping-store-"))
+    print(f"{'entries':>8} {'JSON MB':>8} {'changes':>8} {'JSON reload':>12} {'heap KB':>9} "
+          f"{'convert':>9} {'refresh':>9} {'store heap KB':>14} {'RoleIndex':>10} {'store':>8}")
+    for size in (int(v) for v in args.sizes.split(",")):
+        data = build_mapping(size)
+        json_path, store_path = tmp / f"map{size}.json", tmp / f"map{size}.db"
+        json_path.write_text(json.dumps(data))
+        convert_role_mapping_json(str(json_path), str(store_path))
+        store, _, store_kb = measure(lambda: RoleMappingStore(store_path))
+
+        for n in (int(v) for v in args.changes.split(",")):
+            edit(data, n, rng)
+            json_path.write_text(json.dumps(data))
+            compiled, json_ms, json_kb = measure(lambda: _compile_role_mapping_file(json_path, 0))
+            counts, convert_ms, _ = measure(lambda: convert_role_mapping_json(str(json_path), str(store_path)))
+            applied, refresh_ms, _ = measure(store.refresh)
+            assert applied == counts["inserted"] + 2 * counts["updated"] + counts["deleted"], (applied, counts)
+
+            for _ in range(10):
+                claims = claims_for(data, rng)
+                assert store.group_index.resolve(claims) == compiled.group_index.resolve(claims)
+            assert store.target_roles == compiled.target_roles
+            assert store.group_index.size == compiled.group_index.size
+
+            claims = claims_for(data, rng)
+            started = time.perf_counter()
+            for _ in range(100):
+                compiled.group_index.resolve(claims)
+            index_us = (time.perf_counter() - started) * 1e4
+            started = time.perf_counter()
+            for _ in range(100):
+                store.group_index.resolve(claims)
+            store_us = (time.perf_counter() - started) * 1e4
+            print(f"{size:>8} {json_path.stat().st_size / 1e6:>8.1f} {n:>8} {json_ms:>10.1f}ms {json_kb:>9.0f} "
+                  f"{convert_ms:>7.0f}ms {refresh_ms:>7.2f}ms {store_kb:>14.1f} {index_us:>8.0f}us {store_us:>6.0f}us")
+
+    print("\nStore resolution matched the in-memory RoleIndex after every edit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""Authorization checks with and without the per-role permission cache.
+
+Provisions ``--roles`` project roles of ``--dags`` DAGs each (the
+create_role.sh permission set), creates ``--users`` users with two project
+roles each and then simulates API requests the way the FAB auth manager serves
+them: the user is loaded in a fresh session and a page's worth of
+``AzureFabAuthManager.is_authorized_*`` checks run against it. Measures p50/p99 per
+request and SQL statements per request with ``PERMISSION_CACHE_TTL`` off and
+on, and checks that the cached permissions equal FAB's own query for every
+user. Afterwards it checks that the cache never serves stale permissions:
+
+- a permission granted to a role through the ORM (admin UI)
+- a DAG added to a role by declarative provisioning
+- a role assigned to a user
+- a permission revoked by another process (``airflow roles del-perms``)
+- a DAG pruned by ``provision-roles --prune`` in another process
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_permission_cache.py --roles 50 --dags 20 --users 200 --requests 2000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import percentile  # noqa: E402
+
+
+def seed_users(app, users: int, roles: list, rng: random.Random) -> list:
+    import sqlalchemy
+
+    sm = app.appbuilder.sm
+    user_table = sm.user_model.__table__
+    user_role = sm.user_model.roles.property.secondary
+    role_table = sm.role_model.__table__
+    with sm.get_session.get_bind().begin() as conn:
+        first_id = (conn.execute(sqlalchemy.select(sqlalchemy.func.max(user_table.c.id))).scalar() or 0) + 1
+        role_ids = dict(conn.execute(sqlalchemy.select(role_table.c.name, role_table.c.id)
+                                     .where(role_table.c.name.in_(roles))).all())
+        conn.execute(user_table.insert(), [
+            {"id": first_id + i, "first_name": "Bench", "last_name": f"User{i}", "username": f"bench{i}@example.com",
+             "email": f"bench{i}@example.com", "active": True}
+            for i in range(users)
+        ])
+        conn.execute(user_role.insert(), [
+            {"user_id": first_id + i, "role_id": role_ids[name]}
+            for i in range(users) for name in rng.sample(roles, 2)
+        ])
+    return list(range(first_id, first_id + users))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--dags", type=int, default=20, help="DAGs per role")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    home = harness.bootstrap()
+    app = harness.create_app()
+    from airflow_auth import permissions, provisioning  # noqa: E402 (reads the environment bootstrap() set)
+    sm = app.appbuilder.sm
+    engine = sm.get_session.get_bind()
+    cache = permissions.permission_cache
+
+    from airflow.api_fastapi.auth.managers.models.resource_details import AccessView, DagDetails
+    from airflow.providers.fab.auth_manager.models import User
+    from airflow.utils.session import create_session
+
+    from airflow_auth.auth_manager import AzureFabAuthManager
+
+    with open(harness.REPO_DIR / "role_permissions.json", encoding="utf-8") as f:
+        spec = json.load(f)
+    spec["roles"] = {f"BenchProject{r}": {"dags": [f"project{r}_dag{d}" for d in range(args.dags)]}
+                     for r in range(args.roles)}
+    with app.app_context():
+        provisioning.provision_role_permissions(sm, provisioning.expand_role_permissions(spec))
+        sm.get_session.remove()
+    user_ids = seed_users(app, args.users, list(spec["roles"]), rng)
+    dag_ids = [dag for role in spec["roles"].values() for dag in role["dags"]]
+    auth_manager = AzureFabAuthManager()
+
+    def request(user_id: int, dags: list) -> float:
+        """One API request: load the user like FabAuthManager.deserialize_user, then a page of checks."""
+        started = time.perf_counter()
+        with create_session() as session:
+            user = session.get(User, user_id)
+        for dag_id in dags:
+            auth_manager.is_authorized_dag(method="GET", details=DagDetails(id=dag_id), user=user)
+            auth_manager.is_authorized_dag(method="PUT", details=DagDetails(id=dag_id), user=user)
+        auth_manager.is_authorized_view(access_view=AccessView.WEBSITE, user=user)
+        auth_manager.is_authorized_configuration(method="GET", user=user)
+        auth_manager.is_authorized_pool(method="GET", user=user)
+        return (time.perf_counter() - started) * 1000
+
+    def perms_of(user_id: int) -> set:
+        """The permissions the auth manager's checks see."""
+        with create_session() as session:
+            return set(auth_manager._get_user_permissions(session.get(User, user_id)))
+
+    workload = [(rng.choice(user_ids), rng.sample(dag_ids, 5)) for _ in range(args.requests)]
+    ttl = cache.ttl
+    print(f"roles={args.roles} dags/role={args.dags} users={args.users} (2 roles each) checks/request=13")
+    print(f"{'phase':<16} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'requests/s':>11}")
+    failures = []
+    with app.app_context():
+        for name, cache_ttl in (("cache disabled", 0), ("cache enabled", ttl)):
+            cache.ttl = cache_ttl
+            cache.invalidate()
+            with harness.QueryCounter(engine) as counter:
+                started = time.perf_counter()
+                latencies = [request(user_id, dags) for user_id, dags in workload]
+                elapsed = time.perf_counter() - started
+            print(f"{name:<16} {len(latencies):>9} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} "
+                  f"{counter.total / len(latencies):>8.2f} {len(latencies) / elapsed:>11.1f}")
+
+        # Cached sets must equal FAB's own query
+        with create_session() as session:
+            expected = {user_id: set(session.get(User, user_id).perms) for user_id in user_ids}
+        wrong = [user_id for user_id in user_ids if perms_of(user_id) != expected[user_id]]
+        if wrong:
+            failures.append(f"{len(wrong)} users with wrong permissions")
+
+        user_id = user_ids[0]
+        with create_session() as session:
+            user = session.get(User, user_id)
+            role_name = user.roles[0].name
+        # Admin grants a permission through the ORM
+        perms_of(user_id)
+        sm.add_permission_to_role(sm.find_role(role_name), sm.create_permission("can_delete", "DAG:project0_dag0"))
+        sm.get_session.remove()
+        if ("can_delete", "DAG:project0_dag0") not in perms_of(user_id):
+            failures.append("ORM permission grant")
+
+        # Declarative provisioning adds a DAG
+        role_spec = dict(spec, roles={role_name: {"dags": spec["roles"][role_name]["dags"] + ["bench_new_dag"]}})
+        provisioning.provision_role_permissions(sm, provisioning.expand_role_permissions(role_spec))
+        sm.get_session.remove()
+        if ("can_read", "DAG:bench_new_dag") not in perms_of(user_id):
+            failures.append("provisioned DAG")
+
+        # A role assigned to the user
+        other = next(name for name in spec["roles"] if name not in {r.name for r in sm.get_user_by_id(user_id).roles})
+        user = sm.get_user_by_id(user_id)
+        user.roles.append(sm.find_role(other))
+        sm.get_session.commit()
+        sm.get_session.remove()
+        if ("can_read", f"DAG:{spec['roles'][other]['dags'][0]}") not in perms_of(user_id):
+            failures.append("role assignment")
+
+        # Revocations made by other processes reach this one within the check interval
+        def revoked_elsewhere(name: str, pair: tuple, command: list) -> None:
+            perms_of(user_id)
+            started = time.perf_counter()
+            subprocess.run(command, check=True, capture_output=True)
+            time.sleep(cache.check_interval)
+            if pair in perms_of(user_id):
+                failures.append(name)
+            print(f"{name}: {(time.perf_counter() - started) * 1000:.0f}ms to apply (incl. process start)")
+
+        print()
+        revoked_elsewhere("CLI permission revoke", ("can_delete", "DAG:project0_dag0"),
+                          [sys.executable, "-m", "airflow", "roles", "del-perms", role_name,
+                           "-a", "can_delete", "-r", "DAG:project0_dag0"])
+        spec_file = Path(home) / "role_permissions.json"
+        spec_file.write_text(json.dumps(dict(spec, roles={role_name: spec["roles"][role_name]})), encoding="utf-8")
+        revoked_elsewhere("provision-roles --prune", ("can_read", "DAG:bench_new_dag"),
+                          [sys.executable, str(harness.REPO_DIR / "auth_cli.py"), "provision-roles",
+                           str(spec_file), "--prune"])
+
+    print()
+    print(f"permission cache: {cache.stats()}")
+    print(f"Failures: {failures or 'none'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
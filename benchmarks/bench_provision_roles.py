@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Declarative role provisioning against a fresh metadata DB.
+
+Generates a ``role_permissions.json``-style spec with ``--roles`` project
+roles of ``--dags`` DAGs each (the create_role.sh permission set) and times:
+
+- dry run:      the diff only, nothing written
+- initial:      every role, resource, permission and link created in one transaction
+- unchanged:    re-running the same spec (must plan zero changes)
+- one new DAG:  a single role gains a DAG
+- prune:        a single role loses a DAG with --prune
+
+After each write the stored role permissions are compared with the spec.
+For scale, ``create_role.sh`` issues one ``airflow`` CLI process per permission:
+9 + 2 x DAGs per role.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_provision_roles.py --roles 200 --dags 10
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+
+SPEC_FILE = harness.REPO_DIR / "role_permissions.json"
+
+
+def build_spec(roles: int, dags: int) -> dict:
+    with open(SPEC_FILE, encoding="utf-8") as f:
+        spec = json.load(f)
+    spec["roles"] = {
+        f"BenchProject{i}": {"dags": [f"bench_project{i}_dag{d}" for d in range(dags)]} for i in range(roles)
+    }
+    return spec
+
+
+def stored_permissions(app, role_names) -> dict:
+    with app.app_context():
+        sm = app.appbuilder.sm
+        try:
+            roles = sm.get_session.query(sm.role_model).filter(sm.role_model.name.in_(list(role_names))).all()
+            return {role.name: {(p.action.name, p.resource.name) for p in role.permissions} for role in roles}
+        finally:
+            sm.get_session.remove()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roles", type=int, default=200)
+    parser.add_argument("--dags", type=int, default=10, help="DAGs per role")
+    args = parser.parse_args()
+
+    harness.bootstrap()
+    app = harness.create_app()
+    from airflow_auth import provisioning  # noqa: E402 (reads the environment bootstrap() set)
+    sm = app.appbuilder.sm
+    engine = sm.get_session.get_bind()
+
+    spec = build_spec(args.roles, args.dags)
+    added = copy.deepcopy(spec)
+    added["roles"]["BenchProject0"]["dags"].append("bench_project0_new_dag")
+    pruned = copy.deepcopy(spec)
+    pruned["roles"]["BenchProject0"]["dags"].pop()
+
+    phases = [
+        ("dry run", spec, False, True),
+        ("initial", spec, False, False),
+        ("unchanged", spec, False, False),
+        ("one new DAG", added, False, False),
+        ("prune", pruned, True, False),
+    ]
+    per_role = len(spec["defaults"]["permissions"]) + len(spec["defaults"]["dag_actions"]) * args.dags
+    print(f"roles={args.roles} dags/role={args.dags} permissions/role={per_role} "
+          f"(create_role.sh: {per_role * args.roles} CLI processes)")
+    print(f"{'phase':<12} {'grants':>7} {'revokes':>8} {'new res':>8} {'queries':>8} {'diff ms':>8} {'apply ms':>9} {'matches':>8}")
+    mismatched = []
+    for name, phase_spec, prune, dry_run in phases:
+        desired = provisioning.expand_role_permissions(phase_spec)
+        with app.app_context(), harness.QueryCounter(engine) as counter:
+            plan = provisioning.provision_role_permissions(sm, desired, prune=prune, dry_run=dry_run)
+            sm.get_session.remove()
+        matches = "-"
+        if not dry_run:
+            stored = stored_permissions(app, desired)
+            matches = "yes" if all(stored.get(role) == pairs for role, pairs in desired.items()) else "NO"
+            if matches != "yes":
+                mismatched.append(name)
+        if name == "unchanged" and plan:
+            mismatched.append("unchanged (planned changes)")
+        print(f"{name:<12} {sum(map(len, plan.grants.values())):>7} {sum(map(len, plan.revokes.values())):>8} "
+              f"{len(plan.new_resources):>8} {counter.total:>8} {plan.timings['diff'] * 1000:>8.1f} "
+              f"{plan.timings.get('apply', 0) * 1000:>9.1f} {matches:>8}")
+
+    print()
+    print(f"Mismatches: {mismatched or 'none'}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
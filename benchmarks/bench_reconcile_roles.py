@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Background role reconciliation of existing users after mapping changes.
+
+Seeds ``--users`` users with ``--groups`` groups each (a few of them mapped)
+directly into a fresh metadata DB, with their roles and last-seen claims as a
+login would leave them, then changes ``role_mapping.json`` and lets the
+watcher hand the diff to the reconciler:
+
+- one group:      one mapped group points at a new role
+- 1% of groups:   1% of the mapped groups point at new roles
+- wildcard rule:  a prefix rule is added (every user is re-checked)
+- no-op rewrite:  the file is rewritten with the same content (nothing to do)
+
+After each phase every user's stored roles are compared with the roles their
+claims resolve to under the new mapping. A few real logins first check that
+the login path records the claims.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_reconcile_roles.py --users 100000 --mapping-size 10000 --groups 20
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import Runner, build_mapping, build_responses  # noqa: E402
+
+
+def seed_users(app, mapping: dict, users: int, groups: int, mapped: int, rng: random.Random) -> dict:
+    """Insert users, their mapped roles and their packed claims; returns user id -> groups."""
+    import sqlalchemy
+
+    from airflow_auth import reconcile, settings
+    from airflow_auth.mapping import CompiledRoleMappings
+
+    sm = app.appbuilder.sm
+    engine = sm.get_session.get_bind()
+    user_table = sm.user_model.__table__
+    user_role = sm.user_model.roles.property.secondary
+    role_table = sm.role_model.__table__
+    index = CompiledRoleMappings(mapping).group_index
+    mapped_keys = list(mapping["group_mapping"])
+    claims_by_user = {}
+    with engine.begin() as conn:
+        first_id = (conn.execute(sqlalchemy.select(sqlalchemy.func.max(user_table.c.id))).scalar() or 0) + 1
+        conn.execute(user_table.insert(), [
+            {"id": first_id + i, "first_name": "Seeded", "last_name": f"User{i}", "username": f"seeded{i}@example.com",
+             "email": f"seeded{i}@example.com", "active": True}
+            for i in range(users)
+        ])
+        role_ids = dict(conn.execute(sqlalchemy.select(role_table.c.name, role_table.c.id)).all())
+        links, claims_rows = [], []
+        for i in range(users):
+            user_id = first_id + i
+            claims = rng.sample(mapped_keys, mapped) + [str(uuid.uuid4()) for _ in range(groups - mapped)]
+            claims_by_user[user_id] = claims
+            roles = index.resolve(claims)[0] or [settings.AUTH_USER_REGISTRATION_ROLE]
+            links.extend({"user_id": user_id, "role_id": role_ids[name]} for name in roles)
+            claims_rows.append({"user_id": user_id, "method": "group", "claims": reconcile.encode_claims(claims),
+                                "updated_at": time.time()})
+        conn.execute(user_role.insert(), links)
+        conn.execute(reconcile._user_claims_table.insert(), claims_rows)
+    return claims_by_user
+
+
+def mismatches(app, claims_by_user: dict) -> int:
+    import sqlalchemy
+
+    from airflow_auth import mapping_loader, settings
+
+    sm = app.appbuilder.sm
+    user_role = sm.user_model.roles.property.secondary
+    role_table = sm.role_model.__table__
+    stored = {}
+    with sm.get_session.get_bind().connect() as conn:
+        for user_id, name in conn.execute(sqlalchemy.select(user_role.c.user_id, role_table.c.name)
+                                          .join(role_table, role_table.c.id == user_role.c.role_id)):
+            stored.setdefault(user_id, set()).add(name)
+    index = mapping_loader.get_role_mappings().group_index
+    return sum(
+        1 for user_id, claims in claims_by_user.items()
+        if stored.get(user_id, set()) != set(index.resolve(claims)[0] or [settings.AUTH_USER_REGISTRATION_ROLE])
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--mapping-size", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=20, help="groups per user")
+    parser.add_argument("--mapped", type=int, default=3, help="mapped groups per user")
+    parser.add_argument("--batch-size", type=int, default=None, help="users per transaction (ROLE_RECONCILE_BATCH_SIZE)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mapping = build_mapping(args.mapping_size)
+    harness.bootstrap(role_mapping=mapping)
+    app = harness.create_app()
+    from airflow_auth import mapping_loader, reconcile  # noqa: E402 (reads the environment bootstrap() set)
+    reconciler = reconcile.role_reconciler
+    if args.batch_size:
+        reconciler.batch_size = args.batch_size
+    watcher = mapping_loader.RoleMappingWatcher(interval=3600)
+    watcher.check()
+
+    failures = []
+
+    # The login path stores what the reconciler reads
+    runner = Runner(app)
+    responses = build_responses(mapping, 5, args.groups, 0.2, rng)
+    runner.run(responses, threads=1)
+    with app.app_context():
+        sm = app.appbuilder.sm
+        for resp in responses:
+            user = sm.find_user(username=resp["id_token_claims"]["preferred_username"])
+            blob = sm.get_session.execute(reconcile._user_claims_table.select()
+                                          .where(reconcile._user_claims_table.c.user_id == user.id)).one().claims
+            if set(reconcile.decode_claims(bytes(blob))) != set(resp["id_token_claims"]["groups"]):
+                failures.append(f"claims of {user.username} not recorded")
+        sm.get_session.remove()
+
+    started = time.perf_counter()
+    claims_by_user = seed_users(app, mapping, args.users, args.groups, args.mapped, rng)
+    sample = next(iter(claims_by_user.values()))
+    print(f"users={args.users} mapping={args.mapping_size} groups/user={args.groups} mapped/user={args.mapped} "
+          f"batch={reconciler.batch_size} (seeded in {time.perf_counter() - started:.1f}s, "
+          f"claims {len(reconcile.encode_claims(sample))}B/user packed vs {len(str(sample))}B as text)")
+
+    group_keys = list(mapping["group_mapping"])
+    phases = []
+    changed = copy.deepcopy(mapping)
+    changed["group_mapping"][group_keys[0]] = "BenchRemapped0"
+    phases.append(("one group", changed))
+    changed = copy.deepcopy(changed)
+    for i, key in enumerate(rng.sample(group_keys, max(1, len(group_keys) // 100))):
+        changed["group_mapping"][key] = f"BenchRemapped{i % 10}"
+    phases.append(("1% of groups", changed))
+    changed = copy.deepcopy(changed)
+    changed["group_mapping"]["0*"] = "BenchWildcard"
+    phases.append(("wildcard rule", changed))
+    phases.append(("no-op rewrite", copy.deepcopy(changed)))
+
+    engine = app.appbuilder.sm.get_session.get_bind()
+    print(f"{'phase':<14} {'scanned':>8} {'affected':>9} {'changed':>8} {'+roles':>7} {'-roles':>7} "
+          f"{'queries':>8} {'ms':>8} {'wrong':>6}")
+    for name, phase_mapping in phases:
+        reconciler.last_result = None
+        time.sleep(0.01)  # distinct mtime
+        harness.write_role_mapping(phase_mapping)
+        with harness.QueryCounter(engine) as counter:
+            watcher.check()
+            reconciler.submit(frozenset).result()  # the executor is serial: waits for the watcher's job
+        result = reconciler.last_result or {"scanned": 0, "affected": 0, "users_changed": 0, "added": 0,
+                                            "removed": 0, "duration_ms": 0.0}
+        wrong = mismatches(app, claims_by_user)
+        if wrong:
+            failures.append(f"{name}: {wrong} users with stale roles")
+        print(f"{name:<14} {result['scanned']:>8} {result['affected']:>9} {result['users_changed']:>8} "
+              f"{result['added']:>7} {result['removed']:>7} {counter.total:>8} {result['duration_ms']:>8.0f} {wrong:>6}")
+
+    print()
+    print(f"Failures: {failures or 'none'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
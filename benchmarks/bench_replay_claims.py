@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""Offline claim replay (``auth_cli.py replay-claims``) throughput and memory.
+
+Writes a JSONL of ``--records`` synthetic captured logins (half as full OAuth
+responses, half as bare claim objects, a few with a groups overage), an old
+mapping and a new one with 1% of the groups remapped plus a prefix rule, and
+runs the CLI for every ``--workers`` count and record count. Reports
+records/s and the peak RSS of the largest process, which should not grow with
+the record count. Every run's report must equal a reference computed here.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_replay_claims.py --records 100000,1000000 --workers 1,4
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import _ints, build_mapping  # noqa: E402
+
+DEFAULT_ROLE = "Unassigned"
+WILDCARD_PREFIX = "0"
+WILDCARD_ROLE = "BenchWildcard"
+
+# Peak RSS of the biggest process in the CLI's tree (the CLI itself or a pool worker)
+_MEASURE = (
+    "import resource, subprocess, sys; "
+    "subprocess.run(sys.argv[1:], check=True, stdout=subprocess.DEVNULL); "
+    "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)"
+)
+
+
+def write_claims(path: str, mapping: dict, records: int, groups: int, mapped: int, rng: random.Random) -> None:
+    keys = list(mapping["group_mapping"])
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(records):
+            claims = {"oid": str(uuid.uuid4()), "preferred_username": f"user{i}@example.com"}
+            if i % 100 == 0:
+                claims["_claim_names"] = {"groups": "src1"}  # overage: no groups in the token
+            else:
+                claims["groups"] = rng.sample(keys, mapped) + [str(uuid.uuid4()) for _ in range(groups - mapped)]
+            record = {"id_token_claims": claims, "userinfo": {}} if i % 2 else claims
+            f.write(json.dumps(record) + "\n")
+
+
+def resolve(group_mapping: dict, groups: list) -> set:
+    roles = {group_mapping[g] for g in groups if g in group_mapping}
+    if f"{WILDCARD_PREFIX}*" in group_mapping:
+        roles |= {WILDCARD_ROLE for g in groups if g.startswith(WILDCARD_PREFIX)}
+    return roles or {DEFAULT_ROLE}
+
+
+def reference(path: str, old: dict, new: dict) -> dict:
+    changed, gained, lost = 0, Counter(), Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            groups = record.get("id_token_claims", record).get("groups", [])
+            before, after = resolve(old["group_mapping"], groups), resolve(new["group_mapping"], groups)
+            if before != after:
+                changed += 1
+                gained.update(after - before)
+                lost.update(before - after)
+    return {"changed": changed, "gained": dict(gained), "lost": dict(lost)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=_ints, default=[100000, 300000])
+    parser.add_argument("--workers", type=_ints, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--mapping-size", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=20, help="groups per token")
+    parser.add_argument("--mapped", type=int, default=3, help="mapped groups per token")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    home = harness.bootstrap()
+    old = build_mapping(args.mapping_size)
+    new = json.loads(json.dumps(old))
+    for i, key in enumerate(rng.sample(list(new["group_mapping"]), args.mapping_size // 100)):
+        new["group_mapping"][key] = f"BenchRemapped{i % 10}"
+    new["group_mapping"][f"{WILDCARD_PREFIX}*"] = WILDCARD_ROLE
+    old_file, new_file = os.path.join(home, "old.json"), os.path.join(home, "new.json")
+    for path, mapping in ((old_file, old), (new_file, new)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(mapping, f)
+
+    print(f"mapping={args.mapping_size} groups/token={args.groups} cores={os.cpu_count()}")
+    print(f"{'records':>9} {'workers':>8} {'seconds':>8} {'records/s':>10} {'peak RSS MB':>12} {'changed':>8} {'matches':>8}")
+    mismatched = []
+    for records in args.records:
+        claims_file = os.path.join(home, f"claims-{records}.jsonl")
+        write_claims(claims_file, old, records, args.groups, args.mapped, rng)
+        expected = reference(claims_file, old, new)
+        for workers in args.workers:
+            report_file = tempfile.mktemp(suffix=".json", dir=home)
+            command = [sys.executable, str(harness.REPO_DIR / "auth_cli.py"), "replay-claims", claims_file,
+                       new_file, "--old-mapping", old_file, "--method", "group", "--workers", str(workers),
+                       "--report", report_file]
+            started = time.perf_counter()
+            peak_kb = int(subprocess.run([sys.executable, "-c", _MEASURE, *command], check=True,
+                                         capture_output=True, text=True).stdout)
+            elapsed = time.perf_counter() - started
+            with open(report_file, encoding="utf-8") as f:
+                counts = json.load(f)["methods"]["group"]
+            got = {
+                "changed": counts["changed"],
+                "gained": {role: c["gained"] for role, c in counts["roles"].items() if c["gained"]},
+                "lost": {role: c["lost"] for role, c in counts["roles"].items() if c["lost"]},
+            }
+            matches = got == expected and counts["records"] == records
+            if not matches:
+                mismatched.append(f"records={records} workers={workers}")
+            print(f"{records:>9} {workers:>8} {elapsed:>8.1f} {records / elapsed:>10.0f} {peak_kb / 1024:>12.1f} "
+                  f"{counts['changed']:>8} {'yes' if matches else 'NO':>8}")
+
+    print()
+    print(f"Mismatches: {mismatched or 'none'}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Benchmark group -> role resolution as the role mapping grows.
+
+Compares the compiled :class:`RoleIndex` used by ``CustomSecurityManager``
+against the legacy per-group dict scan (which also built ``list(keys())`` for
+every unknown group). Login cost with the compiled index should stay flat as
+the mapping grows to 50k entries.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_role_resolution.py [--groups 300] [--sizes 100,1000,10000,50000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Times per-process compiles of temp files: keep them out of any shared snapshot
+os.environ["ROLE_MAPPING_SNAPSHOT_FILE"] = ""
+
+from airflow_auth.mapping_loader import load_compiled_role_mappings  # noqa: E402
+from airflow_auth.telemetry import logger  # noqa: E402
+
+logger.setLevel(logging.WARNING)
+
+
+def legacy_resolve(groups, group_mapping):
+    """Resolution as implemented before the compiled index."""
+    mapped = []
+    for group in groups:
+        if group in group_mapping:
+            mapped.append(group_mapping[group])
+        else:
+            list(group_mapping.keys())
+    return list(dict.fromkeys(mapped))
+
+
+def build_mapping(size: int, n_roles: int = 200) -> dict:
+    return {str(uuid.uuid4()): f"Project{i % n_roles}" for i in range(size)}
+
+
+def build_groups(group_mapping: dict, n_groups: int, hit_ratio: float) -> list:
+    keys = list(group_mapping)
+    n_hits = min(int(n_groups * hit_ratio), len(keys))
+    return keys[:n_hits] + [str(uuid.uuid4()) for _ in range(n_groups - n_hits)]
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=300, help="groups per user token")
+    parser.add_argument("--hit-ratio", type=float, default=0.1, help="fraction of token groups present in the mapping")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="comma separated mapping sizes")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the compiled index")
+    args = parser.parse_args()
+
+    print(f"{'mapping':>8} {'compile ms':>11} {'indexed us/login':>17} {'legacy us/login':>16}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        group_mapping = build_mapping(size)
+        groups = build_groups(group_mapping, args.groups, args.hit_ratio)
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"role_mapping": {}, "group_mapping": group_mapping}, f)
+        try:
+            start = time.perf_counter()
+            compiled = load_compiled_role_mappings(f.name, force_reload=True)
+            compile_ms = (time.perf_counter() - start) * 1e3
+        finally:
+            os.unlink(f.name)
+
+        index = compiled.group_index
+        assert sorted(index.resolve(groups)[0]) == sorted(legacy_resolve(groups, group_mapping))
+        indexed_us = timeit(lambda: index.resolve(groups), args.repeat)
+        legacy = "-" if args.skip_legacy else f"{timeit(lambda: legacy_resolve(groups, group_mapping), max(1, args.repeat // 20)):.1f}"
+        print(f"{size:>8} {compile_ms:>11.1f} {indexed_us:>17.1f} {legacy:>16}")
+
+
+if __name__ == "__main__":
+    main()
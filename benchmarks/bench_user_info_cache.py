@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Repeat logins with and without the memoized user_info.
+
+Simulates session expiry and several open tabs: a population of users logs
+in once, then keeps logging in again with unchanged claims. The repeat
+logins are measured with ``user_info_cache`` disabled and enabled (p50/p99,
+SQL statements per login, logins/s, hit rate). Afterwards it checks that
+the cache never serves stale roles:
+
+- a mapping change (new version) re-maps the affected user on the next login
+- an admin removing a user's role is undone by that user's next login
+- a changed group membership in the token resolves to the new roles
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/bench_user_info_cache.py --mapping-size 10000 --groups 100 --users 200 --logins 2000
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+from bench_login import Runner, build_mapping, build_responses, percentile  # noqa: E402
+
+
+def _db_roles(app, username: str) -> set:
+    with app.app_context():
+        sm = app.appbuilder.sm
+        try:
+            return {role.name for role in sm.find_user(username=username).roles}
+        finally:
+            sm.get_session.remove()
+
+
+def _expected_roles(mapping: dict, resp: dict) -> set:
+    group_mapping = mapping["group_mapping"]
+    return {group_mapping[g] for g in resp["id_token_claims"]["groups"] if g in group_mapping} or {"Unassigned"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mapping-size", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=100, help="groups per token")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=2000, help="repeat logins per phase")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--hit-ratio", type=float, default=0.05, help="fraction of token groups present in the mapping")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mapping = build_mapping(args.mapping_size)
+    harness.bootstrap(role_mapping=mapping)
+    app = harness.create_app()
+    runner = Runner(app)
+    from airflow_auth import mapping_loader, user_info  # noqa: E402 (reads the environment bootstrap() set)
+    cache = user_info.user_info_cache
+    engine = runner.sm.get_session.get_bind()
+    mapping_loader.start_role_mapping_watcher().stop()  # rely on explicit reloads below
+
+    responses = build_responses(mapping, args.users, args.groups, args.hit_ratio, rng)
+    runner.run(responses, threads=1)
+    workload = [rng.choice(responses) for _ in range(args.logins)]
+
+    ttl = cache.ttl
+    print(f"mapping={args.mapping_size} groups/token={args.groups} users={args.users} threads={args.threads}")
+    print(f"{'phase':<16} {'logins':>7} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'writes':>7} {'logins/s':>9} {'hit rate':>9}")
+    for name, cache_ttl in (("cache disabled", 0), ("cache enabled", ttl)):
+        cache.ttl = cache_ttl
+        cache.clear()
+        if cache_ttl:
+            runner.run(responses, threads=1)  # entries from this worker's previous logins
+        hits, misses = cache.hits, cache.misses
+        with harness.QueryCounter(engine) as counter:
+            started = time.perf_counter()
+            latencies = runner.run(workload, args.threads)
+            elapsed = time.perf_counter() - started
+        lookups = (cache.hits - hits) + (cache.misses - misses)
+        hit_rate = (cache.hits - hits) / lookups if lookups else 0.0
+        print(f"{name:<16} {len(latencies):>7} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} "
+              f"{counter.total / len(latencies):>8.2f} {counter.writes / len(latencies):>7.2f} "
+              f"{len(latencies) / elapsed:>9.1f} {hit_rate:>9.1%}")
+
+    stale = []
+    resp = responses[0]
+    username = resp["id_token_claims"]["preferred_username"]
+
+    # Mapping change: point one of the user's mapped groups at a new role
+    changed = copy.deepcopy(mapping)
+    mapped_group = next(g for g in resp["id_token_claims"]["groups"] if g in changed["group_mapping"])
+    changed["group_mapping"][mapped_group] = "BenchRemapped"
+    harness.write_role_mapping(changed)
+    time.sleep(0.01)
+    mapping_loader.load_compiled_role_mappings(force_reload=True)
+    runner.login(resp)
+    if _db_roles(app, username) != _expected_roles(changed, resp):
+        stale.append("mapping change")
+
+    # Admin edit: drop one of the user's roles outside the login path
+    with app.app_context():
+        sm = app.appbuilder.sm
+        user = sm.find_user(username=username)
+        user.roles.remove(user.roles[0])
+        sm.get_session.commit()
+        sm.get_session.remove()
+    runner.login(resp)
+    if _db_roles(app, username) != _expected_roles(changed, resp):
+        stale.append("admin role edit")
+
+    # Membership change: the token now carries one more mapped group
+    extra = next(g for g, role in changed["group_mapping"].items() if role not in _expected_roles(changed, resp))
+    resp = copy.deepcopy(resp)
+    resp["id_token_claims"]["groups"].append(extra)
+    runner.login(resp)
+    if _db_roles(app, username) != _expected_roles(changed, resp):
+        stale.append("group membership change")
+
+    print()
+    print(f"user_info cache: {cache.stats()}")
+    print(f"Stale results: {stale or 'none'}")
+    sys.exit(1 if stale else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Shared setup for login-path benchmarks.
+
+Builds the FAB auth-manager Flask app with ``webserver_config.py`` on a local
+SQLite metadata DB, so ``CustomSecurityManager`` can be driven end to end
+without Docker, Postgres or Azure.
+
+:func:`bootstrap` must run before anything imports ``airflow`` or ``airflow_auth``
+(its settings are read from the environment at import).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+
+def bootstrap(home: Optional[str] = None, role_mapping: Optional[dict] = None, method: str = "group") -> str:
+    """Point Airflow at a throwaway AIRFLOW_HOME / SQLite DB and this repo's webserver_config.py.
+
+    Returns:
+        The AIRFLOW_HOME directory used.
+    """
+    home = home or tempfile.mkdtemp(prefix="airflow-bench-")
+    mapping_file = os.path.join(home, "role_mapping.json")
+    with open(mapping_file, "w", encoding="utf-8") as f:
+        json.dump(role_mapping or {"role_mapping": {}, "group_mapping": {}}, f)
+
+    os.environ.update({
+        "AIRFLOW_HOME": home,
+        "AIRFLOW__DATABASE__SQL_ALCHEMY_CONN": f"sqlite:///{home}/airflow.db",
+        "AIRFLOW__CORE__AUTH_MANAGER": "airflow_auth.auth_manager.AzureFabAuthManager",
+        "AIRFLOW__FAB__CONFIG_FILE": str(REPO_DIR / "webserver_config.py"),
+        "AIRFLOW__CORE__LOAD_EXAMPLES": "false",
+        "AIRFLOW__LOGGING__LOGGING_LEVEL": "WARNING",
+        "ROLE_MAPPING_FILE": mapping_file,
+        "ROLE_MAPPING_METHOD": method,
+        "JWKS_CACHE_FILE": os.path.join(home, "jwks_cache.json"),
+    })
+    # Subprocesses (airflow CLI, auth_cli.py) import the auth manager from this repo
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")]))
+    # Synthetic tokens are HS256-signed; bench_jwks.py turns verification on with its own keys
+    os.environ.setdefault("AZURE_VERIFY_ID_TOKEN", "false")
+    for name in ("AZURE_TENANT_ID", "AZURE_CLIENT_ID", "AZURE_CLIENT_SECRET"):
+        os.environ.setdefault(name, "benchmark")
+    return home
+
+
+def create_app():
+    """Initialise the metadata DB and return the FAB Flask app (``app.appbuilder.sm`` is the security manager).
+
+    Benchmarks drive the security manager without starting the API server, so the
+    ``auth_cli.py create-tables`` step of airflow-init and the worker warm-up that
+    AzureFabAuthManager runs at worker start are run here.
+    """
+    from airflow import settings
+    from airflow.utils import db
+
+    db.initdb()
+
+    from airflow_auth.db import create_auth_tables
+
+    create_auth_tables(settings.engine)
+
+    from airflow.providers.fab.www.app import create_app as create_fab_app
+
+    app = create_fab_app(enable_plugins=False)
+    logging.getLogger("airflow_auth").setLevel(logging.WARNING)
+    _configure_sqlite(app.appbuilder.sm.get_session.get_bind())
+    with app.app_context():
+        app.appbuilder.sm._warm_up_once()
+    return app
+
+
+def _configure_sqlite(engine) -> None:
+    """Let concurrent SQLite writers wait for the lock instead of failing with 'database is locked'."""
+    from sqlalchemy import event
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    def _on_connect(dbapi_conn, _record):
+        dbapi_conn.execute("PRAGMA busy_timeout = 30000")
+        dbapi_conn.execute("PRAGMA journal_mode = WAL")
+
+    event.listen(engine, "connect", _on_connect)
+    engine.dispose()
+
+
+def write_role_mapping(role_mapping: dict) -> None:
+    """Replace the benchmark's role_mapping.json (see :func:`bootstrap`)."""
+    with open(os.environ["ROLE_MAPPING_FILE"], "w", encoding="utf-8") as f:
+        json.dump(role_mapping, f)
+
+
+def token_response(claims: dict, access_token: str = "benchmark-access-token") -> dict:
+    """A synthetic Azure token response, shaped like what the OAuth callback hands to get_oauth_user_info."""
+    import jwt
+
+    return {
+        "access_token": access_token,
+        "id_token": jwt.encode(claims, "benchmark-signing-key-not-verified-by-fab", algorithm="HS256"),
+        "id_token_claims": claims,
+        "userinfo": {},
+    }
+
+
+class Runner:
+    """Log users in through ``get_oauth_user_info`` and ``auth_user_oauth``, like the OAuth callback."""
+
+    def __init__(self, app):
+        self.app = app
+        self.sm = app.appbuilder.sm
+
+    def login(self, resp: dict) -> float:
+        started = time.perf_counter()
+        with self.app.test_request_context():
+            try:
+                user_info = self.sm.get_oauth_user_info("azure", resp)
+                if self.sm.auth_user_oauth(user_info) is None:
+                    raise RuntimeError(f"login failed for {user_info.get('username')}")
+            finally:
+                self.sm.get_session.remove()
+        return (time.perf_counter() - started) * 1000
+
+    def run(self, responses: List[dict], threads: int) -> List[float]:
+        if threads == 1:
+            return [self.login(resp) for resp in responses]
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(self.login, responses))
+
+
+class ErrorLog(logging.Handler):
+    """Collect the ERROR records of the ``airflow_auth`` logger while in use."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records: List[str] = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+    def __enter__(self) -> "ErrorLog":
+        logging.getLogger("airflow_auth").addHandler(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        logging.getLogger("airflow_auth").removeHandler(self)
+
+
+class QueryCounter:
+    """Count SQL statements executed on an engine, per statement verb."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._event = event
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.statements: List[str] = []
+        self.errors: List[BaseException] = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append(statement.split(None, 1)[0].upper())
+
+    def _on_error(self, context):
+        with self._lock:
+            self.errors.append(context.original_exception)
+
+    def __enter__(self) -> "QueryCounter":
+        self._event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        self._event.listen(self.engine, "handle_error", self._on_error)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        self._event.remove(self.engine, "handle_error", self._on_error)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.statements.clear()
+            self.errors.clear()
+
+    @property
+    def total(self) -> int:
+        return len(self.statements)
+
+    @property
+    def writes(self) -> int:
+        return sum(1 for verb in self.statements if verb in ("INSERT", "UPDATE", "DELETE"))
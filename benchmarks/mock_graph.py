@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Local mock of the Microsoft Graph endpoints used for groups overage.
+
+Implements ``POST /v1.0/me/checkMemberGroups`` and ``POST /v1.0/me/getMemberGroups``.
+The bearer token identifies the user: memberships are registered per token.
+
+Usage:
+    server = MockGraphServer(latency=0.02).start()
+    server.add_user("token-for-alice", ["group-id", ...])
+    os.environ["GRAPH_API_URL"] = server.url
+    ...
+    server.stop()
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional, Set
+
+
+class MockGraphServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.memberships: Dict[str, Set[str]] = {}
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1.0"
+
+    def add_user(self, token: str, groups: Iterable[str]) -> None:
+        self.memberships[token] = set(groups)
+
+    def start(self) -> "MockGraphServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-graph", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling is exercised
+
+            def log_message(self, *_args):
+                pass
+
+            def _reply(self, status: int, payload: dict) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests[self.path] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+                groups = server.memberships.get(token)
+                if groups is None:
+                    self._reply(401, {"error": {"code": "InvalidAuthenticationToken"}})
+                elif self.path == "/v1.0/me/checkMemberGroups":
+                    group_ids = body.get("groupIds", [])
+                    if len(group_ids) > 20:
+                        self._reply(400, {"error": {"code": "Request_BadRequest"}})
+                    else:
+                        self._reply(200, {"value": [g for g in group_ids if g in groups]})
+                elif self.path == "/v1.0/me/getMemberGroups":
+                    self._reply(200, {"value": sorted(groups)})
+                else:
+                    self._reply(404, {"error": {"code": "NotFound"}})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+    import uuid
+
+    parser = argparse.ArgumentParser(description="Run a mock Graph server with random users")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--groups-per-user", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    mock = MockGraphServer(port=args.port, latency=args.latency).start()
+    for i in range(args.users):
+        mock.add_user(f"user{i}", [str(uuid.uuid4()) for _ in range(args.groups_per_user)])
+    print(f"Mock Graph at {mock.url}; bearer tokens user0..user{args.users - 1}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Local stand-in for the tenant's JWKS endpoint, with key rotation.
+
+Serves ``GET /discovery/v2.0/keys`` and signs RS256 id_tokens with its
+current key, like Azure AD does.
+
+Usage:
+    server = MockJwksServer().start()
+    token = server.sign({"aud": ..., "iss": ..., ...})
+    server.rotate()          # publish a new key and start signing with it
+    server.stop()
+"""
+from __future__ import annotations
+
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+
+class MockJwksServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, keep: int = 2):
+        self.keep = keep  # published keys, newest last (Azure keeps the previous key around)
+        self.keys: List[tuple] = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+        self.rotate()
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/discovery/v2.0/keys"
+
+    @property
+    def kid(self) -> str:
+        return self.keys[-1][0]
+
+    def rotate(self) -> str:
+        """Publish a new signing key, drop the oldest beyond ``keep`` and return the new kid."""
+        kid = uuid.uuid4().hex
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with self._lock:
+            self.keys = (self.keys + [(kid, private_key)])[-self.keep:]
+        return kid
+
+    def jwks(self) -> dict:
+        keys = []
+        for kid, private_key in self.keys:
+            jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+            jwk.update({"kid": kid, "use": "sig"})
+            keys.append(jwk)
+        return {"keys": keys}
+
+    def sign(self, claims: dict, kid: Optional[str] = None, private_key=None) -> str:
+        """Sign with the current key (or an explicit kid / foreign key to build bad tokens)."""
+        kid = kid or self.kid
+        if private_key is None:
+            private_key = dict(self.keys).get(kid) or self.keys[-1][1]
+        return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+    def start(self) -> "MockJwksServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-jwks", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    body = json.dumps(server.jwks()).encode()
+                status = 200 if self.path == "/discovery/v2.0/keys" else 404
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
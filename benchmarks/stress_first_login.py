@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Stress concurrent first logins that all need the same, not-yet-created roles.
+
+Many threads log in distinct users whose mapped roles do not exist yet. Every
+user must end up with every role, with no failed assignments and no
+duplicate-key errors reaching the database driver.
+
+Usage (needs the same Airflow/FAB packages as the webserver):
+    python benchmarks/stress_first_login.py [--threads 32] [--roles 5]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import harness  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--roles", type=int, default=5, help="new roles every user is mapped to")
+    args = parser.parse_args()
+
+    harness.bootstrap()
+    app = harness.create_app()
+    sm = app.appbuilder.sm
+
+    role_keys = [f"StressRole{i}" for i in range(args.roles)]
+    start = threading.Barrier(args.threads)
+
+    def login(i: int):
+        if i < args.threads:
+            start.wait()
+        with app.test_request_context():
+            try:
+                user = sm.auth_user_oauth({
+                    "username": f"stress{i}",
+                    "email": f"stress{i}@example.com",
+                    "first_name": "Stress",
+                    "last_name": str(i),
+                    "role_keys": role_keys,
+                })
+                return sorted(r.name for r in user.roles) if user else None
+            finally:
+                sm.get_session.remove()
+
+    with harness.ErrorLog() as failures, harness.QueryCounter(sm.get_session.get_bind()) as counter:
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(login, range(args.users)))
+
+    duplicate_errors = [e for e in counter.errors if "unique" in str(e).lower() or "duplicate" in str(e).lower()]
+    wrong = [r for r in results if r != sorted(role_keys)]
+    with app.app_context():
+        role_rows = sm.get_session.query(sm.role_model).filter(sm.role_model.name.in_(role_keys)).count()
+
+    print(f"users={args.users} threads={args.threads} roles={args.roles}")
+    print(f"users with wrong roles : {len(wrong)}")
+    print(f"error log records      : {len(failures.records)}")
+    print(f"duplicate-key errors   : {len(duplicate_errors)}")
+    print(f"driver errors (total)  : {len(counter.errors)}")
+    print(f"role rows in DB        : {role_rows} (expected {args.roles})")
+    for message in failures.records[:5]:
+        print(f"  {message}")
+    sys.exit(1 if wrong or failures.records or duplicate_errors or role_rows != args.roles else 0)
+
+
+if __name__ == "__main__":
+    main()
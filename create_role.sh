@@ -20,35 +20,19 @@ check_running() {
   fi
 }
 
-create_role() {
-  local role=$1
-  run_cli roles create "$role" || warn "Role '$role' may already exist"
-  run_cli roles add-perms "$role" -a can_read -r Website || warn "Permission Website already set"
-}
-
-add_dag_perms() {
+provision_role() {
   local role="$1"; shift
-  local dags=("$@")
-
-  # Grant UI menu access
-  run_cli roles add-perms "$role" -a menu_access -r DAGs        || warn "menu_access DAGs"
-  run_cli roles add-perms "$role" -a menu_access -r Browse      || warn "menu_access Browse"
-  run_cli roles add-perms "$role" -a menu_access -r Assets      || warn "menu_access Assets"
-
-  # Required resources with correct names (non-DAG scoped)
-  run_cli roles add-perms "$role" -a can_read -r "Task Instances" || warn "can_read Task Instances"
-  run_cli roles add-perms "$role" -a can_read -r "Task Logs"      || warn "can_read Task Logs"
-  run_cli roles add-perms "$role" -a can_read -r "DAG Code"       || warn "can_read DAG Code"
-  run_cli roles add-perms "$role" -a can_read -r "DAG Runs"       || warn "can_read DAG Runs"
-  run_cli roles add-perms "$role" -a can_read -r "XComs"          || warn "can_read XComs"
-
-  for dag in "${dags[@]}"; do
-    log "🔐 Adding DAG-specific perms for '$dag' to role '$role'"
-
-    run_cli roles add-perms "$role" -a can_read -r "DAG:$dag"    || warn "can_read DAG:$dag"
-    run_cli roles add-perms "$role" -a can_edit -r "DAG:$dag"    || warn "can_edit DAG:$dag"
-    # No can_trigger, skip or define custom if needed
+  local dag_args=()
+  for dag in "$@"; do
+    dag_args+=(--dag "$dag")
   done
+
+  # One process adds the DAGs to the role in role_permissions.json (so a later
+  # provision-roles --prune keeps them), diffs the role against the spec and
+  # applies every missing permission in a single transaction
+  log "🔐 Provisioning role '$role' with DAGs: $*"
+  docker compose exec -T "$DOCKER_SERVICE" python /opt/airflow/auth_cli.py \
+    provision-roles /opt/airflow/role_permissions.json --role "$role" "${dag_args[@]}"
 }
 
 list_roles() {
@@ -59,6 +43,12 @@ usage() {
   cat <<EOF
 Usage: $SCRIPT_NAME ROLE DAG_ID [DAG_ID...]
 Example: $SCRIPT_NAME ProjectA scb_ap1234_simple_dag scb_ap1234_other_dag
+
+Grants the default permissions from role_permissions.json plus can_read/can_edit
+on each DAG. The DAGs are added to the role in role_permissions.json, so they
+survive a later 'provision-roles --prune'. To manage many roles, declare them
+in role_permissions.json and run:
+  docker compose exec $DOCKER_SERVICE python /opt/airflow/auth_cli.py provision-roles --dry-run
 EOF
   exit 1
 }
@@ -67,8 +57,7 @@ main() {
   if [ $# -lt 2 ]; then usage; fi
   check_running
   local role=$1; shift
-  create_role "$role"
-  add_dag_perms "$role" "$@"
+  provision_role "$role" "$@"
   echo
   list_roles
 }
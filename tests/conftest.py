@@ -0,0 +1,46 @@
+"""Shared fixtures: the FAB app with webserver_config.py on a throwaway SQLite metadata DB.
+
+The setup is the benchmarks' (``benchmarks/harness.py``). Its environment has to be in
+place before ``airflow`` or ``airflow_auth`` is imported, so it is set when this module loads.
+
+Run with ``python -m pytest tests`` (needs the same Airflow/FAB packages as the webserver).
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import harness  # noqa: E402
+
+GROUP_A = "0d4a1c58-7b1e-4c33-9d0b-2a51f7c3e001"
+GROUP_B = "0d4a1c58-7b1e-4c33-9d0b-2a51f7c3e002"
+ROLE_MAPPING = {
+    "role_mapping": {"Airflow.TestA": "TestProjectA"},
+    "group_mapping": {GROUP_A: "TestProjectA", GROUP_B: "TestProjectB"},
+}
+
+harness.bootstrap(role_mapping=ROLE_MAPPING, method="group")
+
+
+@pytest.fixture(scope="session")
+def app():
+    return harness.create_app()
+
+
+@pytest.fixture(scope="session")
+def sm(app):
+    return app.appbuilder.sm
+
+
+@pytest.fixture(scope="session")
+def engine(sm):
+    return sm.get_session.get_bind()
+
+
+@pytest.fixture(scope="session")
+def runner(app):
+    return harness.Runner(app)
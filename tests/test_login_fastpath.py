@@ -0,0 +1,63 @@
+"""A repeat login whose roles did not change must not write to the metadata DB."""
+from __future__ import annotations
+
+import uuid
+
+import harness
+from conftest import GROUP_A, GROUP_B
+
+
+def _response(username: str, groups: list) -> dict:
+    return harness.token_response({
+        "oid": str(uuid.uuid5(uuid.NAMESPACE_DNS, username)),
+        "name": username,
+        "preferred_username": username,
+        "email": username,
+        "given_name": "Test",
+        "family_name": username.split("@")[0],
+        "groups": groups,
+    })
+
+
+def _roles_of(app, sm, username: str) -> list:
+    with app.app_context():
+        try:
+            return sorted(role.name for role in sm.find_user(username=username).roles)
+        finally:
+            sm.get_session.remove()
+
+
+def test_repeat_login_makes_no_writes(app, sm, engine, runner):
+    resp = _response("fastpath-cached@example.com", [GROUP_A])
+    runner.login(resp)
+    
+    with harness.QueryCounter(engine) as counter:
+        runner.login(resp)
+    
+    assert counter.writes == 0, counter.statements
+    assert _roles_of(app, sm, "fastpath-cached@example.com") == ["TestProjectA"]
+
+
+def test_repeat_login_after_user_info_expiry_makes_no_writes(app, sm, engine, runner):
+    from airflow_auth.user_info import user_info_cache
+    
+    resp = _response("fastpath-expired@example.com", [GROUP_A, GROUP_B])
+    runner.login(resp)
+    # Without the memoized user_info the login resolves the roles again and compares them with the DB
+    user_info_cache.clear()
+    
+    with harness.QueryCounter(engine) as counter:
+        runner.login(resp)
+    
+    assert counter.writes == 0, counter.statements
+    assert _roles_of(app, sm, "fastpath-expired@example.com") == ["TestProjectA", "TestProjectB"]
+
+
+def test_login_with_changed_roles_writes_the_difference(app, sm, engine, runner):
+    runner.login(_response("fastpath-changed@example.com", [GROUP_A]))
+    
+    with harness.QueryCounter(engine) as counter:
+        runner.login(_response("fastpath-changed@example.com", [GROUP_B]))
+    
+    assert counter.writes > 0
+    assert _roles_of(app, sm, "fastpath-changed@example.com") == ["TestProjectB"]
@@ -0,0 +1,61 @@
+"""Concurrent first logins that all need the same, not yet created roles."""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import harness
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+THREADS = 16
+USERS = 48
+ROLES = [f"ConcurrentRole{i}" for i in range(4)]
+
+
+def test_concurrent_first_logins_create_each_role_once(app, sm, engine):
+    from airflow_auth.roles import invalidate_role_cache
+    
+    invalidate_role_cache()
+    start = threading.Barrier(THREADS)
+    
+    def login(i: int):
+        if i < THREADS:
+            start.wait()
+        with app.test_request_context():
+            try:
+                user = sm.auth_user_oauth({
+                    "username": f"concurrent{i}",
+                    "email": f"concurrent{i}@example.com",
+                    "first_name": "Concurrent",
+                    "last_name": str(i),
+                    "role_keys": ROLES,
+                })
+                return sorted(role.name for role in user.roles) if user else None
+            finally:
+                sm.get_session.remove()
+    
+    rollbacks = []
+    
+    def on_rollback(session):
+        rollbacks.append(session)
+    
+    event.listen(Session, "after_rollback", on_rollback)
+    try:
+        with harness.ErrorLog() as errors, harness.QueryCounter(engine) as counter:
+            with ThreadPoolExecutor(max_workers=THREADS) as pool:
+                results = list(pool.map(login, range(USERS)))
+    finally:
+        event.remove(Session, "after_rollback", on_rollback)
+    
+    assert results == [sorted(ROLES)] * USERS
+    # failed_assignments and rolled-back commits are logged at ERROR
+    assert errors.records == []
+    assert counter.errors == []
+    assert rollbacks == []
+    with app.app_context():
+        try:
+            names = [name for (name,) in sm.get_session.query(sm.role_model.name).filter(sm.role_model.name.in_(ROLES))]
+        finally:
+            sm.get_session.remove()
+    assert sorted(names) == sorted(ROLES)